@@ -12,5 +12,8 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+# Django advises against persistent connections under ASGI; 'pool' also
+# works here once psycopg 3 is installed (see DB_CONN_MODE)
+os.environ.setdefault('DB_CONN_MODE', 'close')
 
 application = get_asgi_application()
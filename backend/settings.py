@@ -14,11 +14,16 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 from pathlib import Path
 import os
 
+from corsheaders.defaults import default_headers
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Every os.getenv below may come from .env
+load_dotenv(dotenv_path=BASE_DIR / ".env")
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/3.2/howto/deployment/checklist/
 
@@ -40,6 +45,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     # local apps
     'base.apps.BaseConfig',
     # 3rd party apps
@@ -54,16 +60,20 @@ INSTALLED_APPS = [
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
 
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'base.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle',
+        'base.throttling.AnonThrottle',
+        'base.throttling.UserThrottle',
+        'base.throttling.RouteThrottle',
     ],
     'DEFAULT_THROTTLE_RATES': {
         'anon': '10/minute',  ## for unauthorized users
         'user': '100/minute',  # for authorized users
+        # Per route, by URL name, on top of the above (see THROTTLE_STORE)
+        'login': '5/minute',
+        'register': '10/hour',
     }
 }
 
@@ -101,6 +111,7 @@ SIMPLE_JWT = {
 }
 
 MIDDLEWARE = [
+    'base.middleware.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -150,6 +161,32 @@ DATABASES = {
     }
 }
 
+# How requests get a database connection (DB_CONN_MODE):
+# 'close' opens one per request and closes it after, 'persistent' keeps it
+# open in each worker thread for DB_CONN_MAX_AGE seconds, 'pool' shares a
+# psycopg 3 pool of DB_POOL_MIN_SIZE..DB_POOL_MAX_SIZE connections per worker
+# process (needs psycopg[pool] instead of psycopg2), waiting up to
+# DB_POOL_TIMEOUT seconds for one. Reused connections are checked first in
+# both. /metrics has the connections opened and the pool statistics.
+# Django advises against persistent connections under ASGI, so backend/asgi.py
+# makes 'close' the default there; 'pool' suits ASGI too.
+DB_CONN_MODE = os.getenv('DB_CONN_MODE', 'persistent')
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', 60))
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', 2))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', 10))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))
+
+DB_CONN_MODES = {
+    'close': {},
+    'persistent': {'CONN_MAX_AGE': DB_CONN_MAX_AGE, 'CONN_HEALTH_CHECKS': True},
+    'pool': {'CONN_HEALTH_CHECKS': True, 'OPTIONS': {'pool': {
+        'min_size': DB_POOL_MIN_SIZE, 'max_size': DB_POOL_MAX_SIZE, 'timeout': DB_POOL_TIMEOUT,
+    }}},
+}
+if DB_CONN_MODE not in DB_CONN_MODES:
+    raise ImproperlyConfigured(f"Unknown DB_CONN_MODE {DB_CONN_MODE!r}; use 'close', 'persistent' or 'pool'")
+DATABASES['default'].update(DB_CONN_MODES[DB_CONN_MODE])
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -195,12 +232,160 @@ STATICFILES_DIRS = [
 ]
 
 CORS_ALLOW_ALL_ORIGINS = True
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
+CORS_EXPOSE_HEADERS = ['Idempotent-Replayed', 'Retry-After']
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Public catalog responses are cached in the 'catalog' cache. 'file', 'db'
+# (needs `manage.py createcachetable`) and 'redis' (REDIS_URL) are shared
+# between workers, so a write in one invalidates the others; 'redis' is the
+# default when REDIS_URL is set and 'file' otherwise. locmem is per worker
+# process, so it is only right for a single worker.
+CATALOG_CACHE_BACKEND = os.getenv('CATALOG_CACHE_BACKEND', 'redis' if os.getenv('REDIS_URL') else 'file')
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', 300))
+CATALOG_CACHE_MAX_ENTRIES = int(os.getenv('CATALOG_CACHE_MAX_ENTRIES', 2000))
+
+CATALOG_CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'catalog',
+        'OPTIONS': {'MAX_ENTRIES': CATALOG_CACHE_MAX_ENTRIES},
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('CATALOG_CACHE_LOCATION', os.path.join(BASE_DIR, '.cache', 'catalog')),
+        'OPTIONS': {'MAX_ENTRIES': CATALOG_CACHE_MAX_ENTRIES},
+    },
+    'db': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'catalog_cache',
+        'OPTIONS': {'MAX_ENTRIES': CATALOG_CACHE_MAX_ENTRIES},
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('REDIS_URL', 'redis://localhost:6379/1'),
+    },
+}
+
+# Catalog ETags are derived from the catalog version stamp, which workers
+# only agree on in a shared cache. With locmem and more than one worker
+# (gunicorn's WEB_CONCURRENCY) they would answer 304 for stale pages.
+CATALOG_ETAGS = CATALOG_CACHE_BACKEND != 'locmem' or int(os.getenv('WEB_CONCURRENCY', 1)) <= 1
+
+# The test runner moves every cache to local memory
+TEST_RUNNER = 'backend.test_runner.TestRunner'
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalog': {
+        **CATALOG_CACHE_BACKENDS[CATALOG_CACHE_BACKEND],
+        'TIMEOUT': CATALOG_CACHE_TIMEOUT,
+    },
+}
+
+# Top products are ranked by a Bayesian average: every product starts with
+# LEADERBOARD_PRIOR_WEIGHT virtual ratings of LEADERBOARD_PRIOR_MEAN. Only
+# products whose plain average is at least LEADERBOARD_MIN_RATING qualify.
+LEADERBOARD_SIZE = 5
+LEADERBOARD_MIN_RATING = 4
+LEADERBOARD_PRIOR_MEAN = 3.5
+LEADERBOARD_PRIOR_WEIGHT = 5
+
+# The permission fields of users resolved from JWTs (never the password
+# hash) are cached for AUTH_USER_CACHE_TIMEOUT seconds in the 'auth' cache.
+# Saves and deletes drop the entry there, which only reaches every worker
+# in a shared backend, so AUTH_USER_CACHE_BACKEND is 'file', 'db' or 'redis'
+# ('redis' by default when REDIS_URL is set); left empty, users are loaded
+# on every request.
+AUTH_USER_CACHE_BACKEND = os.getenv('AUTH_USER_CACHE_BACKEND', 'redis' if os.getenv('REDIS_URL') else '')
+AUTH_USER_CACHE_TIMEOUT = int(os.getenv('AUTH_USER_CACHE_TIMEOUT', 60))
+
+AUTH_USER_CACHE_BACKENDS = {
+    'file': {**CATALOG_CACHE_BACKENDS['file'], 'LOCATION': os.path.join(BASE_DIR, '.cache', 'auth')},
+    'db': {**CATALOG_CACHE_BACKENDS['db'], 'LOCATION': 'auth_cache'},
+    'redis': {**CATALOG_CACHE_BACKENDS['redis'], 'KEY_PREFIX': 'auth'},
+}
+if AUTH_USER_CACHE_BACKEND and AUTH_USER_CACHE_BACKEND not in AUTH_USER_CACHE_BACKENDS:
+    raise ImproperlyConfigured(
+        f"Unknown AUTH_USER_CACHE_BACKEND {AUTH_USER_CACHE_BACKEND!r}; use 'file', 'db', 'redis' or ''"
+    )
+AUTH_USER_CACHE = 'auth' if AUTH_USER_CACHE_BACKEND else None
+if AUTH_USER_CACHE:
+    CACHES['auth'] = {**AUTH_USER_CACHE_BACKENDS[AUTH_USER_CACHE_BACKEND], 'TIMEOUT': AUTH_USER_CACHE_TIMEOUT}
+
+# Upper bounds of the price buckets counted by `?facets=true` on the product
+# listing; the last bucket is open-ended
+PRODUCT_PRICE_FACETS = (10000, 50000, 100000, 250000, 500000)
+
+# Stock taken at checkout is held for INVENTORY_HOLD_SECONDS; unpaid holds are
+# given back by `manage.py sweep_reservations` (see base/inventory.py)
+INVENTORY_HOLD_SECONDS = int(os.getenv('INVENTORY_HOLD_SECONDS', 15 * 60))
+
+# Order creation and payment sent with an Idempotency-Key header run once per
+# user and key; retries within IDEMPOTENCY_KEY_TTL seconds get the first
+# response, and duplicates arriving while it runs get 409 with Retry-After
+# (see base/idempotency.py). The sweeper deletes expired keys.
+IDEMPOTENCY_KEY_TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+IDEMPOTENCY_LOCK_SECONDS = 60
+
+# Product search: 'auto' picks Postgres full-text or SQLite FTS5 by vendor,
+# 'basic' falls back to icontains lookups
+PRODUCT_SEARCH_BACKEND = os.getenv('PRODUCT_SEARCH_BACKEND', 'auto')
+
+# Product images are also stored as WebP copies at these widths, generated
+# after upload by IMAGE_VARIANT_WORKERS background threads (0 runs inline)
+IMAGE_VARIANT_WIDTHS = (160, 320, 640)
+IMAGE_VARIANT_QUALITY = 80
+IMAGE_VARIANT_WORKERS = int(os.getenv('IMAGE_VARIANT_WORKERS', 2))
+
+# IMAGE_UPLOAD_MODE 'background' spools uploads to IMAGE_UPLOAD_SPOOL_DIR and
+# answers 202 at once; IMAGE_UPLOAD_WORKERS threads (0 runs inline) push them
+# to the default storage with IMAGE_UPLOAD_RETRIES retries. Beyond
+# IMAGE_UPLOAD_MAX_PENDING queued uploads, requests store synchronously again.
+IMAGE_UPLOAD_MODE = os.getenv('IMAGE_UPLOAD_MODE', 'sync')
+IMAGE_UPLOAD_SPOOL_DIR = os.getenv('IMAGE_UPLOAD_SPOOL_DIR', os.path.join(BASE_DIR, '.cache', 'uploads'))
+IMAGE_UPLOAD_WORKERS = int(os.getenv('IMAGE_UPLOAD_WORKERS', 4))
+IMAGE_UPLOAD_MAX_PENDING = int(os.getenv('IMAGE_UPLOAD_MAX_PENDING', 64))
+IMAGE_UPLOAD_RETRIES = 3
+IMAGE_UPLOAD_RETRY_DELAY = 1.0
+
+# /metrics serves per-view request counts, latency, query and serializer
+# histograms. Scrapers must send METRICS_TOKEN as a Bearer token; without
+# one the endpoint only answers when DEBUG is on. Each worker process writes
+# its metrics to METRICS_DIR every METRICS_FLUSH_SECONDS and a scrape adds
+# them up (see base/metrics.py); left empty, a scrape only sees one worker.
+# Requests slower than SLOW_REQUEST_SECONDS are logged.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+METRICS_DIR = os.getenv('METRICS_DIR', os.path.join(BASE_DIR, '.cache', 'metrics'))
+METRICS_FLUSH_SECONDS = 5
+SLOW_REQUEST_SECONDS = float(os.getenv('SLOW_REQUEST_SECONDS', 1.0))
+
+# What to do when a request runs more queries than base/budgets.py allows:
+# 'log' (warning on base.query_budget plus a metric), 'raise' or 'off'
+QUERY_BUDGET_ACTION = os.getenv('QUERY_BUDGET_ACTION', 'log')
+
+# Throttle buckets live in THROTTLE_STORE: 'sqlite' (the default) shares
+# them between the workers of one host through THROTTLE_SQLITE_PATH, 'redis'
+# (Redis 5+) between all nodes through THROTTLE_REDIS_URL, and 'local' keeps
+# them per worker in the default cache. The test runner uses 'local', whose
+# buckets empty with the cache.
+THROTTLE_STORE = os.getenv('THROTTLE_STORE', 'sqlite')
+THROTTLE_SQLITE_PATH = os.getenv('THROTTLE_SQLITE_PATH', os.path.join(BASE_DIR, '.cache', 'throttle.sqlite3'))
+THROTTLE_REDIS_URL = os.getenv('THROTTLE_REDIS_URL', os.getenv('REDIS_URL', 'redis://localhost:6379/2'))
+
+# Silk records SILK_SAMPLE_PERCENT of requests and keeps the newest
+# SILKY_MAX_RECORDED_REQUESTS; `manage.py prune_silk --hours N` drops older rows
+SILKY_INTERCEPT_PERCENT = float(os.getenv('SILK_SAMPLE_PERCENT', 100))
+SILKY_MAX_RECORDED_REQUESTS = int(os.getenv('SILK_MAX_RECORDED_REQUESTS', 10000))
+SILKY_MAX_RECORDED_REQUESTS_CHECK_PERCENT = 10
+SILKY_IGNORE_PATHS = ['/metrics']
+
 SPECTACULAR_SETTINGS = {
     'TITLE': 'E-Commerce API',
     'DESCRIPTION': 'E-Commerce API Documentation',
@@ -210,9 +395,6 @@ SPECTACULAR_SETTINGS = {
 }
 
 
-
-load_dotenv(dotenv_path=BASE_DIR / ".env")
-
 MINIO_ENDPOINT = os.getenv("MINIO_ENDPOINT", "http://localhost:9000")
 MINIO_ACCESS_KEY = os.getenv("MINIO_ACCESS_KEY", "minioadmin")
 MINIO_SECRET_KEY = os.getenv("MINIO_SECRET_KEY", "minioadmin123")
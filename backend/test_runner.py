@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+LOCMEM = 'django.core.cache.backends.locmem.LocMemCache'
+
+
+class TestRunner(DiscoverRunner):
+    """`DiscoverRunner` that keeps the suite off the shared stores of the
+    settings: every cache is moved to local memory, throttle buckets to the
+    default cache and metrics stay in the process, so tests neither write
+    files into the repository nor share entries with a running server.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        caches = {
+            alias: {'BACKEND': LOCMEM, 'LOCATION': alias,
+                    **({'TIMEOUT': config['TIMEOUT']} if 'TIMEOUT' in config else {})}
+            for alias, config in settings.CACHES.items()
+        }
+        self.test_settings = override_settings(CACHES=caches, THROTTLE_STORE='local', METRICS_DIR='')
+        self.test_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.test_settings.disable()
+        super().teardown_test_environment(**kwargs)
@@ -5,6 +5,8 @@ admin.site.register(Product)
 admin.site.register(Review)
 admin.site.register(OrderItem)
 admin.site.register(ShippingAddress)
+admin.site.register(StockReservation)
+admin.site.register(StockStripe)
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
@@ -0,0 +1,162 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from base.models import Order, OrderItem, Product, ShippingAddress
+
+
+# One sample request per route in base/urls/*.py. `kwargs` values name an
+# entry of the samples built by `create_samples`.
+ROUTES = [
+    {'name': 'products', 'method': 'get'},
+    {'name': 'products', 'method': 'get', 'data': {'page': '2'}},
+    {'name': 'products', 'method': 'get', 'data': {'keyword': 'phone'}},
+    {'name': 'products', 'method': 'get', 'data': {'cursor': ''}},
+    {'name': 'products', 'method': 'get',
+     'data': {'category': 'Electronics', 'inStock': 'true', 'sort': 'price', 'facets': 'true'}},
+    {'name': 'top-products', 'method': 'get'},
+    {'name': 'product', 'method': 'get', 'kwargs': {'pk': 'product'}},
+    {'name': 'create-review', 'method': 'get', 'kwargs': {'pk': 'product'}},
+    {'name': 'create-review', 'method': 'post', 'kwargs': {'pk': 'product'},
+     'data': {'rating': 5, 'comment': 'Audit'}},
+    {'name': 'create_product', 'method': 'post'},
+    {'name': 'upload_image', 'method': 'post', 'data': {'product_id': 'spare_product'}},
+    {'name': 'update_product', 'method': 'put', 'kwargs': {'pk': 'product'},
+     'data': {'name': 'Audit', 'price': 1, 'brand': 'Audit', 'countInStock': 1000,
+              'category': 'Audit', 'description': ''}},
+    {'name': 'delete_product', 'method': 'delete', 'kwargs': {'pk': 'spare_product'}},
+
+    {'name': 'register', 'method': 'post',
+     'data': {'name': 'Audit', 'email': 'audit-register@example.com', 'password': 'audit-pass'}},
+    {'name': 'login', 'method': 'post', 'data': {'username': 'audit@example.com', 'password': 'audit-pass'}},
+    {'name': 'users', 'method': 'get'},
+    {'name': 'users', 'method': 'get', 'data': {'page': '1'}},
+    {'name': 'users', 'method': 'get', 'data': {'cursor': '', 'email': 'a'}},
+    {'name': 'user_profile', 'method': 'get'},
+    {'name': 'user_profile_update', 'method': 'put',
+     'data': {'name': 'Audit', 'email': 'audit@example.com', 'password': ''}},
+    {'name': 'get_user', 'method': 'get', 'kwargs': {'pk': 'user'}},
+    {'name': 'updateUser', 'method': 'put', 'kwargs': {'pk': 'spare_user'},
+     'data': {'name': 'Spare', 'email': 'audit-spare@example.com', 'isAdmin': False}},
+    {'name': 'deleteUser', 'method': 'delete', 'kwargs': {'pk': 'spare_user'}},
+
+    {'name': 'allorders', 'method': 'get'},
+    {'name': 'allorders', 'method': 'get', 'data': {'page': '1'}},
+    {'name': 'allorders', 'method': 'get', 'data': {'cursor': '', 'isPaid': 'false', 'sort': '-createdAt'}},
+    {'name': 'myorders', 'method': 'get'},
+    {'name': 'myorders', 'method': 'get', 'data': {'page': '1'}},
+    {'name': 'orders-export', 'method': 'get', 'data': {'from': '2000-01-01'}},
+    {'name': 'user-order', 'method': 'get', 'kwargs': {'pk': 'order'}},
+    {'name': 'orders-add', 'method': 'post', 'data': 'order_data'},
+    {'name': 'orders-add', 'method': 'post', 'data': 'order_data', 'headers': {'Idempotency-Key': 'audit-add'}},
+    {'name': 'pay', 'method': 'put', 'kwargs': {'pk': 'order'}},
+    {'name': 'pay', 'method': 'put', 'kwargs': {'pk': 'order'}, 'headers': {'Idempotency-Key': 'audit-pay'}},
+    {'name': 'delivered', 'method': 'put', 'kwargs': {'pk': 'order'}},
+
+    {'name': 'async-products', 'method': 'get'},
+    {'name': 'async-products', 'method': 'get', 'data': {'cursor': ''}},
+    {'name': 'async-products', 'method': 'get', 'data': {'brand': 'Apple', 'facets': 'true'}},
+    {'name': 'async-top-products', 'method': 'get'},
+    {'name': 'async-product', 'method': 'get', 'kwargs': {'pk': 'product'}},
+    {'name': 'async-myorders', 'method': 'get'},
+    {'name': 'async-myorders', 'method': 'get', 'data': {'page': '1'}},
+]
+
+
+def route_label(route):
+    label = f"{route['method'].upper()} {route['name']}"
+    if route.get('data') and route['method'] == 'get':
+        label += ' ?' + '&'.join(f'{k}={v}' for k, v in route['data'].items())
+    if route.get('headers'):
+        label += ' [' + ', '.join(route['headers']) + ']'
+    return label
+
+
+def create_samples():
+    """Objects the sample requests act on; call inside a transaction that is
+    rolled back afterwards."""
+    user = User.objects.create_user(
+        username='audit@example.com', email='audit@example.com', password='audit-pass', is_staff=True,
+    )
+    spare_user = User.objects.create_user(username='audit-spare@example.com', password='audit-pass')
+    product = Product.objects.order_by('_id').first() or Product.objects.create(name='Audit', price=1)
+    Product.objects.filter(_id=product._id).update(countInStock=1000)
+    spare_product = Product.objects.create(user=user, name='Audit spare', price=1)
+
+    order = Order.objects.create(user=user, paymentMethod='PayPal', totalPrice=1)
+    ShippingAddress.objects.create(order=order, address='Audit', city='Audit', postalCode='0', country='Audit')
+    OrderItem.objects.create(order=order, product=product, name=product.name, qty=1, price=1)
+
+    order_data = {
+        'orderItems': [{'product': product._id, 'qty': 1, 'price': 1}],
+        'shippingAddress': {'address': 'Audit', 'city': 'Audit', 'postalCode': '0', 'country': 'Audit'},
+        'paymentMethod': 'PayPal', 'taxPrice': 0, 'shippingPrice': 0, 'totalPrice': 1,
+    }
+
+    return {
+        'user': user.id, 'spare_user': spare_user.id, 'product': product._id,
+        'spare_product': spare_product._id, 'order': order._id, 'order_data': order_data,
+        'client_user': user,
+    }
+
+
+def call_route(client, route, samples):
+    """Issue one sample request and return (response, captured queries)."""
+    kwargs = {key: samples[value] for key, value in route.get('kwargs', {}).items()}
+    data = route.get('data')
+    if isinstance(data, str):
+        data = samples[data]
+    elif data:
+        data = {key: samples.get(value, value) if isinstance(value, str) else value
+                for key, value in data.items()}
+
+    method = getattr(client, route['method'])
+    options = {} if route['method'] == 'get' else {'format': 'json'}
+    with CaptureQueriesContext(connection) as queries:
+        response = method(reverse(route['name'], kwargs=kwargs), data, headers=route.get('headers'), **options)
+        if getattr(response, 'streaming', False):
+            b''.join(response.streaming_content)
+    return response, [q['sql'] for q in queries if 'silk_' not in q['sql']]
+
+
+def audit_client(samples):
+    # Outside the test runner `testserver` is not an allowed host
+    hosts = [host for host in settings.ALLOWED_HOSTS if '*' not in host]
+    client = APIClient(HTTP_HOST=hosts[0] if hosts else 'localhost')
+    # A real token, so the counts include resolving the user as in production
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(samples['client_user'])}")
+    return client
+
+
+def explain(sql):
+    """Return the sequential scans in the plan of `sql` as (table, rows) pairs.
+
+    Rows is the planner estimate on Postgres and None on SQLite.
+    """
+    statement = sql.lstrip().split(None, 1)[0].upper()
+    if statement not in ('SELECT', 'UPDATE', 'DELETE'):
+        return []
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql)
+            plan = cursor.fetchone()[0]
+            return list(_postgresql_scans(plan[0]['Plan']))
+        if connection.vendor == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [
+                (detail.split()[1], None) for _, _, _, detail in cursor.fetchall()
+                if detail.startswith('SCAN ') and 'USING' not in detail and 'VIRTUAL TABLE' not in detail
+            ]
+    return []
+
+
+def _postgresql_scans(node):
+    if node.get('Node Type') == 'Seq Scan':
+        yield node['Relation Name'], node.get('Plan Rows')
+    for child in node.get('Plans', []):
+        yield from _postgresql_scans(child)
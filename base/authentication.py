@@ -0,0 +1,93 @@
+from functools import partial
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import router, transaction
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+# All that permission checks read; anything else is loaded on first use
+CACHED_FIELDS = ('is_active', 'is_staff', 'is_superuser')
+
+
+def user_cache():
+    """The AUTH_USER_CACHE alias, or None when user caching is off."""
+    return caches[settings.AUTH_USER_CACHE] if settings.AUTH_USER_CACHE else None
+
+
+def _user_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def forget_user(user_id):
+    """Drop the cached user now and again after the surrounding transaction
+    commits, so a request that read the old row in between cannot put it
+    back."""
+    if user_cache() is None:
+        return
+    key = _user_key(user_id)
+    user_cache().delete(key)
+    transaction.on_commit(lambda: user_cache().delete(key))
+
+
+def _cache_entry(user):
+    entry = {field: getattr(user, field) for field in CACHED_FIELDS}
+    if api_settings.CHECK_REVOKE_TOKEN:
+        entry['revoke'] = get_md5_hash_password(user.password)
+    return entry
+
+
+def _cached_user(user_id, entry):
+    """A user with only the pk and CACHED_FIELDS loaded. Reading any other
+    field loads all of them in one query."""
+    model = get_user_model()
+    loaded = {model._meta.pk.attname: model._meta.pk.to_python(user_id),
+              **{name: entry[name] for name in CACHED_FIELDS}}
+    # from_db() takes the values in the order of the model's fields
+    names = [field.attname for field in model._meta.concrete_fields if field.attname in loaded]
+    user = model.from_db(router.db_for_read(model), names, [loaded[name] for name in names])
+    user.refresh_from_db = partial(_load_deferred, user)
+    return user
+
+
+def _load_deferred(user, using=None, fields=None, from_queryset=None):
+    deferred = user.get_deferred_fields()
+    if fields is not None and set(fields) <= deferred:
+        fields = deferred
+    type(user).refresh_from_db(user, using, fields, from_queryset)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that keeps what authorization needs of the resolved
+    user in a cache for AUTH_USER_CACHE_TIMEOUT seconds instead of loading
+    the row on every request. No password hash is cached.
+
+    Entries are dropped by `forget_user` whenever a user is saved or deleted
+    (see base/signals.py).
+    """
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        cache = user_cache()
+        if user_id is None or cache is None:
+            return super().get_user(validated_token)
+
+        key = _user_key(user_id)
+        entry = cache.get(key)
+        if entry is None:
+            user = super().get_user(validated_token)
+            cache.set(key, _cache_entry(user), settings.AUTH_USER_CACHE_TIMEOUT)
+            return user
+
+        # Checks that depend on the token, not only on the cached row
+        if api_settings.CHECK_USER_IS_ACTIVE and not entry['is_active']:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(
+            api_settings.REVOKE_TOKEN_CLAIM
+        ) != entry['revoke']:
+            raise AuthenticationFailed("The user's password has been changed.", code='password_changed')
+        return _cached_user(user_id, entry)
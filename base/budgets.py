@@ -0,0 +1,58 @@
+"""Query budgets: the most database queries a request to each route may run.
+
+Keyed by URL name, counted like the request metrics (app queries only, no
+savepoints or Silk rows) and including the JWT user lookup on a cold auth
+cache. Numbered pages (`?page=`) of the user and order lists count their
+rows first. `None` exempts a route whose query count grows with its output.
+Checked per route by base/tests/test_audit.py and, at runtime, by
+MetricsMiddleware according to QUERY_BUDGET_ACTION.
+"""
+
+QUERY_BUDGETS = {
+    # base/urls/product_urls.py
+    'products': 4,
+    'create_product': 3,
+    'upload_image': 3,
+    'create-review': 4,
+    'top-products': 2,
+    'product': 4,
+    # Changing the stock of a striped product re-stripes it: four more
+    # queries in base/inventory.stripe_stock
+    'update_product': 8,
+    'delete_product': 7,
+
+    # base/urls/user_urls.py
+    'login': 2,
+    'register': 2,
+    'user_profile': 1,
+    'user_profile_update': 2,
+    'users': 3,
+    'get_user': 2,
+    'updateUser': 3,
+    'deleteUser': 10,
+
+    # base/urls/order_urls.py; orders-add and pay include the two queries
+    # of an Idempotency-Key (claiming it and storing the response), and up
+    # to three more to take over an abandoned or expired key. Unstriped
+    # products cost one UPDATE and one query for whether any sold out. A
+    # striped product costs one UPDATE per stripe tried instead, plus
+    # locking and draining the stripes when none holds the quantity alone
+    # (see base/inventory.take_striped); 14 covers four stripes.
+    'allorders': 6,
+    'orders-add': 14,
+    'myorders': 6,
+    'orders-export': None,  # two queries per chunk of 1000 orders
+    'delivered': 3,
+    'user-order': 5,
+    'pay': 7,
+
+    # base/urls/async_urls.py
+    'async-products': 4,
+    'async-top-products': 2,
+    'async-product': 4,
+    'async-myorders': 6,
+}
+
+
+class QueryBudgetExceeded(Exception):
+    pass
@@ -0,0 +1,109 @@
+import hashlib
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+
+CATALOG_VERSION_KEY = 'catalog:version'
+
+
+def catalog_cache():
+    return caches['catalog']
+
+
+def catalog_version():
+    cache = catalog_cache()
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # Seed from the clock so a lost stamp never reuses an old version
+        cache.add(CATALOG_VERSION_KEY, time.time_ns() // 1000, timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    """Invalidate every cached catalog response.
+
+    Bumps now and again after the surrounding transaction commits, so a
+    request that read the old rows in between cannot leave them cached
+    under the new version.
+    """
+    _bump()
+    transaction.on_commit(_bump)
+
+
+def _bump():
+    cache = catalog_cache()
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.add(CATALOG_VERSION_KEY, time.time_ns() // 1000, timeout=None)
+
+
+def _cache_key(view, request, kwargs):
+    params = sorted(request.query_params.lists())
+    raw = repr((view.__name__, sorted(kwargs.items()), params))
+    return 'catalog:' + hashlib.md5(raw.encode()).hexdigest()
+
+
+def cache_catalog_response(view):
+    """Serve a catalog view's 200 responses from the `catalog` cache.
+
+    Entries are keyed by view, URL kwargs and query parameters, and stored
+    under the current catalog version, so bumping the version drops them all
+    at once. Eviction (LRU/TTL) is left to the configured cache backend.
+    Async views use the cache's async API.
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            if request.method != 'GET':
+                return await view(request, *args, **kwargs)
+
+            cache = catalog_cache()
+            key = _cache_key(view, request, kwargs)
+            version = await sync_to_async(catalog_version)()
+
+            data = await cache.aget(key, version=version)
+            if data is not None:
+                return _hit(data)
+
+            response = await view(request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                await cache.aset(key, response.data, version=version)
+            response['X-Cache'] = 'MISS'
+            return response
+
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return view(request, *args, **kwargs)
+
+        cache = catalog_cache()
+        key = _cache_key(view, request, kwargs)
+        version = catalog_version()
+
+        data = cache.get(key, version=version)
+        if data is not None:
+            return _hit(data)
+
+        response = view(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, version=version)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    return wrapper
+
+
+def _hit(data):
+    response = Response(data)
+    response['X-Cache'] = 'HIT'
+    return response
@@ -0,0 +1,66 @@
+from collections import Counter
+
+from django.db import transaction
+
+from base.inventory import InsufficientStock, reserve, short_lines
+from base.models import Order, OrderItem, Product, ShippingAddress
+
+
+def place_order(user, data):
+    """Create an order with its address and items in one transaction.
+
+    Products are read with one query, items are inserted with one
+    `bulk_create` and the stock is reserved for the order (see
+    base/inventory.py). If any line is short the whole order is rolled back
+    and `InsufficientStock` lists the short lines.
+    """
+    lines = data['orderItems']
+    quantities = Counter()
+    for line in lines:
+        quantities[int(line['product'])] += int(line['qty'])
+
+    try:
+        with transaction.atomic():
+            order = _create_order(user, data, lines, quantities)
+    except InsufficientStock:
+        # Report from a fresh read once the partial work is rolled back
+        raise InsufficientStock(short_lines(quantities))
+    return order
+
+
+def _create_order(user, data, lines, quantities):
+    products = Product.objects.in_bulk(list(quantities), field_name='_id')
+    if len(products) != len(quantities):
+        raise InsufficientStock([])
+
+    order = Order.objects.create(
+        user=user,
+        paymentMethod=data['paymentMethod'],
+        taxPrice=data['taxPrice'],
+        shippingPrice=data['shippingPrice'],
+        totalPrice=data['totalPrice'],
+    )
+
+    ShippingAddress.objects.create(
+        order=order,
+        address=data['shippingAddress']['address'],
+        city=data['shippingAddress']['city'],
+        postalCode=data['shippingAddress']['postalCode'],
+        country=data['shippingAddress']['country'],
+    )
+
+    items = []
+    for line in lines:
+        product = products[int(line['product'])]
+        items.append(OrderItem(
+            product=product,
+            order=order,
+            name=product.name,
+            qty=line['qty'],
+            price=line['price'],
+            image=product.image.url,
+        ))
+    OrderItem.objects.bulk_create(items)
+
+    reserve(order, products, quantities)
+    return order
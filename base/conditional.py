@@ -0,0 +1,108 @@
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from rest_framework import status
+
+from base.cache import catalog_version
+from base.models import Order
+
+
+def make_etag(*parts):
+    return '"%s"' % hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def conditional(validators, **cache_control):
+    """Answer conditional GETs from cheap validators before the view runs.
+
+    `validators(request, *args, **kwargs)` returns `(etag, last_modified)`,
+    either of which may be None; returning `(None, None)` skips the check
+    (for example when the user may not see the object). Must sit below
+    `api_view` so authentication has already run. `cache_control` is passed
+    to `patch_cache_control` on every response. Works on async views too,
+    the validators then run in a worker thread.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                etag = last_modified = response = None
+                if request.method in ('GET', 'HEAD'):
+                    etag, last_modified = await sync_to_async(validators)(request, *args, **kwargs)
+                    response = _not_modified(request, etag, last_modified)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                return _finish(response, etag, last_modified, cache_control)
+
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            etag = last_modified = response = None
+            if request.method in ('GET', 'HEAD'):
+                etag, last_modified = validators(request, *args, **kwargs)
+                response = _not_modified(request, etag, last_modified)
+            if response is None:
+                response = view(request, *args, **kwargs)
+            return _finish(response, etag, last_modified, cache_control)
+
+        return wrapper
+
+    return decorator
+
+
+def _not_modified(request, etag, last_modified):
+    timestamp = last_modified.timestamp() if last_modified else None
+    if etag or timestamp:
+        return get_conditional_response(request, etag=etag, last_modified=timestamp)
+    return None
+
+
+def _finish(response, etag, last_modified, cache_control):
+    if response.status_code == status.HTTP_200_OK:
+        if etag and not response.has_header('ETag'):
+            response['ETag'] = etag
+        if last_modified and not response.has_header('Last-Modified'):
+            response['Last-Modified'] = http_date(last_modified.timestamp())
+
+    if cache_control:
+        patch_cache_control(response, **cache_control)
+    return response
+
+
+def catalog_validators(request, *args, **kwargs):
+    """Validators of the views behind `cache_catalog_response`: their bodies
+    are served from the cache under the catalog version, so the ETag is
+    derived from that same version rather than from the rows."""
+    if not settings.CATALOG_ETAGS:
+        return None, None
+    params = sorted(request.query_params.lists())
+    return make_etag('catalog', catalog_version(), request.path, params), None
+
+
+def order_validators(request, pk):
+    order = Order.objects.filter(_id=pk).values('user_id', 'updatedAt').first()
+    if order is None:
+        return None, None
+    if not request.user.is_staff and order['user_id'] != request.user.id:
+        return None, None
+    return make_etag('order', pk, order['updatedAt'].isoformat()), order['updatedAt']
+
+
+def my_orders_validators(request):
+    return _order_list_validators(request, Order.objects.filter(user=request.user), request.user.id)
+
+
+def all_orders_validators(request):
+    return _order_list_validators(request, Order.objects.all(), 'all')
+
+
+def _order_list_validators(request, orders, scope):
+    stats = orders.order_by().aggregate(updated=Max('updatedAt'), count=Count('_id'))
+    updated = stats['updated']
+    params = sorted(request.query_params.lists())
+    return make_etag('orders', scope, params, stats['count'], updated and updated.isoformat()), updated
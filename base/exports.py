@@ -0,0 +1,43 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from base.serializers import iter_orders
+
+
+CSV_COLUMNS = [
+    'order_id', 'createdAt', 'user_email', 'paymentMethod', 'taxPrice', 'shippingPrice',
+    'totalPrice', 'isPaid', 'paidAt', 'isDeliver', 'deliveredAt', 'country', 'city',
+    'item_id', 'product_id', 'item_name', 'qty', 'price',
+]
+
+
+def ndjson_rows(orders, chunk_size=1000):
+    for order in iter_orders(orders, chunk_size):
+        yield json.dumps(order, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def csv_rows(orders, chunk_size=1000):
+    """One CSV line per order item; orders without items get a single line."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_COLUMNS)
+
+    for order in iter_orders(orders, chunk_size):
+        address = order['shippingAddress'] or {}
+        head = [
+            order['_id'], order['createdAt'], order['User'].get('email', ''),
+            order['paymentMethod'], order['taxPrice'], order['shippingPrice'],
+            order['totalPrice'], order['isPaid'], order['paidAt'], order['isDeliver'],
+            order['deliveredAt'], address.get('country'), address.get('city'),
+        ]
+        for item in order['orderItems'] or [{}]:
+            yield writer.writerow(head + [
+                item.get('_id'), item.get('product'), item.get('name'),
+                item.get('qty'), item.get('price'),
+            ])
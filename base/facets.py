@@ -0,0 +1,65 @@
+from django.conf import settings
+from django.db.models import Case, Count, IntegerField, Value, When
+
+from base.filters import product_facet_filters
+
+
+def price_buckets():
+    """`[(min, max), ...]` from PRODUCT_PRICE_FACETS; the last is open-ended."""
+    edges = [0, *settings.PRODUCT_PRICE_FACETS]
+    return [(low, high) for low, high in zip(edges, edges[1:])] + [(edges[-1], None)]
+
+
+def _bucket():
+    # Products without a price have no bucket and are left out of the facet
+    return Case(
+        When(price__isnull=True, then=Value(None)),
+        *(When(price__lt=high, then=Value(index)) for index, (_, high) in enumerate(price_buckets()) if high),
+        default=Value(len(price_buckets()) - 1),
+        output_field=IntegerField(),
+    )
+
+
+def _flag(condition):
+    return Case(When(condition, then=Value(1)), default=Value(0), output_field=IntegerField())
+
+
+def product_facets(products, params):
+    """Category, brand and price-bucket counts for a product listing.
+
+    `products` is the listing before its category, brand and price
+    selections (see `filter_products(..., facets=False)`). One grouped query
+    counts the products per (category, brand, price bucket) together with
+    whether each group matches each selection; every facet is then summed
+    from the groups matching the *other* selections, so picking a brand
+    still shows the counts of the brands next to it.
+    """
+    filters = product_facet_filters(params)
+    flags = {f'in_{name}': _flag(condition) for name, condition in filters.items()}
+
+    groups = products.order_by().annotate(bucket=_bucket(), **flags)\
+        .values('category', 'brand', 'bucket', *flags)\
+        .annotate(count=Count('pk'))
+
+    counts = {'category': {}, 'brand': {}, 'price': {}}
+    for group in groups:
+        for facet, key in (('category', group['category']), ('brand', group['brand']),
+                           ('price', group['bucket'])):
+            if key is None:
+                continue
+            if all(group[f'in_{name}'] for name in filters if name != facet):
+                counts[facet][key] = counts[facet].get(key, 0) + group['count']
+
+    return {
+        'category': _ranked(counts['category']),
+        'brand': _ranked(counts['brand']),
+        'price': [
+            {'min': low, 'max': high, 'count': counts['price'].get(index, 0)}
+            for index, (low, high) in enumerate(price_buckets())
+        ],
+    }
+
+
+def _ranked(counts):
+    return [{'value': value, 'count': count}
+            for value, count in sorted(counts.items(), key=lambda item: (-item[1], item[0]))]
@@ -0,0 +1,158 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+
+# Each sort ends with the primary key so keyset pagination has a unique key
+ORDER_SORTS = {
+    '_id': ('_id',),
+    '-_id': ('-_id',),
+    'createdAt': ('createdAt', '_id'),
+    '-createdAt': ('-createdAt', '-_id'),
+    'totalPrice': ('totalPrice', '_id'),
+    '-totalPrice': ('-totalPrice', '-_id'),
+}
+
+PRODUCT_SORTS = {
+    '_id': ('_id',),
+    '-_id': ('-_id',),
+    'price': ('price', '_id'),
+    '-price': ('-price', '-_id'),
+    'rating': ('rating', '_id'),
+    '-rating': ('-rating', '-_id'),
+    'createdAt': ('createdAt', '_id'),
+    '-createdAt': ('-createdAt', '-_id'),
+}
+
+USER_SORTS = {
+    'id': ('id',),
+    '-id': ('-id',),
+    'username': ('username',),
+    '-username': ('-username',),
+    'date_joined': ('date_joined', 'id'),
+    '-date_joined': ('-date_joined', '-id'),
+}
+
+
+def parse_bool(value):
+    if value in ('true', '1'):
+        return True
+    if value in ('false', '0'):
+        return False
+    raise ValueError(value)
+
+
+def parse_bound(value, end=False):
+    """Parse a `from`/`to` query parameter into an aware datetime.
+
+    Accepts a date or a datetime. A bare date used as the upper bound covers
+    the whole day. Returns None for an empty value, raises ValueError when the
+    value cannot be parsed.
+    """
+    if not value:
+        return None
+
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        moment = datetime.combine(day + timedelta(days=1) if end else day, time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def sort_by(queryset, params, sorts, default):
+    key = params.get('sort') or default
+    if key not in sorts:
+        raise ValueError(key)
+    return queryset.order_by(*sorts[key])
+
+
+def filter_orders(orders, params, default_sort='_id'):
+    """Apply the isPaid, isDeliver, from/to and sort query parameters.
+
+    Raises ValueError for a value that cannot be parsed.
+    """
+    for field in ('isPaid', 'isDeliver'):
+        if params.get(field):
+            orders = orders.filter(**{field: parse_bool(params[field])})
+
+    start = parse_bound(params.get('from'))
+    end = parse_bound(params.get('to'), end=True)
+    if start:
+        orders = orders.filter(createdAt__gte=start)
+    if end:
+        orders = orders.filter(createdAt__lt=end)
+
+    return sort_by(orders, params, ORDER_SORTS, default_sort)
+
+
+def parse_decimal(value):
+    if not value:
+        return None
+    try:
+        number = Decimal(value)
+    except InvalidOperation:
+        raise ValueError(value)
+    if not number.is_finite():
+        raise ValueError(value)
+    return number
+
+
+def product_facet_filters(params):
+    """The category, brand and price range selections as Q objects, keyed
+    by facet; category and brand may be repeated to select several."""
+    filters = {}
+    for field in ('category', 'brand'):
+        values = [value for value in params.getlist(field) if value]
+        if values:
+            filters[field] = Q(**{f'{field}__in': values})
+
+    low, high = parse_decimal(params.get('minPrice')), parse_decimal(params.get('maxPrice'))
+    price = Q()
+    if low is not None:
+        price &= Q(price__gte=low)
+    if high is not None:
+        price &= Q(price__lte=high)
+    if price:
+        filters['price'] = price
+    return filters
+
+
+def filter_products(products, params, facets=True):
+    """Apply the minRating, inStock and sort query parameters, plus the
+    category, brand and minPrice/maxPrice facet selections unless `facets`
+    is False.
+
+    Raises ValueError for a value that cannot be parsed.
+    """
+    rating = parse_decimal(params.get('minRating'))
+    if rating is not None:
+        products = products.filter(rating__gte=rating)
+    if params.get('inStock') and parse_bool(params['inStock']):
+        products = products.filter(countInStock__gt=0)
+
+    if facets:
+        for condition in product_facet_filters(params).values():
+            products = products.filter(condition)
+
+    return sort_by(products, params, PRODUCT_SORTS, '-_id')
+
+
+def filter_users(users, params):
+    """Apply the staff, email (prefix) and sort query parameters.
+
+    The email prefix is matched on `username`, which the pre_save hook keeps
+    equal to the email and which has a unique (and, on Postgres, a
+    pattern_ops) index.
+    """
+    if params.get('staff'):
+        users = users.filter(is_staff=parse_bool(params['staff']))
+    if params.get('email'):
+        users = users.filter(username__startswith=params['email'])
+    return sort_by(users, params, USER_SORTS, 'id')
@@ -0,0 +1,116 @@
+"""`Idempotency-Key` support for unsafe requests that clients retry.
+
+The first request with a given key (per user) claims it by inserting an
+IdempotencyKey row, runs, and stores its response in the same transaction as
+its own writes. Retries replay that response with `Idempotent-Replayed: true`
+until IDEMPOTENCY_KEY_TTL runs out. A duplicate that arrives while the first
+request is still running gets 409 with `Retry-After` at once rather than
+holding a worker while it waits. Server errors are not
+stored, so the request can be retried. A claim left without a response for
+IDEMPOTENCY_LOCK_SECONDS (a crashed worker) is taken over by the next retry.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from base.models import IdempotencyKey
+
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+def idempotent(view):
+    """Make a DRF function view honour the Idempotency-Key header. Goes below
+    `api_view` and `permission_classes`, so `request.user` is known."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return view(request, *args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return Response({'detail': f'{HEADER} must be 1 to {MAX_KEY_LENGTH} characters'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        record, response = claim(request.user, key, view.__name__, fingerprint(request, kwargs))
+        if response is not None:
+            return response
+
+        try:
+            with transaction.atomic():
+                response = view(request, *args, **kwargs)
+                stored = response.status_code < 500 and IdempotencyKey.objects.filter(_id=record._id)\
+                    .update(statusCode=response.status_code, response=response.data)
+        except BaseException:
+            IdempotencyKey.objects.filter(_id=record._id).delete()
+            raise
+        if not stored:
+            IdempotencyKey.objects.filter(_id=record._id).delete()
+        return response
+
+    return wrapper
+
+
+def fingerprint(request, kwargs):
+    body = json.dumps(request.data, sort_keys=True, cls=DjangoJSONEncoder)
+    route = json.dumps(kwargs, sort_keys=True, default=str)
+    return hashlib.sha256(f'{request.method} {route} {body}'.encode()).hexdigest()
+
+
+def claim(user, key, view, digest):
+    """Return `(record, None)` when this request is the one to run the view
+    and `(None, response)` when `response` should be sent instead."""
+    while True:
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    user=user, key=key, view=view, fingerprint=digest, createdAt=now,
+                    expiresAt=now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+                )
+            return record, None
+        except IntegrityError:
+            pass
+
+        record = IdempotencyKey.objects.filter(user=user, key=key).first()
+        if record is None:
+            continue
+        if record.expiresAt <= now:
+            IdempotencyKey.objects.filter(_id=record._id, expiresAt__lte=now).delete()
+            continue
+        if (record.view, record.fingerprint) != (view, digest):
+            return None, Response({'detail': f'{HEADER} was already used for a different request'},
+                                  status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        if record.statusCode is not None:
+            return None, Response(record.response, status=record.statusCode,
+                                  headers={'Idempotent-Replayed': 'true'})
+
+        stale = now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS)
+        if record.createdAt <= stale:
+            if IdempotencyKey.objects.filter(_id=record._id, statusCode__isnull=True, createdAt=record.createdAt)\
+                    .update(createdAt=now):
+                return record, None
+            continue
+
+        return None, Response({'detail': f'A request with this {HEADER} is still in progress'},
+                              status=status.HTTP_409_CONFLICT, headers={'Retry-After': '1'})
+
+
+def prune_expired(now=None, batch_size=1000):
+    """Delete expired keys in batches and return how many went."""
+    now = now or timezone.now()
+    deleted = 0
+    while True:
+        ids = list(IdempotencyKey.objects.filter(expiresAt__lte=now).values_list('_id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        IdempotencyKey.objects.filter(_id__in=ids).delete()
+        deleted += len(ids)
@@ -0,0 +1,123 @@
+import logging
+import os
+import posixpath
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.functions import Now
+from PIL import Image, ImageOps
+
+from base.cache import bump_catalog_version
+from base.models import Product
+from base.workers import submit
+
+
+logger = logging.getLogger(__name__)
+
+VARIANT_DIR = 'images/variants'
+
+
+def render_variants(source, widths=None, quality=None):
+    """Yield `(width, webp_bytes)` for every width narrower than the source.
+
+    Variants keep the aspect ratio; widths at or above the original size are
+    skipped rather than upscaled.
+    """
+    widths = widths or settings.IMAGE_VARIANT_WIDTHS
+    quality = quality or settings.IMAGE_VARIANT_QUALITY
+
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+
+        for width in sorted(widths):
+            if width >= image.width:
+                continue
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.LANCZOS)
+            out = BytesIO()
+            resized.save(out, 'WEBP', quality=quality, method=4)
+            yield width, out.getvalue()
+
+
+def variant_path(product_id, image_name, width):
+    stem = os.path.splitext(posixpath.basename(image_name))[0]
+    return f'{VARIANT_DIR}/{product_id}/{stem}-{width}.webp'
+
+
+def generate_variants(product_id, image_name=None):
+    """Render and store the variants of a product's current image.
+
+    `image_name` is the image the job was scheduled for; if the product has
+    been given another image since, the job does nothing and leaves it to
+    the newer one. Variants of older images are deleted.
+    """
+    product = Product.objects.filter(_id=product_id).only('image', 'imageVariants').first()
+    if product is None or not product.image:
+        return {}
+    if image_name is not None and product.image.name != image_name:
+        return product.imageVariants
+
+    storage = product.image.storage
+    variants = {}
+    with storage.open(product.image.name, 'rb') as source:
+        for width, data in render_variants(source):
+            path = variant_path(product_id, product.image.name, width)
+            if storage.exists(path):
+                storage.delete(path)
+            variants[str(width)] = storage.save(path, ContentFile(data))
+
+    updated = Product.objects.filter(_id=product_id, image=product.image.name)\
+        .update(imageVariants=variants, updatedAt=Now())
+    if updated:
+        bump_catalog_version()
+        _delete_stale(storage, product_id, set(variants.values()))
+    return variants
+
+
+def _delete_stale(storage, product_id, keep):
+    directory = f'{VARIANT_DIR}/{product_id}'
+    try:
+        _, files = storage.listdir(directory)
+    except (FileNotFoundError, NotImplementedError):
+        return
+    for name in files:
+        path = f'{directory}/{name}'
+        if path not in keep:
+            storage.delete(path)
+
+
+def run_variants(product_id, image_name):
+    try:
+        generate_variants(product_id, image_name)
+    except Exception:
+        logger.exception('Generating image variants for product %s failed', product_id)
+
+
+def schedule_variants(product):
+    """Generate variants for `product.image` once the current transaction
+    commits, on a background thread unless IMAGE_VARIANT_WORKERS is 0."""
+    product_id, image_name = product._id, product.image.name
+
+    def start():
+        if settings.IMAGE_VARIANT_WORKERS:
+            submit('image-variants', settings.IMAGE_VARIANT_WORKERS, run_variants, product_id, image_name)
+        else:
+            run_variants(product_id, image_name)
+
+    transaction.on_commit(start)
+
+
+def variant_urls(product):
+    """`{width: url}` for the stored variants of `product`, narrowest first."""
+    variants = product.imageVariants or {}
+    return {int(width): default_storage.url(path)
+            for width, path in sorted(variants.items(), key=lambda item: int(item[0]))}
+
+
+def srcset(product):
+    return ', '.join(f'{url} {width}w' for width, url in variant_urls(product).items())
@@ -0,0 +1,265 @@
+"""Stock reservations: stock is taken when an order is placed, held for
+INVENTORY_HOLD_SECONDS and either committed when the order is paid or given
+back by the sweeper (`manage.py sweep_reservations`) once the hold expires.
+
+`countInStock` is the stock still available to new orders. Taking it is a
+conditional UPDATE that only matches rows with enough stock, so concurrent
+checkouts cannot oversell, but every checkout of a product waits on the lock
+of its row. For flash sales a product can be split with `stripe_stock` into
+`Product.stockStripes` StockStripe counters: checkouts start at a random
+stripe and update only that row, and the sweeper refreshes `countInStock` as
+their total for listings.
+
+Stock is written with `QuerySet.update()`, which sends no signals, so the
+writes bump the catalog version themselves, but only when a product runs out
+of stock or comes back in: that changes what the in-stock filter and facets
+list, while bumping on every checkout would drop the whole catalog cache and
+its ETags under checkout traffic. The trade-off is that a cached product
+shows the `countInStock` of when it was cached for up to
+CATALOG_CACHE_TIMEOUT seconds; checkouts always take from the rows
+themselves, so this never oversells. Stripe counters only reach the catalog
+through the sweeper's refreshes.
+"""
+import random
+from collections import Counter
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, OuterRef, Q, Subquery, Sum, When
+from django.db.models.functions import Now
+from django.utils import timezone
+
+from base.cache import bump_catalog_version
+from base.models import Product, StockReservation, StockStripe
+
+
+class InsufficientStock(Exception):
+    def __init__(self, lines):
+        super().__init__('Insufficient stock')
+        self.lines = lines
+
+
+def reserve(order, products, quantities):
+    """Take `quantities` ({product id: qty}) of `products` ({id: Product})
+    and hold them for `order`. Call inside the order's transaction; raises
+    InsufficientStock if any product is short."""
+    stripes = take_stock(products, quantities)
+    expires = timezone.now() + timedelta(seconds=settings.INVENTORY_HOLD_SECONDS)
+    StockReservation.objects.bulk_create([
+        StockReservation(order=order, product_id=pid, qty=qty, stripe=stripes.get(pid), expiresAt=expires)
+        for pid, qty in quantities.items()
+    ])
+
+
+def commit(order):
+    """Turn the holds of `order` into sales, when it is paid.
+
+    A hold the sweeper already released is taken again, and InsufficientStock
+    raised if the stock has gone meanwhile. Orders placed before reservations
+    existed have no holds, and deleted products are not taken again. Call
+    inside a transaction.
+    """
+    holds = list(StockReservation.objects.select_for_update()
+                 .filter(order=order, status__in=[StockReservation.HELD, StockReservation.RELEASED]))
+    held = [hold._id for hold in holds if hold.status == StockReservation.HELD]
+    committed = StockReservation.objects.filter(_id__in=held, status=StockReservation.HELD)\
+        .update(status=StockReservation.COMMITTED) if held else 0
+
+    if committed == len(held):
+        released = [hold for hold in holds if hold.status == StockReservation.RELEASED]
+    else:
+        # The sweeper released some of them in between
+        released = list(StockReservation.objects.filter(order=order, status=StockReservation.RELEASED))
+    if not released:
+        return
+
+    quantities = Counter()
+    for hold in released:
+        if hold.product_id is not None:
+            quantities[hold.product_id] += hold.qty
+    products = Product.objects.in_bulk(list(quantities), field_name='_id')
+    try:
+        with transaction.atomic():
+            stripes = take_stock(products, {pid: quantities[pid] for pid in products})
+    except InsufficientStock:
+        # Report from a fresh read once the partial work is rolled back
+        raise InsufficientStock(short_lines(quantities))
+    for hold in released:
+        hold.status = StockReservation.COMMITTED
+        hold.stripe = stripes.get(hold.product_id)
+    StockReservation.objects.bulk_update(released, ['status', 'stripe'])
+
+
+def release_expired(now=None, batch_size=500):
+    """Give back the stock of every hold that expired by `now` and return how
+    many were released. Each batch is its own transaction; holds locked by a
+    payment in progress are skipped and left to it."""
+    now = now or timezone.now()
+    released = 0
+    while True:
+        with transaction.atomic():
+            holds = list(StockReservation.objects.select_for_update(skip_locked=True)
+                         .filter(status=StockReservation.HELD, expiresAt__lte=now)
+                         .order_by('expiresAt')[:batch_size])
+            if not holds:
+                return released
+            StockReservation.objects.filter(_id__in=[hold._id for hold in holds])\
+                .update(status=StockReservation.RELEASED)
+            return_stock(holds)
+        released += len(holds)
+
+
+def take_stock(products, quantities):
+    """Take `quantities` ({product id: qty}) from stock and return
+    {product id: stripe} for the striped products among `products`.
+
+    The unstriped products are decremented in a single UPDATE that only
+    touches rows with enough `countInStock`, so a short row raises
+    InsufficientStock and the caller's transaction must roll back.
+    """
+    plain = {pid: qty for pid, qty in quantities.items() if not products[pid].stockStripes}
+    if plain:
+        # A product striped since it was read no longer matches
+        enough = reduce(or_, (Q(_id=pid, countInStock__gte=qty, stockStripes=0) for pid, qty in plain.items()))
+        updated = Product.objects.filter(enough).update(countInStock=Case(
+            *(When(_id=pid, then=F('countInStock') - qty) for pid, qty in plain.items()),
+            default=F('countInStock'),
+        ), updatedAt=Now())
+        if updated != len(plain):
+            raise InsufficientStock([])
+        # The rows stay locked until commit, so 0 means this took the last
+        if Product.objects.filter(_id__in=list(plain), countInStock=0).exists():
+            bump_catalog_version()
+
+    return {pid: take_striped(products[pid], qty) for pid, qty in quantities.items() if pid not in plain}
+
+
+def take_striped(product, qty):
+    """Take `qty` from one stripe of `product` and return its number.
+
+    Stripes are tried from a random one on, one conditional UPDATE each.
+    Only when none holds `qty` on its own are they all locked and drained in
+    order with one UPDATE, which happens when the stock is nearly gone.
+    """
+    stripes = product.stockStripes
+    start = random.randrange(stripes)
+    for offset in range(stripes):
+        stripe = (start + offset) % stripes
+        if StockStripe.objects.filter(product=product, stripe=stripe, count__gte=qty)\
+                .update(count=F('count') - qty):
+            return stripe
+
+    rows = list(StockStripe.objects.select_for_update().filter(product=product, count__gt=0).order_by('stripe'))
+    if sum(row.count for row in rows) < qty:
+        raise InsufficientStock([])
+    taken, remaining = {}, qty
+    for row in rows:
+        taken[row._id] = min(row.count, remaining)
+        remaining -= taken[row._id]
+        if not remaining:
+            break
+    StockStripe.objects.filter(_id__in=list(taken)).update(count=Case(
+        *(When(_id=sid, then=F('count') - count) for sid, count in taken.items()),
+        default=F('count'),
+    ))
+    return row.stripe
+
+
+def return_stock(holds):
+    """Add the quantities of `holds` back to stock; to the stripe they came
+    from, modulo the current number of stripes, for striped products."""
+    products = Product.objects.only('stockStripes').in_bulk(
+        {hold.product_id for hold in holds if hold.product_id is not None}, field_name='_id')
+    plain, striped = Counter(), Counter()
+    for hold in holds:
+        product = products.get(hold.product_id)
+        if product is None:
+            continue
+        if product.stockStripes:
+            striped[product._id, (hold.stripe or 0) % product.stockStripes] += hold.qty
+        else:
+            plain[product._id] += hold.qty
+
+    if plain:
+        Product.objects.filter(_id__in=list(plain)).update(countInStock=Case(
+            *(When(_id=pid, then=F('countInStock') + qty) for pid, qty in plain.items()),
+            default=F('countInStock'),
+        ), updatedAt=Now())
+        # Holding exactly what was given back, they were out of stock
+        if Product.objects.filter(reduce(or_, (Q(_id=pid, countInStock=qty) for pid, qty in plain.items()))).exists():
+            bump_catalog_version()
+    for (pid, stripe), qty in striped.items():
+        StockStripe.objects.filter(product_id=pid, stripe=stripe).update(count=F('count') + qty)
+
+
+def available_stock(products):
+    """{product id: stock available to new orders} for `products`."""
+    available = {product._id: product.countInStock or 0 for product in products}
+    striped = [product._id for product in products if product.stockStripes]
+    if striped:
+        totals = StockStripe.objects.filter(product_id__in=striped)\
+            .values('product_id').annotate(total=Sum('count'))
+        available.update({row['product_id']: row['total'] for row in totals})
+    return available
+
+
+def short_lines(quantities):
+    products = Product.objects.in_bulk(list(quantities), field_name='_id')
+    available = available_stock(products.values())
+    lines = []
+    for pid, qty in quantities.items():
+        product = products.get(pid)
+        if available.get(pid, 0) < qty:
+            lines.append({
+                'product': pid,
+                'name': product.name if product else None,
+                'requested': qty,
+                'available': available.get(pid, 0),
+            })
+    return lines
+
+
+@transaction.atomic
+def stripe_stock(product_id, stripes, total=None, delta=0):
+    """Split the stock of a product over `stripes` StockStripe rows, or merge
+    it back into `countInStock` with 0. `total` replaces the current stock,
+    `delta` is added to it (down to 0). Returns the new total."""
+    product = Product.objects.select_for_update().get(_id=product_id)
+    rows = StockStripe.objects.select_for_update().filter(product=product)
+    if total is None:
+        total = sum(row.count for row in rows) if product.stockStripes else product.countInStock or 0
+        total = max(total + delta, 0)
+    rows.delete()
+
+    StockStripe.objects.bulk_create([
+        StockStripe(product=product, stripe=stripe, count=total // stripes + (stripe < total % stripes))
+        for stripe in range(stripes)
+    ])
+    Product.objects.filter(_id=product._id).update(countInStock=total, stockStripes=stripes, updatedAt=Now())
+    if ((product.countInStock or 0) > 0) != (total > 0):
+        bump_catalog_version()
+    return total
+
+
+def refresh_striped_totals():
+    """Set `countInStock` of striped products to the sum of their stripes
+    and return how many changed. Each is written with the total it was
+    compared to, so a sale in between is picked up by the next refresh."""
+    total = StockStripe.objects.filter(product=OuterRef('pk')).values('product')\
+        .annotate(total=Sum('count')).values('total')
+    changed = list(Product.objects.filter(stockStripes__gt=0).annotate(total=Subquery(total))
+                   .exclude(countInStock=F('total')).values_list('_id', 'countInStock', 'total'))
+    if not changed:
+        return 0
+    # Skips rows re-striped since they were read
+    refreshed = Product.objects.filter(reduce(or_, (Q(_id=pid, countInStock=old) for pid, old, _ in changed)))\
+        .update(countInStock=Case(
+            *(When(_id=pid, then=new or 0) for pid, _, new in changed),
+            default=F('countInStock'),
+        ), updatedAt=Now())
+    if any(((old or 0) > 0) != ((new or 0) > 0) for _, old, new in changed):
+        bump_catalog_version()
+    return refreshed
@@ -0,0 +1,74 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from rest_framework.settings import api_settings
+
+from base.audit import ROUTES, audit_client, call_route, create_samples, explain, route_label
+
+
+class Command(BaseCommand):
+    help = ('Call every API route once against the current database, EXPLAIN the queries it '
+            'runs and flag sequential scans. Changes are rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--allow', action='append', default=[], metavar='TABLE',
+                            help='Do not flag sequential scans of this table (repeatable)')
+        parser.add_argument('--min-rows', type=int, default=0,
+                            help='Only flag scans the planner expects to read at least this many rows '
+                                 '(Postgres only)')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+        parser.add_argument('--fail', action='store_true',
+                            help='Exit with an error if any sequential scan is flagged')
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('postgresql', 'sqlite'):
+            raise CommandError(f'EXPLAIN is not supported for {connection.vendor}')
+        # The throttle buckets outlive the run, so repeated runs would hit them
+        rates = api_settings.DEFAULT_THROTTLE_RATES
+        saved = dict(rates)
+        rates.update(dict.fromkeys(rates))
+        report = []
+        try:
+            with transaction.atomic():
+                samples = create_samples()
+                client = audit_client(samples)
+                for route in ROUTES:
+                    response, queries = call_route(client, route, samples)
+                    scans = []
+                    for sql in queries:
+                        for table, rows in explain(sql):
+                            if table in options['allow']:
+                                continue
+                            if rows is not None and rows < options['min_rows']:
+                                continue
+                            scans.append({'table': table, 'rows': rows, 'sql': sql})
+                    report.append({
+                        'route': route_label(route),
+                        'status': response.status_code,
+                        'queries': len(queries),
+                        'seq_scans': scans,
+                    })
+                transaction.set_rollback(True)
+        finally:
+            rates.update(saved)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self._write_text(report)
+
+        flagged = sum(len(entry['seq_scans']) for entry in report)
+        if flagged and options['fail']:
+            raise CommandError(f'{flagged} sequential scans found')
+
+    def _write_text(self, report):
+        for entry in report:
+            line = f"{entry['route']:<60} {entry['status']}  {entry['queries']:>3} queries"
+            if not entry['seq_scans']:
+                self.stdout.write(self.style.SUCCESS(line))
+                continue
+            self.stdout.write(self.style.WARNING(line))
+            for scan in entry['seq_scans']:
+                rows = '' if scan['rows'] is None else f" (~{scan['rows']} rows)"
+                self.stdout.write(f"    seq scan on {scan['table']}{rows}: {scan['sql'][:200]}")
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from base.images import generate_variants
+from base.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Generate the resized WebP variants of product images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('product_ids', nargs='*', type=int,
+                            help='Only these products (default: all with an uploaded image)')
+        parser.add_argument('--missing', action='store_true',
+                            help='Skip products that already have variants')
+
+    def handle(self, *args, **options):
+        products = Product.objects.exclude(image='').exclude(image__isnull=True)
+        if options['product_ids']:
+            products = products.filter(_id__in=options['product_ids'])
+        if options['missing']:
+            products = products.filter(imageVariants={})
+
+        done = failed = 0
+        for product_id in products.values_list('_id', flat=True).iterator():
+            try:
+                generate_variants(product_id)
+                done += 1
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f'Product {product_id}: {e}')
+
+        self.stdout.write(self.style.SUCCESS(f'Generated variants for {done} products ({failed} failed)'))
@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from silk.models import Request
+
+
+class Command(BaseCommand):
+    help = 'Delete Silk requests (with their responses, queries and profiles) older than --hours'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=24,
+                            help='Keep requests from the last HOURS hours (default: 24)')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        old = Request.objects.filter(start_time__lt=cutoff)
+
+        deleted = 0
+        while True:
+            # Small batches keep each cascade delete (and its locks) short
+            ids = list(old.values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            Request.objects.filter(id__in=ids).delete()
+            deleted += len(ids)
+
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} Silk requests older than {cutoff:%Y-%m-%d %H:%M}'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from base.cache import bump_catalog_version
+from base.models import Product
+from base.reviews import rebuild_review_aggregates
+
+
+class Command(BaseCommand):
+    help = 'Recompute Product.rating, numReviews and ratingSum from the review table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('product_ids', nargs='*', type=int,
+                            help='Only rebuild these products (default: all)')
+
+    def handle(self, *args, **options):
+        products = Product.objects.all()
+        if options['product_ids']:
+            products = products.filter(_id__in=options['product_ids'])
+
+        updated = rebuild_review_aggregates(products)
+        bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt review aggregates for {updated} products'))
@@ -0,0 +1,58 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from base.cache import bump_catalog_version
+from base.seeding import PASSWORD, Seeder
+
+
+class Command(BaseCommand):
+    help = 'Insert synthetic users, products, reviews and orders (see base/seeding.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--products', type=int, default=10000)
+        parser.add_argument('--reviews', type=int, default=5, help='Average reviews per product (default: 5)')
+        parser.add_argument('--orders', type=int, default=20000)
+        parser.add_argument('--items', type=int, default=4, help='Most lines per order (default: 4)')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--until', help='Timestamps end at this date, YYYY-MM-DD (default: today)')
+        parser.add_argument('--days', type=int, default=365, help='Timestamps span this many days (default: 365)')
+        parser.add_argument('--password', default=PASSWORD, help=f'Password of every user (default: {PASSWORD})')
+        parser.add_argument('--no-copy', action='store_true', help='Use bulk_create on Postgres too')
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        until = None
+        if options['until']:
+            try:
+                until = timezone.make_aware(datetime.strptime(options['until'], '%Y-%m-%d'))
+            except ValueError:
+                raise CommandError('--until must be a date like 2025-01-31')
+
+        if (options['orders'] or options['reviews']) and not (options['users'] and options['products']):
+            raise CommandError('Reviews and orders need --users and --products')
+
+        seeder = Seeder(
+            seed=options['seed'], batch_size=options['batch_size'], using=options['database'],
+            copy=False if options['no_copy'] else None, until=until, days=options['days'],
+            password=options['password'],
+        )
+        start = time.perf_counter()
+        counts = seeder.seed(
+            users=options['users'], products=options['products'], reviews=options['reviews'],
+            orders=options['orders'], items=options['items'],
+        )
+        elapsed = time.perf_counter() - start
+        bump_catalog_version()
+
+        rows = sum(counts.values())
+        method = 'COPY' if seeder.copy else 'bulk_create'
+        for model, count in counts.items():
+            self.stdout.write(f'{model}: {count}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Inserted {rows} rows in {elapsed:.1f}s with {method} ({rows / max(elapsed, 1e-9):.0f} rows/s)'
+        ))
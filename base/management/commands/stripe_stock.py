@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from base.inventory import stripe_stock
+from base.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Split the stock of a product over several counters, for flash sales (0 merges it back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('product_id', type=int)
+        parser.add_argument('stripes', type=int,
+                            help='Number of counters; about the number of concurrent checkouts expected')
+
+    def handle(self, *args, **options):
+        if options['stripes'] < 0:
+            raise CommandError('stripes must be 0 or more')
+        try:
+            stripe_stock(options['product_id'], options['stripes'])
+        except Product.DoesNotExist:
+            raise CommandError(f"Product {options['product_id']} does not exist")
+
+        product = Product.objects.get(_id=options['product_id'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Product {product._id} has {product.countInStock} in stock over {product.stockStripes} stripes'
+        ))
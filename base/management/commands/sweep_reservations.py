@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from base.idempotency import prune_expired
+from base.inventory import refresh_striped_totals, release_expired
+
+
+class Command(BaseCommand):
+    help = ('Give back the stock of expired reservations, refresh the stock of striped products '
+            'and delete expired idempotency keys')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Sweep every INTERVAL seconds until stopped (default: sweep once)')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        while True:
+            released = release_expired(batch_size=options['batch_size'])
+            refreshed = refresh_striped_totals()
+            pruned = prune_expired(batch_size=options['batch_size'])
+            if released or pruned or not options['interval']:
+                self.stdout.write(f'Released {released} expired reservations, '
+                                  f'refreshed {refreshed} striped products, '
+                                  f'deleted {pruned} expired idempotency keys')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
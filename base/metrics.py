@@ -0,0 +1,324 @@
+"""Request metrics in the Prometheus text format.
+
+Counters and histograms are recorded in the memory of each worker process.
+With METRICS_DIR set, every process also writes them to a file of its own
+there, at most every METRICS_FLUSH_SECONDS, and a scrape adds up the files
+of all processes, so whichever worker answers it reports the same totals.
+Files of exited processes are kept, so counters and histograms never go
+backwards, but their gauges are left out, as the pid in the file name no
+longer runs; clear the directory when the whole service restarts. Without
+METRICS_DIR a
+scrape only sees the process that answered it, which is right for a single
+worker only.
+"""
+import contextvars
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from django.conf import settings
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def _label_text(self, key, extra=()):
+        pairs = list(zip(self.labels, key)) + list(extra)
+        if not pairs:
+            return ''
+        return '{%s}' % ','.join('%s="%s"' % (name, _escape(value)) for name, value in pairs)
+
+    def collect(self, values=None):
+        """Sample lines of this process's values, or of `values` merged from
+        several processes."""
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        if values is None:
+            values = self.snapshot()
+        for key, value in sorted(values.items()):
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def merge(self, values, other):
+        """Add the values of another process to `values`."""
+        for key, value in other.items():
+            values[key] = values[key] + value if key in values else value
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self, key, value):
+        return [f'{self.name}{self._label_text(key)} {_number(value)}']
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _samples(self, key, value):
+        return [f'{self.name}{self._label_text(key)} {_number(value)}']
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0)
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def snapshot(self):
+        with self._lock:
+            return {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+
+    def merge(self, values, other):
+        for key, (counts, total) in other.items():
+            if key in values:
+                mine, my_total = values[key]
+                counts, total = [a + b for a, b in zip(mine, counts)], my_total + total
+            values[key] = (list(counts), total)
+
+    def totals(self, **labels):
+        """`(observations, sum)` for one set of labels."""
+        with self._lock:
+            counts, total = self._values.get(self._key(labels)) or ((), 0)
+        return sum(counts), total
+
+    def _samples(self, key, value):
+        counts, total = value
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else _number(bound)
+            lines.append(f'{self.name}_bucket{self._label_text(key, [("le", le)])} {cumulative}')
+        lines.append(f'{self.name}_sum{self._label_text(key)} {_number(total)}')
+        lines.append(f'{self.name}_count{self._label_text(key)} {cumulative}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+REQUESTS = Counter('http_requests_total', 'Requests by view, method and status.',
+                   ('view', 'method', 'status'))
+LATENCY = Histogram('http_request_duration_seconds', 'Request latency by view.', ('view',))
+DB_QUERIES = Histogram('http_request_db_queries', 'Database queries per request by view.',
+                       ('view',), QUERY_BUCKETS)
+DB_TIME = Histogram('http_request_db_seconds', 'Time spent in database queries per request by view.',
+                    ('view',))
+SERIALIZER_TIME = Histogram('http_request_serializer_seconds',
+                            'Time spent serializing per request by view.', ('view',))
+BUDGET_EXCEEDED = Counter('http_query_budget_exceeded_total',
+                          'Requests that ran more queries than their budget, by view.', ('view',))
+DB_CONNECTIONS = Counter('db_connections_opened_total',
+                         'Database connections opened (or taken from the pool) by alias.', ('alias',))
+DB_POOL = Gauge('db_pool', 'psycopg pool statistics by alias, see ConnectionPool.get_stats().',
+                ('alias', 'stat'))
+
+REGISTRY = [REQUESTS, LATENCY, DB_QUERIES, DB_TIME, SERIALIZER_TIME, BUDGET_EXCEEDED, DB_CONNECTIONS, DB_POOL]
+
+
+def render():
+    collect_pool_stats()
+    merged = _merge_processes() if settings.METRICS_DIR else None
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.collect(merged[metric.name] if merged else None))
+    return '\n'.join(lines) + '\n'
+
+
+_flush_lock = threading.Lock()
+_process = {'pid': None, 'path': None, 'flushed': 0.0}
+
+
+def flush(force=False):
+    """Write this process's metrics to its file in METRICS_DIR, unless that
+    was done less than METRICS_FLUSH_SECONDS ago."""
+    directory = settings.METRICS_DIR
+    if not directory:
+        return
+    with _flush_lock:
+        now = time.monotonic()
+        if not force and os.getpid() == _process['pid'] \
+                and now - _process['flushed'] < settings.METRICS_FLUSH_SECONDS:
+            return
+        if os.getpid() != _process['pid'] or not _process['path'].startswith(directory + os.sep):
+            # A new file per process: a reused pid must not overwrite larger totals
+            _process.update(pid=os.getpid(), path=os.path.join(directory, f'{os.getpid()}-{uuid.uuid4().hex}.json'))
+        _process['flushed'] = now
+
+        data = {metric.name: [[list(key), value] for key, value in metric.snapshot().items()]
+                for metric in REGISTRY}
+        os.makedirs(directory, exist_ok=True)
+        fd, temp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(temp, _process['path'])
+
+
+def _merge_processes():
+    flush(force=True)
+    merged = {metric.name: {} for metric in REGISTRY}
+    for path in glob.glob(os.path.join(settings.METRICS_DIR, '*.json')):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        running = _is_running(os.path.basename(path).split('-')[0])
+        for metric in REGISTRY:
+            if metric.kind == 'gauge' and not running:
+                continue
+            values = {tuple(key): tuple(value) if isinstance(value, list) else value
+                      for key, value in data.get(metric.name, [])}
+            metric.merge(merged[metric.name], values)
+    return merged
+
+
+def _is_running(pid):
+    # Signal 0 only checks that the process exists; elsewhere than POSIX
+    # os.kill() would deliver something, so every process counts as running
+    if os.name != 'posix' or not pid.isdigit():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class RequestStats:
+    __slots__ = ('queries', 'db_seconds', 'serializer_seconds', 'serializing')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serializer_seconds = 0.0
+        self.serializing = False
+
+
+# Set by the middleware for the duration of a request; sync_to_async threads
+# inherit it, so queries from async views are counted too.
+current_stats = contextvars.ContextVar('request_stats', default=None)
+
+
+# Transaction control, Silk's own rows and the EXPLAINs it runs are not app queries
+_NOT_APP_PREFIXES = ('EXPLAIN', 'BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE SAVEPOINT')
+
+
+def is_app_query(sql):
+    return not sql.startswith(_NOT_APP_PREFIXES) and '"silk_' not in sql
+
+
+def record_query(execute, sql, params, many, context):
+    """Connection execute wrapper adding each app query to the current request."""
+    stats = current_stats.get()
+    if stats is None or not is_app_query(sql):
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_seconds += time.perf_counter() - start
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    # First in the list: `connection.execute_wrapper()` blocks pop the last one
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+def count_connection(sender, connection, **kwargs):
+    DB_CONNECTIONS.inc(alias=connection.alias)
+
+
+def collect_pool_stats():
+    """Copy the statistics of this process's connection pools into DB_POOL."""
+    from django.db import connections
+
+    for alias in connections:
+        settings = connections.settings[alias]
+        if not settings.get('OPTIONS', {}).get('pool'):
+            continue
+        pool = connections[alias].pool
+        for stat, value in pool.get_stats().items():
+            DB_POOL.set(value, alias=alias, stat=stat)
+
+
+@contextmanager
+def serializing():
+    """Add the enclosed time to the current request's serializer time.
+
+    Nested blocks (a serializer calling another) are counted once.
+    """
+    stats = current_stats.get()
+    if stats is None or stats.serializing:
+        yield
+        return
+    stats.serializing = True
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.serializer_seconds += time.perf_counter() - start
+        stats.serializing = False
+
+
+class MeasuredSerializerMixin:
+    """Counts `to_representation` towards the request's serializer time."""
+
+    def to_representation(self, instance):
+        with serializing():
+            return super().to_representation(instance)
@@ -0,0 +1,81 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from base import metrics
+from base.budgets import QUERY_BUDGETS, QueryBudgetExceeded
+
+
+logger = logging.getLogger('base.slow_requests')
+budget_logger = logging.getLogger('base.query_budget')
+
+
+class MetricsMiddleware:
+    """Record count, latency, database queries and serializer time of every
+    request in base.metrics, log requests slower than SLOW_REQUEST_SECONDS
+    and check base.budgets.QUERY_BUDGETS. Should be the outermost middleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self._acall(request)
+
+        stats = metrics.RequestStats()
+        token = metrics.current_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.current_stats.reset(token)
+        self._record(request, response, stats, time.perf_counter() - start)
+        return response
+
+    async def _acall(self, request):
+        stats = metrics.RequestStats()
+        token = metrics.current_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.current_stats.reset(token)
+        self._record(request, response, stats, time.perf_counter() - start)
+        return response
+
+    def _record(self, request, response, stats, elapsed):
+        match = request.resolver_match
+        view = match.view_name if match else '<unmatched>'
+
+        metrics.REQUESTS.inc(view=view, method=request.method, status=response.status_code)
+        metrics.LATENCY.observe(elapsed, view=view)
+        metrics.DB_QUERIES.observe(stats.queries, view=view)
+        metrics.DB_TIME.observe(stats.db_seconds, view=view)
+        metrics.SERIALIZER_TIME.observe(stats.serializer_seconds, view=view)
+
+        metrics.flush()
+        self._check_budget(request, view, stats)
+
+        if elapsed >= settings.SLOW_REQUEST_SECONDS:
+            logger.warning('Slow request %s %s (%s): %.3fs, %d queries in %.3fs, serializing %.3fs',
+                           request.method, request.path, view, elapsed,
+                           stats.queries, stats.db_seconds, stats.serializer_seconds)
+
+    def _check_budget(self, request, view, stats):
+        action = settings.QUERY_BUDGET_ACTION
+        budget = QUERY_BUDGETS.get(view)
+        if action == 'off' or budget is None or stats.queries <= budget:
+            return
+
+        metrics.BUDGET_EXCEEDED.inc(view=view)
+        message = f'{request.method} {request.path} ({view}) ran {stats.queries} queries, budget is {budget}'
+        if action == 'raise':
+            raise QueryBudgetExceeded(message)
+        budget_logger.warning(message)
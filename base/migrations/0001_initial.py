@@ -0,0 +1,86 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Order',
+            fields=[
+                ('paymentMethod', models.CharField(blank=True, max_length=200, null=True)),
+                ('taxPrice', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('shippingPrice', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('totalPrice', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('isPaid', models.BooleanField(default=False)),
+                ('paidAt', models.DateTimeField(blank=True, null=True)),
+                ('isDeliver', models.BooleanField(default=False)),
+                ('deliveredAt', models.DateTimeField(blank=True, null=True)),
+                ('createdAt', models.DateTimeField(auto_now_add=True, null=True)),
+                ('_id', models.AutoField(editable=False, primary_key=True, serialize=False)),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Product',
+            fields=[
+                ('name', models.CharField(blank=True, max_length=200, null=True)),
+                ('image', models.ImageField(blank=True, default='/images/placeholder.png', null=True, upload_to='images/')),
+                ('brand', models.CharField(blank=True, max_length=200, null=True)),
+                ('category', models.CharField(blank=True, max_length=200, null=True)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('rating', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('numReviews', models.IntegerField(blank=True, default=0, null=True)),
+                ('price', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('countInStock', models.IntegerField(blank=True, default=0, null=True)),
+                ('createdAt', models.DateTimeField(auto_now_add=True)),
+                ('_id', models.AutoField(editable=False, primary_key=True, serialize=False)),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='OrderItem',
+            fields=[
+                ('name', models.CharField(blank=True, max_length=200, null=True)),
+                ('qty', models.IntegerField(blank=True, default=0, null=True)),
+                ('price', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('image', models.CharField(blank=True, max_length=200, null=True)),
+                ('_id', models.AutoField(editable=False, primary_key=True, serialize=False)),
+                ('order', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='base.order')),
+                ('product', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='base.product')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Review',
+            fields=[
+                ('name', models.CharField(blank=True, max_length=200, null=True)),
+                ('rating', models.IntegerField(blank=True, default=0, null=True)),
+                ('comment', models.TextField(blank=True, null=True)),
+                ('createdAt', models.DateTimeField(auto_now_add=True)),
+                ('_id', models.AutoField(editable=False, primary_key=True, serialize=False)),
+                ('product', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='base.product')),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ShippingAddress',
+            fields=[
+                ('address', models.CharField(blank=True, max_length=200, null=True)),
+                ('city', models.CharField(blank=True, max_length=200, null=True)),
+                ('postalCode', models.CharField(blank=True, max_length=200, null=True)),
+                ('country', models.CharField(blank=True, max_length=200, null=True)),
+                ('shippingPrice', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('_id', models.AutoField(editable=False, primary_key=True, serialize=False)),
+                ('order', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='base.order')),
+            ],
+        ),
+    ]
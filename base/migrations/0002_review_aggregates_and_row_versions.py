@@ -0,0 +1,98 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:21
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, FloatField, Min, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce
+
+
+def drop_duplicate_reviews(apps, schema_editor):
+    # Only concurrent submissions slipped past the old exists() check; keep
+    # each user's first review so the unique constraint can be added
+    Review = apps.get_model('base', 'Review')
+    duplicates = Review.objects.filter(product__isnull=False, user__isnull=False)\
+        .values('product', 'user').annotate(first=Min('_id'), count=Count('_id')).filter(count__gt=1)
+    for row in duplicates:
+        Review.objects.filter(product=row['product'], user=row['user']).exclude(_id=row['first']).delete()
+
+
+def backfill_review_aggregates(apps, schema_editor):
+    Product = apps.get_model('base', 'Product')
+    Review = apps.get_model('base', 'Review')
+
+    reviews = Review.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    Product.objects.update(
+        ratingSum=Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), Value(0)),
+        numReviews=Coalesce(Subquery(reviews.annotate(count=Count('pk')).values('count')), Value(0)),
+    )
+
+    mean = settings.LEADERBOARD_PRIOR_MEAN
+    weight = settings.LEADERBOARD_PRIOR_WEIGHT
+    Product.objects.filter(numReviews__gt=0).update(
+        score=(Cast(F('ratingSum'), FloatField()) + Value(mean * weight)) / (F('numReviews') + Value(float(weight))),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='updatedAt',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='ratingSum',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='score',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='updatedAt',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(drop_duplicate_reviews, migrations.RunPython.noop),
+        migrations.RunPython(backfill_review_aggregates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['createdAt', '_id'], name='order_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['totalPrice', '_id'], name='order_total_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '_id'], name='order_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('isPaid', False)), fields=['_id'], name='order_unpaid_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('isDeliver', False)), fields=['_id'], name='order_undelivered_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-score'], name='product_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', '-score'], name='product_category_score_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='review',
+            constraint=models.UniqueConstraint(fields=('product', 'user'), name='unique_review_per_user'),
+        ),
+    ]
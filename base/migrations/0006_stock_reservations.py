@@ -0,0 +1,46 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0005_product_category_price_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='stockStripes',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('qty', models.IntegerField()),
+                ('stripe', models.IntegerField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('held', 'Held'), ('committed', 'Committed'), ('released', 'Released')], default='held', max_length=10)),
+                ('expiresAt', models.DateTimeField()),
+                ('_id', models.AutoField(editable=False, primary_key=True, serialize=False)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='base.order')),
+                ('product', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='base.product')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('status', 'held')), fields=['expiresAt'], name='reservation_held_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockStripe',
+            fields=[
+                ('stripe', models.IntegerField()),
+                ('count', models.IntegerField(default=0)),
+                ('_id', models.AutoField(editable=False, primary_key=True, serialize=False)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='base.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('product', 'stripe'), name='unique_stock_stripe')],
+            },
+        ),
+    ]
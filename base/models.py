@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db.models.fields import BLANK_CHOICE_DASH
 # Create your models here.
 
@@ -7,16 +8,38 @@ class Product(models.Model):
     user = models.ForeignKey(User,on_delete=models.SET_NULL,null=True)
     name = models.CharField(max_length=200,null=True,blank=True)
     image = models.ImageField(null=True,blank = True,default = "/images/placeholder.png",upload_to="images/")
+    # Resized WebP copies of image, {"<width>": "<storage path>"}; see base/images.py
+    imageVariants = models.JSONField(default=dict,blank=True)
     brand = models.CharField(max_length=200,null=True,blank=True)
     category = models.CharField(max_length=200,null=True,blank=True)
     description = models.TextField(null=True,blank=True)
     rating = models.DecimalField(max_digits=12,decimal_places=2,null=True,blank=True)
     numReviews = models.IntegerField(null=True,blank=True,default=0)
+    ratingSum = models.IntegerField(default=0)
+    score = models.FloatField(default=0)
     price = models.DecimalField(max_digits=12,decimal_places=2,null=True,blank=True)
     countInStock = models.IntegerField(null=True,blank=True,default=0)
+    # Above 0 the stock is split over this many StockStripe rows and
+    # countInStock is a total refreshed by the reservation sweeper
+    stockStripes = models.IntegerField(default=0)
     createdAt = models.DateTimeField(auto_now_add=True)
+    updatedAt = models.DateTimeField(auto_now=True)
     _id = models.AutoField(primary_key=True,editable=False)
 
+    class Meta:
+        indexes = [
+            # Leaderboards: overall and per category
+            models.Index(fields=['-score'],name='product_score_idx'),
+            models.Index(fields=['category','-score'],name='product_category_score_idx'),
+            # Category listings sorted by price, and the facet counts per category
+            models.Index(fields=['category','price','_id'],name='product_category_price_idx'),
+            # Storefront filters and sorts; name is served by the search index
+            models.Index(fields=['brand'],name='product_brand_idx'),
+            models.Index(fields=['price','_id'],name='product_price_idx'),
+            models.Index(fields=['rating'],name='product_rating_idx'),
+            models.Index(fields=['createdAt'],name='product_created_idx'),
+        ]
+
     def __str__(self):
         return self.name +" | "+self.brand +" | " + str(self.price)
 
@@ -30,6 +53,15 @@ class Review(models.Model):
     createdAt = models.DateTimeField(auto_now_add=True)
     _id =  models.AutoField(primary_key=True,editable=False)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product','user'],name='unique_review_per_user'),
+        ]
+        indexes = [
+            # Paginated reviews of a product, newest first
+            models.Index(fields=['product','-_id'],name='review_product_idx'),
+        ]
+
     def __str__(self):
         return str(self.rating)
 
@@ -45,8 +77,20 @@ class Order(models.Model):
     isDeliver = models.BooleanField(default=False)
     deliveredAt = models.DateTimeField(auto_now_add=False,null=True, blank=True)
     createdAt = models.DateTimeField(auto_now_add=True,null=True, blank=True)
+    updatedAt = models.DateTimeField(auto_now=True)
     _id =  models.AutoField(primary_key=True,editable=False)
 
+    class Meta:
+        indexes = [
+            # Admin and my-orders list sorts, see base/filters.py
+            models.Index(fields=['createdAt','_id'],name='order_created_idx'),
+            models.Index(fields=['totalPrice','_id'],name='order_total_idx'),
+            models.Index(fields=['user','_id'],name='order_user_idx'),
+            # The admin works through the open orders, a small slice of the table
+            models.Index(fields=['_id'],condition=models.Q(isPaid=False),name='order_unpaid_idx'),
+            models.Index(fields=['_id'],condition=models.Q(isDeliver=False),name='order_undelivered_idx'),
+        ]
+
     def __str__(self):
         return str(self.createdAt)
 
@@ -76,3 +120,75 @@ class ShippingAddress(models.Model):
 
     def __str__(self):
         return str(self.address)
+
+
+class StockStripe(models.Model):
+    # A slice of a hot product's stock, so checkouts update different rows;
+    # see base/inventory.py
+    product = models.ForeignKey(Product,on_delete=models.CASCADE)
+    stripe = models.IntegerField()
+    count = models.IntegerField(default=0)
+    _id = models.AutoField(primary_key=True,editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product','stripe'],name='unique_stock_stripe'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id}/{self.stripe}: {self.count}'
+
+
+class StockReservation(models.Model):
+    # Stock taken for one product of an order: held until the order is paid
+    # (committed) or expiresAt passes and the sweeper gives it back (released)
+    HELD = 'held'
+    COMMITTED = 'committed'
+    RELEASED = 'released'
+    STATUS_CHOICES = [(HELD,'Held'),(COMMITTED,'Committed'),(RELEASED,'Released')]
+
+    order = models.ForeignKey(Order,on_delete=models.CASCADE)
+    product = models.ForeignKey(Product,on_delete=models.SET_NULL,null=True)
+    qty = models.IntegerField()
+    # StockStripe the quantity came from, for striped products
+    stripe = models.IntegerField(null=True,blank=True)
+    status = models.CharField(max_length=10,choices=STATUS_CHOICES,default=HELD)
+    expiresAt = models.DateTimeField()
+    _id = models.AutoField(primary_key=True,editable=False)
+
+    class Meta:
+        indexes = [
+            # The sweeper only looks at live holds
+            models.Index(fields=['expiresAt'],condition=models.Q(status='held'),name='reservation_held_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.order_id}: {self.qty} x {self.product_id} ({self.status})'
+
+
+class IdempotencyKey(models.Model):
+    # The first response to a request sent with an Idempotency-Key header,
+    # replayed to its retries until expiresAt; see base/idempotency.py
+    user = models.ForeignKey(User,on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    view = models.CharField(max_length=100)
+    # sha256 of the route and body, so a key cannot be reused for another request
+    fingerprint = models.CharField(max_length=64)
+    # Null while the first request is still running
+    statusCode = models.IntegerField(null=True,blank=True)
+    response = models.JSONField(null=True,blank=True,encoder=DjangoJSONEncoder)
+    createdAt = models.DateTimeField()
+    expiresAt = models.DateTimeField()
+    _id = models.AutoField(primary_key=True,editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user','key'],name='unique_idempotency_key'),
+        ]
+        indexes = [
+            models.Index(fields=['expiresAt'],name='idempotency_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id}: {self.key}'
+
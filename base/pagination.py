@@ -0,0 +1,216 @@
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import F, Q
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def encode_cursor(values, reverse=False):
+    payload = json.dumps({'v': [_dump(v) for v in values], 'r': reverse}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return list(payload['v']), bool(payload['r'])
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor(cursor)
+
+
+def _dump(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+class CursorPage:
+    def __init__(self, items, next_cursor, prev_cursor):
+        self.items = items
+        self.next = next_cursor
+        self.prev = prev_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class KeysetPaginator:
+    """Seek pagination over the ordering of `queryset`.
+
+    Each page is fetched with a `WHERE (sort keys) beyond the cursor` filter
+    and `LIMIT page_size + 1`, so the cost of a page does not depend on how
+    deep it is. The ordering must end with a unique column (the primary key).
+    NULLs in nullable model columns sort last.
+    """
+
+    def __init__(self, queryset, page_size, ordering=None):
+        ordering = list(ordering or queryset.query.order_by)
+        if not ordering:
+            raise ValueError('KeysetPaginator needs an ordered queryset')
+
+        self.queryset = queryset
+        self.page_size = page_size
+        self.keys = [
+            (name.lstrip('-'), name.startswith('-'), self._nullable(queryset.model, name.lstrip('-')))
+            for name in ordering
+        ]
+        self.fields = [self._field(queryset, name) for name, _, _ in self.keys]
+
+    @staticmethod
+    def _nullable(model, name):
+        try:
+            return model._meta.get_field(name).null
+        except FieldDoesNotExist:
+            return False
+
+    @staticmethod
+    def _field(queryset, name):
+        """The model field or annotation output field behind `name`."""
+        if name == 'pk':
+            return queryset.model._meta.pk
+        try:
+            return queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            annotation = queryset.query.annotations.get(name)
+            return annotation.output_field if annotation is not None else None
+
+    def _coerce(self, values, cursor):
+        """Cursor values as the Python types of their columns, so that a
+        well-formed cursor holding the wrong types is InvalidCursor too."""
+        try:
+            return [
+                value if value is None or field is None else field.to_python(value)
+                for field, value in zip(self.fields, values)
+            ]
+        except (ValidationError, ValueError, TypeError):
+            raise InvalidCursor(cursor)
+
+    def page(self, cursor=None):
+        queryset, reverse = self._query(cursor)
+        return self._page(list(queryset), cursor, reverse)
+
+    async def apage(self, cursor=None):
+        queryset, reverse = self._query(cursor)
+        return self._page([obj async for obj in queryset], cursor, reverse)
+
+    def _query(self, cursor):
+        reverse = False
+        queryset = self.queryset
+
+        if cursor:
+            values, reverse = decode_cursor(cursor)
+            if len(values) != len(self.keys):
+                raise InvalidCursor(cursor)
+            queryset = queryset.filter(self._seek(self._coerce(values, cursor), reverse))
+
+        return queryset.order_by(*self._ordering(reverse))[:self.page_size + 1], reverse
+
+    def _page(self, items, cursor, reverse):
+        has_more = len(items) > self.page_size
+        items = items[:self.page_size]
+
+        if reverse:
+            items.reverse()
+            has_next, has_prev = True, has_more
+        else:
+            has_next, has_prev = has_more, bool(cursor)
+
+        next_cursor = prev_cursor = None
+        if items and has_next:
+            next_cursor = encode_cursor(self._values(items[-1]))
+        if items and has_prev:
+            prev_cursor = encode_cursor(self._values(items[0]), reverse=True)
+
+        return CursorPage(items, next_cursor, prev_cursor)
+
+    def _ordering(self, reverse):
+        ordering = []
+        for name, desc, nullable in self.keys:
+            desc = desc != reverse
+            if nullable:
+                # NULLs last walking forward, so first when walking back
+                nulls = {'nulls_first': True} if reverse else {'nulls_last': True}
+                ordering.append(F(name).desc(**nulls) if desc else F(name).asc(**nulls))
+            else:
+                ordering.append(('-' if desc else '') + name)
+        return ordering
+
+    def _values(self, obj):
+        return [getattr(obj, name) for name, _, _ in self.keys]
+
+    def _seek(self, values, reverse):
+        condition = Q()
+        for i, (name, desc, nullable) in enumerate(self.keys):
+            step = self._beyond(name, desc != reverse, nullable, values[i], reverse)
+            for j, (prev_name, _, _) in enumerate(self.keys[:i]):
+                if values[j] is None:
+                    step &= Q(**{f'{prev_name}__isnull': True})
+                else:
+                    step &= Q(**{prev_name: values[j]})
+            condition |= step
+        return condition
+
+    @staticmethod
+    def _beyond(name, desc, nullable, value, reverse):
+        if value is None:
+            # Nothing sorts after NULL going forward, every value does going back
+            return Q(**{f'{name}__isnull': False}) if reverse else Q(pk__in=[])
+        beyond = Q(**{f'{name}__{"lt" if desc else "gt"}': value})
+        if nullable and not reverse:
+            beyond |= Q(**{f'{name}__isnull': True})
+        return beyond
+
+
+def paginate(request, queryset, page_size=50, max_page_size=200):
+    """Page `queryset` the way the request asks for.
+
+    `?cursor=` (empty for the first page) selects keyset pagination and
+    `?page=` numbered pages; `?limit=` overrides the page size. Returns
+    `(items, meta)` where `meta` holds next/prev or page/pages, or
+    `(None, None)` when the request is not paginated. Raises InvalidCursor
+    for a malformed cursor.
+    """
+    params = request.query_params
+    try:
+        page_size = min(max(int(params.get('limit', page_size)), 1), max_page_size)
+    except ValueError:
+        pass
+
+    if 'cursor' in params:
+        page = KeysetPaginator(queryset, page_size).page(params.get('cursor'))
+        return page.items, {'next': page.next, 'prev': page.prev}
+
+    if 'page' in params:
+        paginator = Paginator(queryset, page_size)
+        page = paginator.get_page(params.get('page'))
+        return list(page.object_list), {'page': page.number, 'pages': paginator.num_pages}
+
+    return None, None
+
+
+def estimate_count(queryset):
+    """Row count from the planner's estimate where the database offers one.
+
+    Postgres answers from `EXPLAIN` without touching the rows, other vendors
+    fall back to an exact `COUNT(*)`.
+    """
+    if connections[queryset.db].vendor == 'postgresql':
+        plan = json.loads(queryset.order_by().explain(format='json'))
+        if isinstance(plan, list):
+            plan = plan[0]
+        return int(plan['Plan']['Plan Rows'])
+    return queryset.count()
@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.db.models import Count, DecimalField, F, FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Now
+
+from base.models import Product, Review
+
+
+def _average(total, count):
+    return Cast(
+        Cast(total, FloatField()) / count,
+        DecimalField(max_digits=12, decimal_places=2),
+    )
+
+
+def _score(total, count):
+    """Bayesian average: the product's ratings plus `weight` virtual ratings of
+    `mean`, so a handful of 5-star reviews cannot outrank a large, well-rated
+    history."""
+    mean = settings.LEADERBOARD_PRIOR_MEAN
+    weight = settings.LEADERBOARD_PRIOR_WEIGHT
+    return (Cast(total, FloatField()) + Value(mean * weight)) / (count + Value(float(weight)))
+
+
+def add_review_rating(product_id, rating):
+    """Fold one new rating into the product aggregates with a single UPDATE.
+
+    The right-hand side reads the row as it is when the UPDATE runs, so
+    concurrent reviews serialize on the row lock instead of overwriting each
+    other's counts.
+    """
+    total = F('ratingSum') + rating
+    count = Coalesce(F('numReviews'), Value(0)) + 1
+    return Product.objects.filter(_id=product_id).update(
+        ratingSum=total,
+        numReviews=count,
+        rating=_average(total, count),
+        score=_score(total, count),
+        updatedAt=Now(),
+    )
+
+
+def rebuild_review_aggregates(products=None):
+    """Recompute rating sum, count, average and score from the review table.
+
+    Runs as one set-based UPDATE over `products` (every product by default).
+    """
+    if products is None:
+        products = Product.objects.all()
+
+    reviews = Review.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    total = Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), Value(0))
+    count = Coalesce(Subquery(reviews.annotate(count=Count('pk')).values('count')), Value(0))
+
+    updated = products.update(ratingSum=total, numReviews=count, updatedAt=Now())
+    products.filter(numReviews__gt=0).update(
+        rating=_average(F('ratingSum'), F('numReviews')),
+        score=_score(F('ratingSum'), F('numReviews')),
+    )
+    products.filter(numReviews=0).update(rating=0, score=0)
+    return updated
@@ -0,0 +1,141 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q, Value
+from django.db.models.functions import Coalesce
+from django.db.models.expressions import RawSQL
+
+from base.models import Product
+
+
+# Ordered by search weight, the name ranks highest and the description lowest
+SEARCH_FIELDS = ('name', 'brand', 'category', 'description')
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def search_terms(keyword):
+    return TERM_RE.findall(keyword or '')[:8]
+
+
+def search_backend():
+    backend = getattr(settings, 'PRODUCT_SEARCH_BACKEND', 'auto')
+    if backend != 'auto':
+        return backend
+    if connection.vendor in ('postgresql', 'sqlite'):
+        return connection.vendor
+    return 'basic'
+
+
+def search_products(products, keyword):
+    """Filter `products` by `keyword` and order them by relevance.
+
+    Postgres uses the generated `search_vector` column plus a trigram index on
+    the name for typo tolerance, SQLite uses the FTS5 shadow table, anything
+    else falls back to `icontains` over the searchable columns.
+    """
+    terms = search_terms(keyword)
+    if not terms:
+        return products
+
+    backend = search_backend()
+    if backend == 'postgresql':
+        return _search_postgresql(products, keyword, terms)
+    if backend == 'sqlite':
+        return _search_sqlite(products, terms)
+    return _search_basic(products, terms)
+
+
+def _search_postgresql(products, keyword, terms):
+    from django.contrib.postgres.search import (
+        SearchQuery, SearchRank, SearchVectorField, TrigramWordSimilarity,
+    )
+
+    table = Product._meta.db_table
+    vector = RawSQL(f'"{table}"."search_vector"', [], output_field=SearchVectorField())
+    # Prefix match on every term so search-as-you-type hits partial words
+    query = SearchQuery(' & '.join(f'{t}:*' for t in terms), config='simple', search_type='raw')
+
+    return products.annotate(
+        search=vector,
+        rank=SearchRank(vector, query) + Coalesce(TrigramWordSimilarity(keyword, 'name'), Value(0.0)),
+    ).filter(
+        Q(search=query) | Q(name__trigram_word_similar=keyword)
+    ).order_by('-rank', '-_id')
+
+
+def _search_sqlite(products, terms):
+    table = Product._meta.db_table
+    fts = f'{table}_fts'
+    match = ' '.join(f'"{t}"*' for t in terms)
+
+    rank = RawSQL(
+        f'SELECT bm25({fts}, 10.0, 5.0, 5.0, 1.0) FROM {fts} '
+        f'WHERE {fts} MATCH %s AND {fts}.rowid = {table}._id',
+        (match,),
+    )
+    matches = RawSQL(f'SELECT rowid FROM {fts} WHERE {fts} MATCH %s', (match,))
+
+    # bm25() is negative, the best match has the lowest score
+    return products.filter(_id__in=matches).annotate(rank=rank).order_by('rank', '-_id')
+
+
+def _search_basic(products, terms):
+    for term in terms:
+        condition = Q()
+        for field in SEARCH_FIELDS:
+            condition |= Q(**{f'{field}__icontains': term})
+        products = products.filter(condition)
+    return products
+
+
+def install_search_index(using=connection):
+    """Create the full-text structures for the current database vendor.
+
+    Every statement is idempotent so this is safe to run after each migrate.
+    """
+    table = Product._meta.db_table
+    if using.vendor == 'postgresql':
+        statements = _postgresql_statements(table)
+    elif using.vendor == 'sqlite':
+        statements = _sqlite_statements(table)
+    else:
+        return
+
+    with using.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def _postgresql_statements(table):
+    vector = ' || '.join(
+        f"setweight(to_tsvector('simple', coalesce({field}, '')), '{weight}')"
+        for field, weight in zip(SEARCH_FIELDS, 'ABBC')
+    )
+    return [
+        'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+        f'ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector '
+        f'GENERATED ALWAYS AS ({vector}) STORED',
+        f'CREATE INDEX IF NOT EXISTS {table}_search_vector_idx ON {table} USING GIN (search_vector)',
+        f'CREATE INDEX IF NOT EXISTS {table}_name_trgm_idx ON {table} USING GIN (name gin_trgm_ops)',
+    ]
+
+
+def _sqlite_statements(table):
+    fts = f'{table}_fts'
+    columns = ', '.join(SEARCH_FIELDS)
+    new_values = ', '.join(f'new.{field}' for field in SEARCH_FIELDS)
+    old_values = ', '.join(f'old.{field}' for field in SEARCH_FIELDS)
+    delete_old = (
+        f"INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old._id, {old_values});"
+    )
+    insert_new = f'INSERT INTO {fts}(rowid, {columns}) VALUES (new._id, {new_values});'
+
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({columns}, "
+        f"content='{table}', content_rowid='_id', tokenize='unicode61 remove_diacritics 2')",
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN {insert_new} END',
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN {delete_old} END',
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {table} BEGIN {delete_old} {insert_new} END',
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
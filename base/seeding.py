@@ -0,0 +1,298 @@
+"""Synthetic users, products, reviews and orders at production scale.
+
+Rows get explicit primary keys above the current maximum, so reviews, order
+items and addresses can point at the products, users and orders they belong
+to without reading anything back. They are written in batches with Postgres
+`COPY` where available and `bulk_create` elsewhere. Everything except the
+primary keys (and the usernames made from them) follows from the seed and
+`until`, so the same arguments give the same data on an empty database.
+"""
+import json
+import random
+from array import array
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import connections, transaction
+from django.db.models import JSONField, Max
+from django.utils import timezone
+
+from base.models import Order, OrderItem, Product, Review, ShippingAddress
+from base.products import products as SAMPLES
+
+
+PASSWORD = 'seed-pass'
+VARIANTS = ('', 'Pro', 'Mini', 'Max', 'Ultra', 'Lite', 'Plus', 'SE', '2024', 'Refurbished')
+FIRST_NAMES = ('Aigerim', 'Dias', 'Madina', 'Nurlan', 'Aruzhan', 'Timur', 'Dana', 'Alikhan', 'Saule', 'Erlan')
+LAST_NAMES = ('Akhmetov', 'Bekova', 'Omarov', 'Nurpeisova', 'Seitkali', 'Zhunusov', 'Karimova', 'Abenov')
+CITIES = (('Almaty', '050000'), ('Astana', '010000'), ('Shymkent', '160000'), ('Karaganda', '100000'),
+          ('Aktobe', '030000'), ('Taraz', '080000'), ('Pavlodar', '140000'))
+STREETS = ('Abay', 'Dostyk', 'Kurmangazy', 'Tole Bi', 'Satpayev', 'Zhibek Zholy', 'Furmanov')
+COMMENTS = ('Works as described', 'Great value for the price', 'Arrived quickly', 'Not what I expected',
+            'Would buy again', 'Stopped working after a month', 'Exactly like the pictures')
+PAYMENT_METHODS = ('PayPal', 'Stripe')
+
+
+class Seeder:
+    """Generate and insert the rows; see `seed`.
+
+    `users`, `products` and `orders` are row counts, `reviews` the average
+    number of reviews per product and `items` the most lines per order.
+    Timestamps fall in the `days` days before `until` (midnight today by
+    default).
+    """
+
+    def __init__(self, seed=1, batch_size=10000, using='default', copy=None, until=None, days=365,
+                 password=PASSWORD):
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        self.using = using
+        self.connection = connections[using]
+        self.copy = self.connection.vendor == 'postgresql' if copy is None else copy
+        if until is None:
+            until = timezone.make_aware(datetime.combine(timezone.localdate(), time.min))
+        self.start = until - timedelta(days=days)
+        self.span = days * 86400
+        self.password = make_password(password)
+        self.counts = {}
+
+    # Rows
+
+    def moment(self):
+        return self.start + timedelta(seconds=self.rng.randrange(self.span))
+
+    def user_rows(self, first_id, count):
+        for user_id in range(first_id, first_id + count):
+            email = f'user{user_id}@example.com'
+            yield User, {
+                'id': user_id, 'password': self.password, 'last_login': None, 'is_superuser': False,
+                'username': email, 'first_name': self.rng.choice(FIRST_NAMES),
+                'last_name': self.rng.choice(LAST_NAMES), 'email': email, 'is_staff': False,
+                'is_active': True, 'date_joined': self.moment(),
+            }
+
+    def product_rows(self, first_id, count, users, reviews, catalog):
+        """Products with their reviews; the rating aggregates are computed
+        here, the way base.reviews would from the review rows. The price and
+        variant of each product are appended to `catalog` for the orders."""
+        mean = settings.LEADERBOARD_PRIOR_MEAN
+        weight = settings.LEADERBOARD_PRIOR_WEIGHT
+
+        for index in range(count):
+            product_id = first_id + index
+            sample = SAMPLES[index % len(SAMPLES)]
+            variant = self.rng.randrange(len(VARIANTS))
+            price = Decimal(str(round(float(sample['price']) * self.rng.uniform(0.5, 1.5), 2)))
+            catalog.add(float(price), variant)
+            created = self.moment()
+
+            ratings = []
+            reviewers = self.rng.sample(users, min(self.rng.randint(0, 2 * reviews), len(users))) if reviews else []
+            review_rows = []
+            for user_id in reviewers:
+                rating = self.rng.choices((1, 2, 3, 4, 5), (1, 1, 2, 4, 5))[0]
+                ratings.append(rating)
+                review_rows.append({
+                    'product_id': product_id, 'user_id': user_id, 'name': self.rng.choice(FIRST_NAMES),
+                    'rating': rating, 'comment': self.rng.choice(COMMENTS),
+                    'createdAt': created + timedelta(seconds=self.rng.randrange(86400 * 30)),
+                })
+
+            total, number = sum(ratings), len(ratings)
+            yield Product, {
+                '_id': product_id, 'user_id': None, 'name': product_name(index, variant),
+                'image': sample['image'].lstrip('/'), 'imageVariants': {}, 'brand': sample['brand'],
+                'category': sample['category'], 'description': sample['description'],
+                'rating': Decimal(str(round(total / number, 2))) if number else Decimal(0),
+                'numReviews': number, 'ratingSum': total,
+                'score': (total + mean * weight) / (number + weight) if number else 0,
+                'price': price, 'countInStock': self.rng.randint(0, 200),
+                'createdAt': created, 'updatedAt': created,
+            }
+            for row in review_rows:
+                yield Review, row
+
+    def order_rows(self, first_id, count, users, first_product, catalog, items):
+        for order_id in range(first_id, first_id + count):
+            created = self.moment()
+            lines = self.rng.sample(range(len(catalog)), self.rng.randint(1, min(items, len(catalog))))
+            item_rows = []
+            subtotal = 0
+            for index in lines:
+                qty = self.rng.randint(1, 3)
+                price = catalog.prices[index]
+                subtotal += qty * price
+                item_rows.append({
+                    'product_id': first_product + index, 'order_id': order_id,
+                    'name': product_name(index, catalog.variants[index]), 'qty': qty,
+                    'price': Decimal(str(price)), 'image': SAMPLES[index % len(SAMPLES)]['image'].lstrip('/'),
+                })
+
+            paid = self.rng.random() < 0.7
+            delivered = paid and self.rng.random() < 0.6
+            paid_at = created + timedelta(minutes=self.rng.randint(1, 120)) if paid else None
+            tax = round(subtotal * 0.082, 2)
+            shipping = 0 if subtotal > 100 else 10
+            yield Order, {
+                '_id': order_id, 'user_id': self.rng.choice(users), 'paymentMethod': self.rng.choice(PAYMENT_METHODS),
+                'taxPrice': Decimal(str(tax)), 'shippingPrice': Decimal(shipping),
+                'totalPrice': Decimal(str(round(subtotal + tax + shipping, 2))),
+                'isPaid': paid, 'paidAt': paid_at, 'isDeliver': delivered,
+                'deliveredAt': paid_at + timedelta(days=self.rng.randint(1, 10)) if delivered else None,
+                'createdAt': created, 'updatedAt': paid_at or created,
+            }
+            for row in item_rows:
+                yield OrderItem, row
+
+            city, postal_code = self.rng.choice(CITIES)
+            yield ShippingAddress, {
+                'order_id': order_id, 'address': f'{self.rng.choice(STREETS)} {self.rng.randint(1, 200)}',
+                'city': city, 'postalCode': postal_code, 'country': 'Kazakhstan', 'shippingPrice': None,
+            }
+
+    # Writing
+
+    def write(self, rows, parents):
+        """Insert `(model, row)` pairs in batches. Each batch runs in its own
+        transaction, with the `parents` models written before the others, so
+        a parent row has to come before its children in `rows`."""
+        pending = {}
+        for model, row in rows:
+            pending.setdefault(model, []).append(row)
+            if len(pending[model]) >= self.batch_size:
+                self.flush(pending, parents)
+        self.flush(pending, parents)
+
+    def flush(self, pending, parents):
+        with transaction.atomic(using=self.using):
+            for model in sorted(pending, key=lambda model: model not in parents):
+                if pending[model]:
+                    self.insert(model, pending[model])
+                    self.counts[model.__name__] = self.counts.get(model.__name__, 0) + len(pending[model])
+                    pending[model] = []
+
+    def insert(self, model, rows):
+        if self.copy:
+            self.copy_rows(model, rows)
+        else:
+            with frozen_timestamps(model):
+                model.objects.using(self.using).bulk_create(
+                    [model(**row) for row in rows], batch_size=self.batch_size,
+                )
+
+    def copy_rows(self, model, rows):
+        names = list(rows[0])
+        fields = [model._meta.get_field(name) for name in names]
+        columns = ', '.join(self.connection.ops.quote_name(field.column) for field in fields)
+        data = StringIO()
+        for row in rows:
+            data.write('\t'.join(
+                _copy_value(json.dumps(row[name]) if isinstance(field, JSONField)
+                            else field.get_db_prep_save(row[name], self.connection))
+                for name, field in zip(names, fields)
+            ))
+            data.write('\n')
+        data.seek(0)
+
+        sql = f'COPY {self.connection.ops.quote_name(model._meta.db_table)} ({columns}) FROM STDIN'
+        with self.connection.cursor() as cursor:
+            raw = cursor.cursor
+            if hasattr(raw, 'copy_expert'):
+                raw.copy_expert(sql, data)
+            else:
+                with raw.copy(sql) as copy:
+                    copy.write(data.getvalue())
+
+    def next_id(self, model):
+        return (model.objects.using(self.using).aggregate(top=Max('pk'))['top'] or 0) + 1
+
+    def reset_sequences(self, models):
+        statements = self.connection.ops.sequence_reset_sql(no_style(), models)
+        if statements:
+            with self.connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
+
+    def seed(self, users=0, products=0, reviews=0, orders=0, items=4):
+        """Insert the rows and return `{model name: rows inserted}`.
+
+        Reviews and orders are made by the users created in the same call,
+        and orders are for its products.
+        """
+        if orders and not (users and products):
+            raise ValueError('Orders need users and products to be seeded with them')
+        if reviews and not (users and products):
+            raise ValueError('Reviews need users and products to be seeded with them')
+
+        first_user = self.next_id(User)
+        user_ids = range(first_user, first_user + users)
+        self.write(self.user_rows(first_user, users), parents=())
+
+        first_product = self.next_id(Product)
+        catalog = Catalog()
+        self.write(self.product_rows(first_product, products, user_ids, reviews, catalog), parents=(Product,))
+
+        if orders:
+            self.write(
+                self.order_rows(self.next_id(Order), orders, user_ids, first_product, catalog, items),
+                parents=(Order,),
+            )
+
+        self.reset_sequences([User, Product, Review, Order, OrderItem, ShippingAddress])
+        return dict(self.counts)
+
+
+class Catalog:
+    """Price and name variant of every seeded product, compactly enough
+    for millions of them."""
+
+    def __init__(self):
+        self.prices = array('d')
+        self.variants = array('B')
+
+    def add(self, price, variant):
+        self.prices.append(price)
+        self.variants.append(variant)
+
+    def __len__(self):
+        return len(self.prices)
+
+
+def product_name(index, variant):
+    return f'{SAMPLES[index % len(SAMPLES)]["name"]} {VARIANTS[variant]}'.strip()
+
+
+@contextmanager
+def frozen_timestamps(model):
+    """Let bulk_create keep the given auto_now/auto_now_add values."""
+    fields = [field for field in model._meta.concrete_fields
+              if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def _copy_value(value):
+    """A value in COPY's text format."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def seed(users=0, products=0, reviews=0, orders=0, items=4, **options):
+    """Shortcut for `Seeder(**options).seed(...)`."""
+    return Seeder(**options).seed(users=users, products=products, reviews=reviews, orders=orders, items=items)
@@ -3,9 +3,11 @@ from rest_framework import serializers
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth.models import User
 from .models import *
+from .images import srcset, variant_urls
+from .metrics import MeasuredSerializerMixin, serializing
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(MeasuredSerializerMixin,serializers.ModelSerializer):
     name= serializers.SerializerMethodField(read_only=True)
     _id = serializers.SerializerMethodField(read_only=True)
     isAdmin = serializers.SerializerMethodField(read_only=True)
@@ -37,33 +39,52 @@ class UserSerializerWithToken(UserSerializer):
         return str(token.access_token)
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(MeasuredSerializerMixin,serializers.ModelSerializer):
     class Meta:
         model = Review
         fields = '__all__'
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductImageMixin(MeasuredSerializerMixin,serializers.Serializer):
+    # WebP variants of image, ready for <img srcset>; empty until generated
+    imageVariants = serializers.SerializerMethodField(read_only=True)
+    imageSrcset = serializers.SerializerMethodField(read_only=True)
+
+    def get_imageVariants(self,obj):
+        return {str(width): url for width, url in variant_urls(obj).items()}
+
+    def get_imageSrcset(self,obj):
+        return srcset(obj)
+
+# Review aggregates and stock stripes are bookkeeping, not part of the API
+PRODUCT_INTERNAL_FIELDS = ['ratingSum', 'score', 'stockStripes']
+
+class ProductListSerializer(ProductImageMixin,serializers.ModelSerializer):
+    class Meta:
+        model = Product
+        exclude = PRODUCT_INTERNAL_FIELDS
+
+class ProductSerializer(ProductImageMixin,serializers.ModelSerializer):
     reviews = serializers.SerializerMethodField(read_only= True)
     class Meta:
         model = Product 
-        fields = '__all__'
+        exclude = PRODUCT_INTERNAL_FIELDS
 
     def get_reviews(self,obj):
         reviews = obj.review_set.all()
         serializer = ReviewSerializer(reviews,many=True)
         return serializer.data
 
-class ShippingAddressSerializer(serializers.ModelSerializer):
+class ShippingAddressSerializer(MeasuredSerializerMixin,serializers.ModelSerializer):
     class Meta:
         model = ShippingAddress
         fields = '__all__'
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(MeasuredSerializerMixin,serializers.ModelSerializer):
     class Meta:
         model = OrderItem
         fields = '__all__'
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(MeasuredSerializerMixin,serializers.ModelSerializer):
     orderItems = serializers.SerializerMethodField(read_only=True)
     shippingAddress = serializers.SerializerMethodField(read_only=True)
     User = serializers.SerializerMethodField(read_only=True)
@@ -92,3 +113,116 @@ class OrderSerializer(serializers.ModelSerializer):
 
 
 
+
+
+# Read-only fast path for order listings: plain values() rows assembled into
+# the same JSON shape as OrderSerializer, without per-row serializer objects.
+_datetime = serializers.DateTimeField()
+_decimal = serializers.DecimalField(max_digits=12,decimal_places=2)
+
+ORDER_COLUMNS = (
+    '_id','user_id','paymentMethod','taxPrice','shippingPrice','totalPrice',
+    'isPaid','paidAt','isDeliver','deliveredAt','createdAt','updatedAt',
+    'user__username','user__email','user__first_name','user__is_staff',
+    'shippingaddress___id','shippingaddress__address','shippingaddress__city',
+    'shippingaddress__postalCode','shippingaddress__country','shippingaddress__shippingPrice',
+)
+
+ORDER_ITEM_COLUMNS = ('_id','name','qty','price','image','product_id','order_id')
+
+
+def _dt(value):
+    return None if value is None else _datetime.to_representation(value)
+
+
+def _dec(value):
+    return None if value is None else _decimal.to_representation(value)
+
+
+def serialize_orders(orders):
+    """Serialize an Order queryset to exactly what OrderSerializer(many=True)
+    returns, without building a serializer per row."""
+    return list(iter_orders(orders))
+
+
+def iter_orders(orders,chunk_size=1000):
+    """Yield serialized orders, reading orders in chunks from a server-side
+    cursor and fetching the items of each chunk with one query."""
+    rows = orders.select_related(None).prefetch_related(None)\
+        .values(*ORDER_COLUMNS).iterator(chunk_size=chunk_size)
+
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield from _serialize_chunk(chunk)
+            chunk = []
+    yield from _serialize_chunk(chunk)
+
+
+def _serialize_chunk(rows):
+    if not rows:
+        return
+
+    items = {}
+    item_rows = OrderItem.objects.filter(order_id__in=[row['_id'] for row in rows])\
+        .order_by('_id').values_list(*ORDER_ITEM_COLUMNS)
+    for _id,name,qty,price,image,product,order in item_rows:
+        items.setdefault(order,[]).append({
+            '_id': _id,
+            'name': name,
+            'qty': qty,
+            'price': _dec(price),
+            'image': image,
+            'product': product,
+            'order': order,
+        })
+
+    for row in rows:
+        with serializing():
+            order = _order_dict(row,items.get(row['_id'],[]))
+        yield order
+
+
+def _order_dict(row,items):
+    if row['user_id'] is None:
+        user = {'username': '', 'email': ''}
+    else:
+        user = {
+            'id': row['user_id'],
+            '_id': row['user_id'],
+            'username': row['user__username'],
+            'email': row['user__email'],
+            'name': row['user__first_name'] or row['user__email'],
+            'isAdmin': row['user__is_staff'],
+        }
+
+    address = False
+    if row['shippingaddress___id'] is not None:
+        address = {
+            '_id': row['shippingaddress___id'],
+            'address': row['shippingaddress__address'],
+            'city': row['shippingaddress__city'],
+            'postalCode': row['shippingaddress__postalCode'],
+            'country': row['shippingaddress__country'],
+            'shippingPrice': _dec(row['shippingaddress__shippingPrice']),
+            'order': row['_id'],
+        }
+
+    return {
+        '_id': row['_id'],
+        'orderItems': items,
+        'shippingAddress': address,
+        'User': user,
+        'paymentMethod': row['paymentMethod'],
+        'taxPrice': _dec(row['taxPrice']),
+        'shippingPrice': _dec(row['shippingPrice']),
+        'totalPrice': _dec(row['totalPrice']),
+        'isPaid': row['isPaid'],
+        'paidAt': _dt(row['paidAt']),
+        'isDeliver': row['isDeliver'],
+        'deliveredAt': _dt(row['deliveredAt']),
+        'createdAt': _dt(row['createdAt']),
+        'updatedAt': _dt(row['updatedAt']),
+        'user': row['user_id'],
+    }
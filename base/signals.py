@@ -1,5 +1,13 @@
-from django.db.models.signals import pre_save
+from django.db import connections
+from django.core.signals import setting_changed
+from django.db.backends.signals import connection_created
+from django.db.models.signals import pre_save, post_save, post_delete, post_migrate
 from django.contrib.auth.models import User
+from base.authentication import forget_user
+from base.cache import bump_catalog_version
+from base.metrics import count_connection, install_query_recorder
+from base.throttling import reset_store
+from base.models import Product, Review
 
 
 def updateUser(sender,instance,**kwargs):
@@ -9,3 +17,43 @@ def updateUser(sender,instance,**kwargs):
 
 
 pre_save.connect(updateUser,sender = User)
+
+
+def forgetUser(sender,instance,**kwargs):
+    forget_user(instance.pk)
+
+
+post_save.connect(forgetUser,sender = User)
+post_delete.connect(forgetUser,sender = User)
+
+
+def installSearchIndex(sender,using,**kwargs):
+    if sender.name == 'base':
+        from base.search import install_search_index
+        install_search_index(connections[using])
+
+
+post_migrate.connect(installSearchIndex)
+
+
+def invalidateCatalog(sender,**kwargs):
+    bump_catalog_version()
+
+
+for model in (Product, Review):
+    post_save.connect(invalidateCatalog,sender = model)
+    post_delete.connect(invalidateCatalog,sender = model)
+
+
+# Count queries of every connection towards the request metrics, and the
+# connections themselves
+connection_created.connect(install_query_recorder)
+connection_created.connect(count_connection)
+
+
+def resetThrottleStore(sender,setting,**kwargs):
+    if setting.startswith('THROTTLE_'):
+        reset_store()
+
+
+setting_changed.connect(resetThrottleStore)
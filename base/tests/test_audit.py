@@ -0,0 +1,110 @@
+import json
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from base import metrics
+from base.audit import ROUTES, audit_client, call_route, create_samples, route_label
+from base.budgets import QUERY_BUDGETS, QueryBudgetExceeded
+from base.models import Order, OrderItem, Product, Review
+from base.urls import async_urls, order_urls, product_urls, user_urls
+
+
+## query plan audit tests
+class ExplainQueriesTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        Product.objects.create(name='Phone', price=10, countInStock=5)
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_every_named_route_is_sampled(self):
+        sampled = {route['name'] for route in ROUTES}
+        routes = {
+            pattern.name
+            for urls in (product_urls, user_urls, order_urls, async_urls)
+            for pattern in urls.urlpatterns
+        }
+        self.assertEqual(routes - sampled, set())
+
+    def test_report_covers_routes_and_rolls_back(self):
+        out = StringIO()
+        call_command('explain_queries', '--json', stdout=out)
+        report = json.loads(out.getvalue())
+
+        self.assertEqual(len(report), len(ROUTES))
+        for entry in report:
+            self.assertLess(entry['status'], 500, entry['route'])
+            self.assertGreater(entry['queries'], 0, entry['route'])
+        self.assertFalse(User.objects.filter(username='audit@example.com').exists())
+        self.assertEqual(Product.objects.count(), 1)
+
+
+## query budget tests
+class QueryBudgetTest(APITestCase):
+
+    def setUp(self):
+        # Enough related rows that a per-row query would blow the budgets
+        owner = User.objects.create_user(username='owner@example.com', password='pass')
+        for i in range(5):
+            product = Product.objects.create(name=f'Phone {i}', price=10, countInStock=5, rating=4, numReviews=3)
+            for j in range(3):
+                reviewer = User.objects.create_user(username=f'reviewer{i}-{j}@example.com', password='pass')
+                Review.objects.create(product=product, user=reviewer, name='Reviewer', rating=4)
+            order = Order.objects.create(user=owner, paymentMethod='PayPal', totalPrice=10)
+            OrderItem.objects.create(order=order, product=product, name=product.name, qty=1, price=10)
+        self.samples = create_samples()
+        self.client = audit_client(self.samples)
+
+    def tearDown(self):
+        for alias in caches:
+            caches[alias].clear()
+
+    def test_every_route_has_a_budget(self):
+        self.assertEqual({route['name'] for route in ROUTES} - set(QUERY_BUDGETS), set())
+
+    def test_routes_stay_within_budget(self):
+        for route in ROUTES:
+            budget = QUERY_BUDGETS[route['name']]
+            if budget is None:
+                continue
+            for alias in caches:
+                caches[alias].clear()
+            response, queries = call_route(self.client, route, self.samples)
+            queries = [sql for sql in queries if metrics.is_app_query(sql)]
+            self.assertLess(response.status_code, 500, route_label(route))
+            self.assertLessEqual(
+                len(queries), budget,
+                f'{route_label(route)} ran {len(queries)} queries, budget is {budget}:\n' + '\n'.join(queries),
+            )
+
+    @mock.patch.dict(QUERY_BUDGETS, {'products': 0})
+    def test_middleware_logs_exceeded_budget(self):
+        cache.clear()
+        with self.assertLogs('base.query_budget', 'WARNING') as logs:
+            response = self.client.get('/api/products/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('(products)', logs.output[0])
+        self.assertIn('http_query_budget_exceeded_total{view="products"}', metrics.render())
+
+    @mock.patch.dict(QUERY_BUDGETS, {'products': 0})
+    @override_settings(QUERY_BUDGET_ACTION='raise')
+    def test_middleware_raises_in_raise_mode(self):
+        cache.clear()
+        self.client.raise_request_exception = True
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get('/api/products/')
+
+    @mock.patch.dict(QUERY_BUDGETS, {'products': 0})
+    @override_settings(QUERY_BUDGET_ACTION='off')
+    def test_middleware_off(self):
+        cache.clear()
+        with self.assertNoLogs('base.query_budget'):
+            self.client.get('/api/products/')
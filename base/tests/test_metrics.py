@@ -0,0 +1,144 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.utils import timezone
+from silk.models import Request
+from django.core.cache import cache
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from base import metrics
+from base.models import Order, Product
+
+
+## metrics tests
+@override_settings(METRICS_TOKEN='secret')
+class MetricsTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        for metric in metrics.REGISTRY:
+            metric.clear()
+        self.user = User.objects.create_user(username='user1@sdu.kz', email='user1@sdu.kz', password='pass')
+        Product.objects.create(name='Phone', price=10)
+        Order.objects.create(user=self.user, paymentMethod='PayPal', totalPrice=10)
+
+    def tearDown(self):
+        cache.clear()
+
+    def scrape(self):
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode()
+
+    def test_requests_are_counted_per_view(self):
+        self.client.get(reverse('products'))
+        self.client.get(reverse('products'))
+        self.client.get(reverse('myorders'))
+
+        text = self.scrape()
+        self.assertIn('http_requests_total{view="products",method="GET",status="200"} 2', text)
+        self.assertIn('http_requests_total{view="myorders",method="GET",status="401"} 1', text)
+        self.assertIn('http_request_duration_seconds_count{view="products"} 2', text)
+        self.assertIn('http_request_duration_seconds_bucket{view="products",le="+Inf"} 2', text)
+
+    def test_queries_and_serializer_time_are_recorded(self):
+        self.client.force_authenticate(self.user)
+        self.client.get(reverse('myorders'))
+
+        _, queries = metrics.DB_QUERIES._values[('myorders',)]
+        self.assertGreater(queries, 0)
+        _, seconds = metrics.SERIALIZER_TIME._values[('myorders',)]
+        self.assertGreater(seconds, 0)
+
+    def test_token_is_required_when_configured(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_endpoint_is_closed_without_a_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_404_NOT_FOUND)
+        with self.settings(DEBUG=True):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_200_OK)
+
+    def test_scrapes_add_up_the_worker_processes(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        # What another worker wrote on its last flush
+        other = {
+            'http_requests_total': [[['products', 'GET', '200'], 3]],
+            'http_request_duration_seconds': [[['products'], [[0] * 11 + [3], 45.0]]],
+        }
+        with open(os.path.join(directory, '123-other.json'), 'w') as f:
+            json.dump(other, f)
+
+        with self.settings(METRICS_DIR=directory):
+            self.client.get(reverse('products'))
+            text = self.scrape()
+        self.assertIn('http_requests_total{view="products",method="GET",status="200"} 4', text)
+        self.assertIn('http_request_duration_seconds_bucket{view="products",le="10"} 1', text)
+        self.assertIn('http_request_duration_seconds_count{view="products"} 4', text)
+        self.assertEqual(len(os.listdir(directory)), 2)
+
+    def test_scrapes_leave_out_gauges_of_exited_workers(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        exited = subprocess.Popen([sys.executable, '-c', ''])
+        exited.wait()
+        for pid, size in ((os.getppid(), 4), (exited.pid, 8)):
+            with open(os.path.join(directory, f'{pid}-other.json'), 'w') as f:
+                json.dump({
+                    'db_connections_opened_total': [[['default'], 1]],
+                    'db_pool': [[['default', 'pool_size'], size]],
+                }, f)
+
+        with self.settings(METRICS_DIR=directory):
+            text = self.scrape()
+        self.assertIn('db_connections_opened_total{alias="default"} 2', text)
+        self.assertIn('db_pool{alias="default",stat="pool_size"} 4', text)
+
+    @override_settings(SLOW_REQUEST_SECONDS=0)
+    def test_slow_requests_are_logged(self):
+        with self.assertLogs('base.slow_requests', level='WARNING') as logs:
+            self.client.get(reverse('products'))
+        self.assertIn('/api/products/', logs.output[0])
+
+    def test_connections_and_pool_stats_are_exported(self):
+        wrapper = connections['default']
+        connection_created.send(sender=type(wrapper), connection=wrapper)
+        pool = mock.Mock(**{'get_stats.return_value': {'pool_size': 4, 'pool_available': 3}})
+        database = {**wrapper.settings_dict, 'OPTIONS': {'pool': {'max_size': 4}}}
+        with mock.patch.dict(connections.settings['default'], database), \
+                mock.patch.object(type(wrapper), 'pool', pool, create=True):
+            text = self.scrape()
+
+        self.assertIn('db_connections_opened_total{alias="default"} 1', text)
+        self.assertIn('db_pool{alias="default",stat="pool_size"} 4', text)
+        self.assertIn('db_pool{alias="default",stat="pool_available"} 3', text)
+
+
+class PruneSilkTest(APITestCase):
+
+    def test_old_requests_are_deleted(self):
+        Request.objects.all().delete()
+        old = Request.objects.create(path='/old/', method='GET')
+        Request.objects.filter(id=old.id).update(start_time=timezone.now() - timedelta(hours=48))
+        Request.objects.create(path='/new/', method='GET')
+
+        call_command('prune_silk', '--hours', '24', stdout=StringIO())
+        self.assertEqual(list(Request.objects.values_list('path', flat=True)), ['/new/'])
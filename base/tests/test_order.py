@@ -1,9 +1,19 @@
+import json
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.utils import timezone
 from rest_framework.test import APITestCase
 from django.contrib.auth.models import User
 from rest_framework import status
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.urls import reverse
-from base.models import Order, OrderItem, ShippingAddress, Product
+from base.models import Order, OrderItem, ShippingAddress, Product, StockReservation, StockStripe, IdempotencyKey
+from base.idempotency import prune_expired
+from base.inventory import release_expired, refresh_striped_totals, stripe_stock
+from base.serializers import OrderSerializer, serialize_orders
 
 
 class OrderListTest(APITestCase):
@@ -167,6 +177,32 @@ class OrderDetailTest(APITestCase):
         response = self.client.get(self.url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_unchanged_order_answers_not_modified(self):
+        token = self.get_token(self.admin_user)
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + token)
+
+        response = self.client.get(self.url)
+        self.assertIn('private', response['Cache-Control'])
+        etag = response['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.order.isPaid = True
+        self.order.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_other_user_cannot_revalidate_order(self):
+        token = self.get_token(self.admin_user)
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + token)
+        etag = self.client.get(self.url)['ETag']
+
+        token = self.get_token(self.other_user)
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + token)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_other_user_cannot_view_order(self):
         token = self.get_token(self.other_user)
         self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + token)
@@ -346,3 +382,508 @@ class MyOrdersTest(APITestCase):
     def test_unauthenticated_user_cannot_access_orders(self):
         response = self.client.get(self.url)
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_async_variant_matches(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.get_token(self.user1))
+        url = reverse('async-myorders')
+        self.assertEqual(self.client.get(url).json(), self.client.get(self.url).json())
+
+        self.client.credentials()
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class AddOrderItemsTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='user@sdu.kz',
+            email='user@sdu.kz',
+            password='user'
+        )
+        self.book = Product.objects.create(name='Яхина Г.: Эйзен', price=7450.00, countInStock=5)
+        self.other = Product.objects.create(name='Вульф С.: Разрушитель небес', price=5000.00, countInStock=1)
+        self.client.force_authenticate(self.user)
+        self.url = reverse('orders-add')
+
+    def order_data(self, *lines):
+        return {
+            'orderItems': [{'product': p._id, 'qty': qty, 'price': p.price} for p, qty in lines],
+            'shippingAddress': {
+                'address': 'Kurmangazy 15',
+                'city': 'Almaty',
+                'postalCode': '050081',
+                'country': 'Kazakhstan',
+            },
+            'paymentMethod': 'PayPal',
+            'taxPrice': 0,
+            'shippingPrice': 0,
+            'totalPrice': 12450.00,
+        }
+
+    def test_order_takes_stock(self):
+        response = self.client.post(self.url, self.order_data((self.book, 2), (self.other, 1)), format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['orderItems']), 2)
+
+        self.book.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual(self.book.countInStock, 3)
+        self.assertEqual(self.other.countInStock, 0)
+
+    def test_insufficient_stock_rolls_back(self):
+        response = self.client.post(self.url, self.order_data((self.book, 2), (self.other, 2)), format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['lines'], [
+            {'product': self.other._id, 'name': self.other.name, 'requested': 2, 'available': 1},
+        ])
+
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.countInStock, 5)
+        self.assertFalse(Order.objects.exists())
+
+    def test_empty_order(self):
+        response = self.client.post(self.url, self.order_data(), format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class OrderFastSerializationTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='user@sdu.kz',
+            email='user@sdu.kz',
+            password='user',
+            first_name='Aruzhan'
+        )
+        self.product = Product.objects.create(name='Яхина Г.: Эйзен', price=7450.00, countInStock=10)
+
+        paid = Order.objects.create(
+            user=self.user,
+            paymentMethod='PayPal',
+            taxPrice=610.90,
+            shippingPrice=0.00,
+            totalPrice=8060.90,
+            isPaid=True,
+            paidAt=timezone.now()
+        )
+        ShippingAddress.objects.create(
+            order=paid,
+            address='Kurmangazy 15',
+            city='Almaty',
+            postalCode='050081',
+            country='Kazakhstan',
+        )
+        for qty in (1, 2):
+            OrderItem.objects.create(
+                product=self.product,
+                order=paid,
+                name=self.product.name,
+                qty=qty,
+                price=self.product.price,
+                image='/images/yakhina_g_eyzen_1.webp'
+            )
+
+        # No address, no items, deleted user
+        Order.objects.create(user=None, paymentMethod='PayPal', totalPrice=0)
+
+    def test_matches_order_serializer(self):
+        orders = Order.objects.all()
+        self.assertEqual(
+            json.loads(json.dumps(serialize_orders(orders))),
+            json.loads(json.dumps(OrderSerializer(orders, many=True).data)),
+        )
+
+
+class OrderExportTest(APITestCase):
+
+    def setUp(self):
+        self.admin_user = User.objects.create_user(
+            username='admin@sdu.kz',
+            email='admin@sdu.kz',
+            password='admin',
+            is_staff=True
+        )
+        self.product = Product.objects.create(name='Яхина Г.: Эйзен', price=7450.00, countInStock=10)
+
+        self.old = Order.objects.create(user=self.admin_user, paymentMethod='PayPal', totalPrice=100)
+        Order.objects.filter(_id=self.old._id).update(createdAt=timezone.now() - timedelta(days=40))
+        self.new = Order.objects.create(user=self.admin_user, paymentMethod='PayPal', totalPrice=8060.90)
+        for qty in (1, 2):
+            OrderItem.objects.create(product=self.product, order=self.new, name=self.product.name,
+                                     qty=qty, price=self.product.price)
+
+        self.client.force_authenticate(self.admin_user)
+        self.url = reverse('orders-export')
+
+    def test_ndjson_export_with_date_range(self):
+        since = (timezone.now() - timedelta(days=7)).date().isoformat()
+        response = self.client.get(self.url, {'from': since})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        orders = [json.loads(line) for line in lines]
+        self.assertEqual([o['_id'] for o in orders], [self.new._id])
+        self.assertEqual(len(orders[0]['orderItems']), 2)
+
+    def test_csv_export_has_a_line_per_item(self):
+        response = self.client.get(self.url, {'output': 'csv'})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertTrue(lines[0].startswith('order_id,'))
+        self.assertEqual(len(lines), 4)
+
+    def test_invalid_range(self):
+        response = self.client.get(self.url, {'from': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_non_admin_cannot_export(self):
+        self.client.force_authenticate(User.objects.create_user(username='user@sdu.kz', password='user'))
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class OrderListPaginationTest(APITestCase):
+
+    def setUp(self):
+        self.admin_user = User.objects.create_user(
+            username='admin@sdu.kz',
+            email='admin@sdu.kz',
+            password='admin',
+            is_staff=True
+        )
+        self.orders = [
+            Order.objects.create(
+                user=self.admin_user,
+                paymentMethod='PayPal',
+                totalPrice=100 * (i % 4),
+                isPaid=i % 2 == 0,
+            )
+            for i in range(7)
+        ]
+        self.client.force_authenticate(self.admin_user)
+        self.url = reverse('allorders')
+
+    def test_unpaginated_request_keeps_list_shape(self):
+        response = self.client.get(self.url, {'isPaid': 'false'})
+        self.assertEqual([o['_id'] for o in response.data], [o._id for o in self.orders[1::2]])
+
+    def test_numbered_pages(self):
+        response = self.client.get(self.url, {'page': 2, 'limit': 3})
+        self.assertEqual(response.data['pages'], 3)
+        self.assertEqual([o['_id'] for o in response.data['orders']], [o._id for o in self.orders[3:6]])
+
+    def test_cursor_pages_by_total_price(self):
+        # Orders without a total sort last
+        unpriced = [Order.objects.create(user=self.admin_user, totalPrice=None) for _ in range(2)]
+        expected = sorted(self.orders, key=lambda o: (-o.totalPrice, -o._id)) + unpriced[::-1]
+        seen = []
+        params = {'cursor': '', 'limit': 3, 'sort': '-totalPrice'}
+        while True:
+            response = self.client.get(self.url, params)
+            seen += [o['_id'] for o in response.data['orders']]
+            if not response.data['next']:
+                break
+            params['cursor'] = response.data['next']
+        self.assertEqual(seen, [o._id for o in expected])
+
+        params['cursor'] = response.data['prev']
+        response = self.client.get(self.url, params)
+        self.assertEqual([o['_id'] for o in response.data['orders']], seen[3:6])
+
+    def test_invalid_filter(self):
+        response = self.client.get(self.url, {'sort': 'paymentMethod'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class StockReservationTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='user@sdu.kz', email='user@sdu.kz', password='user')
+        self.book = Product.objects.create(name='Яхина Г.: Эйзен', price=7450.00, countInStock=5)
+        self.client.force_authenticate(self.user)
+
+    def place(self, product, qty):
+        return self.client.post(reverse('orders-add'), {
+            'orderItems': [{'product': product._id, 'qty': qty, 'price': product.price}],
+            'shippingAddress': {'address': 'Kurmangazy 15', 'city': 'Almaty', 'postalCode': '050081',
+                                'country': 'Kazakhstan'},
+            'paymentMethod': 'PayPal', 'taxPrice': 0, 'shippingPrice': 0, 'totalPrice': 7450.00,
+        }, format='json')
+
+    def pay(self, order_id):
+        return self.client.put(reverse('pay', kwargs={'pk': order_id}))
+
+    def stock(self, product=None):
+        return Product.objects.get(_id=(product or self.book)._id).countInStock
+
+    def expire_holds(self):
+        return release_expired(now=timezone.now() + timedelta(hours=1))
+
+    def test_checkout_holds_stock_until_paid(self):
+        order_id = self.place(self.book, 2).data['_id']
+        hold = StockReservation.objects.get(order_id=order_id)
+        self.assertEqual((hold.product_id, hold.qty, hold.status), (self.book._id, 2, StockReservation.HELD))
+        self.assertGreater(hold.expiresAt, timezone.now() + timedelta(minutes=14))
+        self.assertEqual(self.stock(), 3)
+
+        self.assertEqual(self.pay(order_id).status_code, status.HTTP_200_OK)
+        hold.refresh_from_db()
+        self.assertEqual(hold.status, StockReservation.COMMITTED)
+        self.assertEqual(self.stock(), 3)
+
+        # Committed holds are not swept, paying again takes nothing
+        self.assertEqual(self.expire_holds(), 0)
+        self.assertEqual(self.pay(order_id).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.stock(), 3)
+
+    def test_only_selling_out_invalidates_cached_catalog_reads(self):
+        url = reverse('product', args=[self.book._id])
+        self.client.get(url)
+        in_stock = {'inStock': 'true'}
+        self.assertEqual(len(self.client.get(reverse('products'), in_stock).data['products']), 1)
+
+        # Selling some of the stock leaves the cached catalog alone
+        with self.captureOnCommitCallbacks(execute=True):
+            self.place(self.book, 2)
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.place(self.book, 3)
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['countInStock'], 0)
+        self.assertEqual(self.client.get(reverse('products'), in_stock).data['products'], [])
+
+    def test_restocking_invalidates_cached_catalog_reads(self):
+        self.place(self.book, 5)
+        in_stock = {'inStock': 'true'}
+        self.assertEqual(self.client.get(reverse('products'), in_stock).data['products'], [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.expire_holds()
+        self.assertEqual(len(self.client.get(reverse('products'), in_stock).data['products']), 1)
+
+    def test_checkout_changes_catalog_etags(self):
+        url = reverse('product', args=[self.book._id])
+        product_etag = self.client.get(url)['ETag']
+        in_stock = {'inStock': 'true'}
+        listing_etag = self.client.get(reverse('products'), in_stock)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.place(self.book, 5)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=product_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['countInStock'], 0)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code,
+                         status.HTTP_304_NOT_MODIFIED)
+
+        response = self.client.get(reverse('products'), in_stock, HTTP_IF_NONE_MATCH=listing_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['products'], [])
+
+    def test_sweeper_releases_expired_holds(self):
+        order_id = self.place(self.book, 2).data['_id']
+        self.assertEqual(release_expired(), 0)
+        self.assertEqual(self.expire_holds(), 1)
+        self.assertEqual(self.stock(), 5)
+        self.assertEqual(StockReservation.objects.get(order_id=order_id).status, StockReservation.RELEASED)
+
+        # Paying late takes the stock again while there is some
+        self.assertEqual(self.pay(order_id).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.stock(), 3)
+        self.assertEqual(StockReservation.objects.get(order_id=order_id).status, StockReservation.COMMITTED)
+
+    def test_late_payment_is_refused_once_the_stock_is_gone(self):
+        order_id = self.place(self.book, 2).data['_id']
+        self.expire_holds()
+        self.assertEqual(self.place(self.book, 4).status_code, status.HTTP_200_OK)
+
+        response = self.pay(order_id)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['lines'], [
+            {'product': self.book._id, 'name': self.book.name, 'requested': 2, 'available': 1},
+        ])
+        self.assertFalse(Order.objects.get(_id=order_id).isPaid)
+        self.assertEqual(self.stock(), 1)
+
+    def test_striped_stock_cannot_be_oversold(self):
+        stripe_stock(self.book._id, 4, total=10)
+        self.assertEqual(sorted(StockStripe.objects.values_list('count', flat=True)), [2, 2, 3, 3])
+
+        # The fourth order only fits across several stripes, the fifth not at all
+        responses = [self.place(self.book, qty) for qty in (2, 2, 2, 3, 2)]
+        self.assertEqual([r.status_code for r in responses], [200] * 4 + [400])
+        self.assertEqual(responses[-1].data['lines'][0]['available'], 1)
+        self.assertEqual(sum(StockStripe.objects.values_list('count', flat=True)), 1)
+
+        # Listings see the stripes' total once the sweeper refreshes it
+        self.assertEqual(self.stock(), 10)
+        self.assertEqual(refresh_striped_totals(), 1)
+        self.assertEqual(self.stock(), 1)
+
+        self.expire_holds()
+        self.assertEqual(sum(StockStripe.objects.values_list('count', flat=True)), 10)
+
+    def test_refreshing_striped_totals_only_invalidates_when_stock_runs_out(self):
+        stripe_stock(self.book._id, 2, total=5)
+        url = reverse('product', args=[self.book._id])
+        self.client.get(url)
+
+        self.assertEqual(refresh_striped_totals(), 0)
+        self.place(self.book, 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(refresh_striped_totals(), 1)
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+        self.assertEqual(self.stock(), 3)
+
+        self.place(self.book, 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(refresh_striped_totals(), 1)
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['countInStock'], 0)
+
+    def test_editing_a_striped_product_keeps_the_stock_sold_since_the_sweep(self):
+        admin = User.objects.create_superuser(username='admin@sdu.kz', password='admin')
+        stripe_stock(self.book._id, 4, total=10)
+        self.place(self.book, 2)
+        self.place(self.book, 2)
+
+        def edit(**changes):
+            self.client.force_authenticate(admin)
+            response = self.client.put(reverse('update_product', args=[self.book._id]), {
+                'name': self.book.name, 'price': 7450, 'brand': '', 'category': '', 'description': '',
+                'countInStock': self.stock(), **changes,
+            }, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return response
+
+        # The form still shows 10, the total as of the last sweep
+        edit(description='Hardcover')
+        self.assertEqual(sum(StockStripe.objects.values_list('count', flat=True)), 6)
+
+        # Adding 5 adds them to what is left
+        response = edit(countInStock=15)
+        self.assertEqual(sum(StockStripe.objects.values_list('count', flat=True)), 11)
+        self.assertEqual(response.data['countInStock'], 11)
+
+    def test_unstriping_merges_the_stock_back(self):
+        stripe_stock(self.book._id, 3)
+        self.place(self.book, 1)
+        stripe_stock(self.book._id, 0)
+        self.assertFalse(StockStripe.objects.exists())
+        self.assertEqual(self.stock(), 4)
+
+        # A hold from a stripe goes back to countInStock
+        self.expire_holds()
+        self.assertEqual(self.stock(), 5)
+
+    def test_sweep_command(self):
+        self.place(self.book, 2)
+        StockReservation.objects.update(expiresAt=timezone.now() - timedelta(seconds=1))
+        out = StringIO()
+        call_command('sweep_reservations', stdout=out)
+        self.assertIn('Released 1 expired reservations', out.getvalue())
+        self.assertEqual(self.stock(), 5)
+
+
+class IdempotencyKeyTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='user@sdu.kz', email='user@sdu.kz', password='user')
+        self.book = Product.objects.create(name='Яхина Г.: Эйзен', price=7450.00, countInStock=5)
+        self.client.force_authenticate(self.user)
+        self.data = {
+            'orderItems': [{'product': self.book._id, 'qty': 1, 'price': self.book.price}],
+            'shippingAddress': {'address': 'Kurmangazy 15', 'city': 'Almaty', 'postalCode': '050081',
+                                'country': 'Kazakhstan'},
+            'paymentMethod': 'PayPal', 'taxPrice': 0, 'shippingPrice': 0, 'totalPrice': 7450.00,
+        }
+
+    def place(self, key, data=None):
+        return self.client.post(reverse('orders-add'), data or self.data, format='json',
+                                headers={'Idempotency-Key': key})
+
+    def test_retry_replays_the_first_order(self):
+        first = self.place('checkout-1')
+        retry = self.place('checkout-1')
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertFalse(first.has_header('Idempotent-Replayed'))
+
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Product.objects.get(_id=self.book._id).countInStock, 4)
+
+        # Without a key, or with another one, a new order is placed
+        self.client.post(reverse('orders-add'), self.data, format='json')
+        self.place('checkout-2')
+        self.assertEqual(Order.objects.count(), 3)
+
+    def test_keys_belong_to_one_user(self):
+        self.place('checkout-1')
+        other = User.objects.create_user(username='other@sdu.kz', password='pass')
+        self.client.force_authenticate(other)
+        self.assertNotIn('Idempotent-Replayed', self.place('checkout-1'))
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_key_reused_for_another_request(self):
+        self.place('checkout-1')
+        response = self.place('checkout-1', {**self.data, 'totalPrice': 1})
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_payment_retry(self):
+        order_id = self.place('checkout-1').data['_id']
+        url = reverse('pay', kwargs={'pk': order_id})
+        first = self.client.put(url, headers={'Idempotency-Key': 'pay-1'})
+        retry = self.client.put(url, headers={'Idempotency-Key': 'pay-1'})
+        self.assertEqual((first.data, retry.data), ('Order was paid', 'Order was paid'))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(IdempotencyKey.objects.get(key='pay-1').statusCode, 200)
+
+    def test_server_errors_are_not_stored(self):
+        with mock.patch('base.views.order_views.place_order', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.place('checkout-1')
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.place('checkout-1').status_code, status.HTTP_200_OK)
+
+    def in_flight(self):
+        """Place an order, then make its key look like the first request is
+        still running."""
+        response = self.place('checkout-1')
+        IdempotencyKey.objects.update(statusCode=None, response=None)
+        return response
+
+    def test_concurrent_duplicate_gets_conflict_at_once(self):
+        first = self.in_flight()
+        with mock.patch('time.sleep') as sleep:
+            response = self.place('checkout-1')
+        sleep.assert_not_called()
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(Order.objects.count(), 1)
+
+        # Once the first request has finished, the retry gets its response
+        IdempotencyKey.objects.update(statusCode=200, response=first.json())
+        response = self.place('checkout-1')
+        self.assertEqual(response.json(), first.json())
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+
+    def test_abandoned_and_expired_keys_run_again(self):
+        self.in_flight()
+        IdempotencyKey.objects.update(createdAt=timezone.now() - timedelta(minutes=5))
+        self.assertNotIn('Idempotent-Replayed', self.place('checkout-1'))
+        self.assertEqual(Order.objects.count(), 2)
+
+        IdempotencyKey.objects.update(expiresAt=timezone.now() - timedelta(seconds=1))
+        self.assertNotIn('Idempotent-Replayed', self.place('checkout-1'))
+        self.assertEqual(Order.objects.count(), 3)
+
+        IdempotencyKey.objects.update(expiresAt=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(prune_expired(), 1)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
@@ -1,6 +1,27 @@
-from base.models import Product
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from PIL import Image
+
+from base.inventory import take_stock
+from base.metrics import is_app_query
+from base.models import Product, Review
+from base.pagination import encode_cursor
+from base.reviews import rebuild_review_aggregates
+from base.uploads import atomic_uploads, queue_image_upload
+from base.workers import shutdown as shutdown_workers
+from django.core.management import call_command
 from rest_framework.test import APITestCase, APIClient
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import InMemoryStorage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from django.db import DatabaseError, connection, transaction
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 
@@ -60,6 +81,11 @@ class ProductListTest(APITestCase):
         self.assertIn('description', product)
         self.assertIn('price', product)
 
+    def test_bookkeeping_columns_are_not_exposed(self):
+        product = self.client.get(reverse('products')).data['products'][0]
+        for field in ('ratingSum', 'score', 'stockStripes'):
+            self.assertNotIn(field, product)
+
 
 class SingleProductTest(APITestCase):
 
@@ -194,3 +220,601 @@ class ProductDeleteTest(APITestCase):
         self.assertTrue(Product.objects.filter(_id=self.product._id).exists())
 
 
+
+
+class ProductSearchTest(APITestCase):
+
+    def setUp(self):
+        # Anonymous requests are throttled through the shared cache
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.camera = Product.objects.create(
+            user=self.user,
+            name="Cannon EOS 80D DSLR Camera",
+            brand="Cannon",
+            category="Electronics",
+            description="Characterized by versatile imaging specs",
+            price=100.0,
+            countInStock=10
+        )
+        self.mouse = Product.objects.create(
+            user=self.user,
+            name="Logitech G-Series Gaming Mouse",
+            brand="Logitech",
+            category="Electronics",
+            description="Works well with any camera setup",
+            price=50.0,
+            countInStock=10
+        )
+        self.url = reverse('products')
+
+    def tearDown(self):
+        cache.clear()
+
+    def search(self, keyword):
+        response = self.client.get(self.url, {'keyword': keyword})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [p['_id'] for p in response.data['products']]
+
+    def test_search_matches_brand_and_description(self):
+        self.assertEqual(self.search('logitech'), [self.mouse._id])
+        self.assertEqual(self.search('versatile'), [self.camera._id])
+
+    def test_search_matches_word_prefix(self):
+        self.assertEqual(self.search('Gam'), [self.mouse._id])
+
+    def test_search_ranks_name_matches_first(self):
+        self.assertEqual(self.search('camera'), [self.camera._id, self.mouse._id])
+
+    def test_search_index_follows_updates(self):
+        self.mouse.name = "Wireless Trackball"
+        self.mouse.save()
+        self.assertEqual(self.search('gaming'), [])
+        self.assertEqual(self.search('trackball'), [self.mouse._id])
+
+
+class ProductCursorPaginationTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.products = [
+            Product.objects.create(user=self.user, name=f"Product {i}", price=10.0 * i, countInStock=1)
+            for i in range(10)
+        ]
+        self.url = reverse('products')
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_cursor_pages_walk_forward_and_back(self):
+        response = self.client.get(self.url, {'cursor': '', 'count': 'exact'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        first = [p['_id'] for p in response.data['products']]
+        self.assertEqual(first, [p._id for p in reversed(self.products)][:8])
+        self.assertIsNone(response.data['prev'])
+        self.assertEqual(response.data['count'], 10)
+
+        response = self.client.get(self.url, {'cursor': response.data['next']})
+        second = [p['_id'] for p in response.data['products']]
+        self.assertEqual(second, [self.products[1]._id, self.products[0]._id])
+        self.assertIsNone(response.data['next'])
+
+        response = self.client.get(self.url, {'cursor': response.data['prev']})
+        self.assertEqual([p['_id'] for p in response.data['products']], first)
+        self.assertIsNone(response.data['prev'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_cursor_with_values_of_the_wrong_type(self):
+        for sort, values in (('', ['abc']), ('createdAt', ['yesterday', 1]), ('price', [{'a': 1}, 1])):
+            cursor = encode_cursor(values)
+            response = self.client.get(self.url, {'cursor': cursor, 'sort': sort})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, sort)
+
+    def test_cursor_pages_follow_search_ranking(self):
+        response = self.client.get(self.url, {'cursor': '', 'keyword': 'product'})
+        ids = [p['_id'] for p in response.data['products']]
+        response = self.client.get(self.url, {'cursor': response.data['next'], 'keyword': 'product'})
+        ids += [p['_id'] for p in response.data['products']]
+        self.assertEqual(sorted(ids), sorted(p._id for p in self.products))
+
+
+class ProductReviewTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='reviewer', password='testpass')
+        self.product = Product.objects.create(user=self.user, name="Test Product", price=100.0)
+        self.client.force_authenticate(self.user)
+        self.url = reverse('create-review', args=[self.product._id])
+
+    def test_review_updates_aggregates(self):
+        other = User.objects.create_user(username='other', password='testpass')
+        Review.objects.create(user=other, product=self.product, rating=5)
+        rebuild_review_aggregates()
+
+        response = self.client.post(self.url, {'rating': 2, 'comment': 'meh'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.numReviews, 2)
+        self.assertEqual(self.product.ratingSum, 7)
+        self.assertEqual(float(self.product.rating), 3.5)
+
+    def test_second_review_is_rejected(self):
+        self.client.post(self.url, {'rating': 4, 'comment': 'good'}, format='json')
+        response = self.client.post(self.url, {'rating': 1, 'comment': 'again'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['detail'], 'Product already reviewed')
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.numReviews, 1)
+        self.assertEqual(float(self.product.rating), 4)
+
+    def test_rebuild_command(self):
+        Review.objects.create(user=self.user, product=self.product, rating=3)
+        call_command('rebuild_review_aggregates', stdout=StringIO())
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.numReviews, 1)
+        self.assertEqual(float(self.product.rating), 3)
+
+
+class ProductReviewListTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(name="Test Product", price=100.0, numReviews=12)
+        self.reviews = [
+            Review.objects.create(
+                product=self.product,
+                user=User.objects.create_user(username=f'user{i}', password='testpass'),
+                rating=5,
+                comment=f'Review {i}',
+            )
+            for i in range(12)
+        ]
+        self.url = reverse('create-review', args=[self.product._id])
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_reviews_are_paginated_newest_first(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 12)
+        self.assertEqual(len(response.data['reviews']), 10)
+        self.assertEqual(response.data['reviews'][0]['_id'], self.reviews[-1]._id)
+
+        response = self.client.get(self.url, {'cursor': response.data['next']})
+        self.assertEqual([r['_id'] for r in response.data['reviews']],
+                         [self.reviews[1]._id, self.reviews[0]._id])
+        self.assertIsNone(response.data['next'])
+
+    def test_listing_does_not_embed_reviews(self):
+        response = self.client.get(reverse('products'))
+        self.assertNotIn('reviews', response.data['products'][0])
+
+    def test_unauthenticated_cannot_post_review(self):
+        response = self.client.post(self.url, {'rating': 5, 'comment': 'spam'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class CatalogCacheTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser(username='adminuser', password='adminpass')
+        self.product = Product.objects.create(user=self.admin, name="Test Product", brand="Brand", price=100.0)
+        self.url = reverse('product', args=[self.product._id])
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_repeated_read_is_served_from_cache(self):
+        self.assertEqual(self.client.get(self.url)['X-Cache'], 'MISS')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        # Neither the body nor its ETag touch the tables, Silk's own request logging aside
+        selects = [q for q in queries if q['sql'].startswith('SELECT') and 'base_' in q['sql']]
+        self.assertEqual(selects, [])
+        self.assertEqual(response.data['name'], "Test Product")
+
+    def test_update_invalidates_cached_reads(self):
+        self.client.get(self.url)
+        self.client.force_authenticate(self.admin)
+        self.client.put(reverse('update_product', args=[self.product._id]), {
+            'name': 'Renamed', 'price': 120, 'brand': 'Brand',
+            'countInStock': 3, 'category': 'Books', 'description': '',
+        }, format='json')
+
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['name'], 'Renamed')
+
+    def test_matching_etag_answers_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=60')
+        etag = response['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        Product.objects.filter(_id=self.product._id).update(name='Renamed')
+        self.product.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    @override_settings(CATALOG_ETAGS=False)
+    def test_no_catalog_etag_without_a_shared_version(self):
+        response = self.client.get(reverse('products'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.has_header('ETag'))
+
+
+class TopProductsTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.users = [User.objects.create_user(username=f'user{i}', password='testpass') for i in range(10)]
+        self.single = self.create_product("One Review", "Books", [5])
+        self.popular = self.create_product("Many Reviews", "Books", [5, 4] * 5)
+        self.gadget = self.create_product("Gadget", "Electronics", [4] * 3)
+        self.unrated = self.create_product("Unrated", "Books", [])
+        self.url = reverse('top-products')
+
+    def tearDown(self):
+        cache.clear()
+
+    def create_product(self, name, category, ratings):
+        product = Product.objects.create(name=name, category=category, price=10.0)
+        for user, rating in zip(self.users, ratings):
+            self.client.force_authenticate(user)
+            self.client.post(reverse('create-review', args=[product._id]),
+                             {'rating': rating, 'comment': ''}, format='json')
+        self.client.force_authenticate(None)
+        return product
+
+    def test_weighted_score_ranks_established_products_first(self):
+        response = self.client.get(self.url)
+        self.assertEqual([p['_id'] for p in response.data],
+                         [self.popular._id, self.single._id, self.gadget._id])
+
+    def test_poorly_rated_products_stay_off_the_leaderboard(self):
+        panned = self.create_product("Panned", "Books", [1] * 10)
+        self.assertGreater(Product.objects.get(_id=panned._id).score, 0)
+        response = self.client.get(self.url)
+        self.assertNotIn(panned._id, [p['_id'] for p in response.data])
+
+    def test_leaderboard_per_category(self):
+        response = self.client.get(self.url, {'category': 'Electronics'})
+        self.assertEqual([p['_id'] for p in response.data], [self.gadget._id])
+
+    def test_rebuild_matches_incremental_scores(self):
+        scores = dict(Product.objects.values_list('_id', 'score'))
+        rebuild_review_aggregates()
+        for pid, score in Product.objects.values_list('_id', 'score'):
+            self.assertAlmostEqual(score, scores[pid])
+
+
+class ProductFacetTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.phone = Product.objects.create(name="Phone", brand="Apple", category="Electronics",
+                                            price=5000, countInStock=3, rating=4.5)
+        self.laptop = Product.objects.create(name="Laptop", brand="Apple", category="Electronics",
+                                             price=60000, countInStock=0, rating=3.0)
+        self.tv = Product.objects.create(name="TV", brand="Sony", category="Electronics",
+                                         price=70000, countInStock=2, rating=4.0)
+        self.console = Product.objects.create(name="Console", brand="Sony", category="Games",
+                                              price=300000, countInStock=5, rating=5.0)
+
+    def tearDown(self):
+        cache.clear()
+
+    def names(self, params):
+        response = self.client.get(reverse('products'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [product['name'] for product in response.data['products']]
+
+    def test_filters(self):
+        self.assertEqual(self.names({'category': 'Games'}), ['Console'])
+        self.assertEqual(self.names({'brand': ['Apple', 'Sony'], 'category': 'Electronics'}),
+                         ['TV', 'Laptop', 'Phone'])
+        self.assertEqual(self.names({'minPrice': '6000', 'maxPrice': '70000'}), ['TV', 'Laptop'])
+        self.assertEqual(self.names({'minRating': '4.5'}), ['Console', 'Phone'])
+        self.assertEqual(self.names({'inStock': 'true', 'brand': 'Apple'}), ['Phone'])
+
+    def test_sorts(self):
+        self.assertEqual(self.names({'sort': 'price'}), ['Phone', 'Laptop', 'TV', 'Console'])
+        self.assertEqual(self.names({'sort': '-rating'}), ['Console', 'Phone', 'TV', 'Laptop'])
+        self.assertEqual(self.names({'sort': '-price', 'keyword': 'tv'}), ['TV'])
+
+        response = self.client.get(reverse('products'), {'sort': 'price', 'cursor': ''})
+        self.assertEqual([p['name'] for p in response.data['products']], ['Phone', 'Laptop', 'TV', 'Console'])
+
+    def test_invalid_filters(self):
+        for params in ({'minPrice': 'cheap'}, {'minRating': 'nan'}, {'sort': 'name'},
+                       {'inStock': 'maybe'}, {'facets': 'maybe'}):
+            response = self.client.get(reverse('products'), params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+    def test_facet_counts_ignore_their_own_selection(self):
+        response = self.client.get(reverse('products'), {'brand': 'Apple', 'facets': 'true'})
+        facets = response.data['facets']
+
+        self.assertEqual(facets['brand'], [{'value': 'Apple', 'count': 2}, {'value': 'Sony', 'count': 2}])
+        self.assertEqual(facets['category'], [{'value': 'Electronics', 'count': 2}])
+        self.assertEqual([bucket['count'] for bucket in facets['price']], [1, 0, 1, 0, 0, 0])
+        self.assertEqual(facets['price'][0], {'min': 0, 'max': 10000, 'count': 1})
+        self.assertEqual(facets['price'][-1], {'min': 500000, 'max': None, 'count': 0})
+
+    def test_products_without_a_price_have_no_price_bucket(self):
+        Product.objects.create(name="Preorder", brand="Sony", category="Games", price=None)
+        facets = self.client.get(reverse('products'), {'facets': 'true'}).data['facets']
+
+        self.assertEqual([bucket['count'] for bucket in facets['price']], [1, 0, 2, 0, 1, 0])
+        self.assertEqual(facets['brand'], [{'value': 'Sony', 'count': 3}, {'value': 'Apple', 'count': 2}])
+
+    def test_facets_follow_other_filters(self):
+        response = self.client.get(reverse('products'), {
+            'inStock': 'true', 'category': 'Electronics', 'maxPrice': '100000', 'facets': 'true',
+        })
+        facets = response.data['facets']
+
+        self.assertEqual(facets['category'], [{'value': 'Electronics', 'count': 2}])
+        self.assertEqual(facets['brand'], [{'value': 'Apple', 'count': 1}, {'value': 'Sony', 'count': 1}])
+        self.assertEqual(sum(bucket['count'] for bucket in facets['price']), 2)
+
+    def product_queries(self, params):
+        queries = []
+
+        def record(execute, sql, params, many, context):
+            if 'base_product' in sql and is_app_query(sql):
+                queries.append(sql)
+            return execute(sql, params, many, context)
+
+        cache.clear()
+        with connection.execute_wrapper(record):
+            response = self.client.get(reverse('products'), params)
+        return response, queries
+
+    def test_facets_take_one_query(self):
+        response, plain = self.product_queries({'brand': 'Sony'})
+        self.assertNotIn('facets', response.data)
+
+        response, faceted = self.product_queries({'brand': 'Sony', 'facets': 'true'})
+        self.assertIn('facets', response.data)
+        self.assertEqual(len(faceted), len(plain) + 1)
+        self.assertIn('GROUP BY', faceted[-1])
+
+    def test_async_listing_matches(self):
+        params = {'brand': 'Apple', 'sort': '-price', 'facets': 'true'}
+        sync = self.client.get(reverse('products'), params)
+        async_ = self.client.get(reverse('async-products'), params)
+        self.assertEqual(async_.json(), sync.json())
+
+        response = self.client.get(reverse('async-products'), {'minPrice': 'cheap'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class AsyncCatalogViewsTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='reviewer', password='testpass')
+        for i in range(10):
+            Product.objects.create(name=f"Phone {i}", category="Electronics", price=10.0 + i)
+        self.product = Product.objects.create(name="Reviewed", price=5.0)
+        Review.objects.create(product=self.product, user=self.user, name='reviewer', rating=4, comment='ok')
+        rebuild_review_aggregates()
+
+    def tearDown(self):
+        cache.clear()
+
+    def assertSameAsSync(self, name, *args, params=None):
+        sync = self.client.get(reverse(name, args=args), params)
+        async_ = self.client.get(reverse(f'async-{name}', args=args), params)
+        self.assertEqual(async_.status_code, sync.status_code)
+        self.assertEqual(async_.json(), sync.json())
+        self.assertEqual(async_['Cache-Control'], sync['Cache-Control'])
+        return async_
+
+    def test_listing_matches_sync_view(self):
+        self.assertSameAsSync('products')
+        self.assertSameAsSync('products', params={'page': 2})
+        response = self.assertSameAsSync('products', params={'cursor': '', 'count': 'exact'})
+        self.assertSameAsSync('products', params={'cursor': response.json()['next']})
+        self.assertSameAsSync('products', params={'keyword': 'phone'})
+
+    def test_detail_and_top_match_sync_views(self):
+        response = self.assertSameAsSync('product', self.product._id)
+        self.assertEqual(len(response.json()['reviews']), 1)
+        self.assertSameAsSync('top-products')
+
+    def test_conditional_and_cached_reads(self):
+        url = reverse('async-product', args=[self.product._id])
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+
+        response = self.client.get(reverse('async-product', args=[0]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+# Image tests write to memory, not to the S3 bucket of the settings
+IN_MEMORY_STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.InMemoryStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+@override_settings(IMAGE_VARIANT_WORKERS=0, STORAGES=IN_MEMORY_STORAGES)
+class ProductImageVariantsTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser(username='adminuser', password='adminpass')
+        self.product = Product.objects.create(user=self.admin, name="Camera", price=100.0)
+        self.client.force_authenticate(self.admin)
+
+    def tearDown(self):
+        cache.clear()
+
+    def upload(self, name, size):
+        buffer = BytesIO()
+        Image.new('RGB', size, 'red').save(buffer, 'PNG')
+        image = SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('upload_image'),
+                                        {'product_id': self.product._id, 'image': image})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.product.refresh_from_db()
+
+    def test_upload_generates_webp_variants(self):
+        self.upload('camera.png', (800, 600))
+        self.assertEqual(sorted(self.product.imageVariants, key=int), ['160', '320', '640'])
+
+        with default_storage.open(self.product.imageVariants['320']) as f:
+            variant = Image.open(f)
+            self.assertEqual(variant.format, 'WEBP')
+            self.assertEqual(variant.size, (320, 240))
+
+        response = self.client.get(reverse('product', args=[self.product._id]))
+        self.assertEqual(list(response.data['imageVariants']), ['160', '320', '640'])
+        self.assertIn(' 160w, ', response.data['imageSrcset'])
+
+    def test_new_upload_replaces_variants(self):
+        self.upload('first.png', (800, 600))
+        old = set(self.product.imageVariants.values())
+        self.upload('second.png', (400, 400))
+
+        self.assertEqual(sorted(self.product.imageVariants, key=int), ['160', '320'])
+        for path in old:
+            self.assertFalse(default_storage.exists(path))
+
+    def test_small_image_has_no_variants(self):
+        self.upload('icon.png', (100, 100))
+        self.assertEqual(self.product.imageVariants, {})
+        response = self.client.get(reverse('products'))
+        self.assertEqual(response.data['products'][0]['imageSrcset'], '')
+
+    # The writes standing in for other requests count towards this one
+    @override_settings(QUERY_BUDGET_ACTION='off')
+    def test_upload_keeps_stock_taken_meanwhile(self):
+        Product.objects.filter(_id=self.product._id).update(countInStock=5, numReviews=1)
+        store = InMemoryStorage.save
+
+        def save(storage, name, content, **kwargs):
+            # A checkout and a review land while the file is being stored
+            take_stock({self.product._id: self.product}, {self.product._id: 2})
+            Product.objects.filter(_id=self.product._id).update(numReviews=2)
+            return store(storage, name, content, **kwargs)
+
+        with mock.patch.object(InMemoryStorage, 'save', save):
+            self.upload('icon.png', (100, 100))
+        self.assertTrue(self.product.image)
+        self.assertEqual((self.product.countInStock, self.product.numReviews), (3, 2))
+
+
+@override_settings(STORAGES=IN_MEMORY_STORAGES)
+class BackgroundImageUploadTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.spool = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.spool, ignore_errors=True)
+        settings = override_settings(
+            IMAGE_UPLOAD_MODE='background', IMAGE_UPLOAD_SPOOL_DIR=self.spool, IMAGE_UPLOAD_WORKERS=0,
+            IMAGE_UPLOAD_RETRY_DELAY=0, IMAGE_VARIANT_WORKERS=0,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.admin = User.objects.create_superuser(username='adminuser', password='adminpass')
+        self.product = Product.objects.create(user=self.admin, name="Camera", price=100.0)
+        self.client.force_authenticate(self.admin)
+
+    def tearDown(self):
+        cache.clear()
+
+    def post(self):
+        buffer = BytesIO()
+        Image.new('RGB', (400, 300), 'blue').save(buffer, 'PNG')
+        image = SimpleUploadedFile('camera.png', buffer.getvalue(), content_type='image/png')
+        return self.client.post(reverse('upload_image'), {'product_id': self.product._id, 'image': image})
+
+    def upload(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post()
+        self.product.refresh_from_db()
+        return response
+
+    def test_upload_is_acknowledged_then_stored(self):
+        response = self.upload()
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertTrue(self.product.image.name.startswith('images/camera'))
+        self.assertTrue(default_storage.exists(self.product.image.name))
+        self.assertEqual(sorted(self.product.imageVariants, key=int), ['160', '320'])
+        self.assertEqual(os.listdir(self.spool), [])
+
+    def test_transient_storage_errors_are_retried(self):
+        save = default_storage.save
+        failures = iter([OSError('timeout'), OSError('timeout')])
+
+        def flaky_save(name, content, **kwargs):
+            error = next(failures, None)
+            if error:
+                raise error
+            return save(name, content, **kwargs)
+
+        with mock.patch.object(default_storage, 'save', side_effect=flaky_save):
+            self.upload()
+        self.assertTrue(self.product.image.name.startswith('images/camera'))
+
+    def test_spooled_file_is_kept_when_storage_keeps_failing(self):
+        with mock.patch.object(default_storage, 'save', side_effect=OSError('down')), \
+                self.assertLogs('base.uploads', level='ERROR'):
+            response = self.upload()
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(self.product.image.name, '/images/placeholder.png')
+        self.assertEqual(len(os.listdir(self.spool)), 1)
+
+    @override_settings(IMAGE_UPLOAD_MAX_PENDING=1)
+    def test_queue_slot_is_taken_before_commit_and_given_back_on_rollback(self):
+        with self.assertRaises(DatabaseError), atomic_uploads():
+            self.assertEqual(self.post().status_code, status.HTTP_202_ACCEPTED)
+            # The first upload holds the only slot, so this one is stored at once
+            self.assertEqual(self.post().status_code, status.HTTP_200_OK)
+            self.assertEqual(len(os.listdir(self.spool)), 1)
+            raise DatabaseError('rolled back')
+
+        self.assertEqual(os.listdir(self.spool), [])
+        self.assertEqual(self.upload().status_code, status.HTTP_202_ACCEPTED)
+
+    def test_inline_store_errors_are_logged_not_raised(self):
+        with mock.patch('base.uploads.run_variants', side_effect=RuntimeError('boom')), \
+                self.assertLogs('base.uploads', level='ERROR'):
+            response = self.upload()
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+    @override_settings(IMAGE_UPLOAD_WORKERS=1)
+    def test_background_store_errors_are_logged(self):
+        with mock.patch.object(Product.objects, 'filter', side_effect=DatabaseError('gone')), \
+                self.assertLogs('base.workers', level='ERROR') as logs:
+            response = self.upload()
+            shutdown_workers()
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertIn('store_spooled_image', logs.output[0])
+        self.assertIn('DatabaseError: gone', logs.output[0])
+
+    def test_plain_transactions_store_synchronously(self):
+        with transaction.atomic():
+            self.assertFalse(queue_image_upload(self.product, SimpleUploadedFile('camera.png', b'')))
+        self.assertEqual(os.listdir(self.spool), [])
@@ -0,0 +1,72 @@
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from rest_framework.test import APITestCase
+
+from base.models import Order, OrderItem, Product, Review, ShippingAddress
+from base.reviews import rebuild_review_aggregates
+
+
+## seed_data tests
+class SeedDataTest(APITestCase):
+
+    def seed(self, **options):
+        options = {'users': 20, 'products': 30, 'reviews': 3, 'orders': 25, 'batch_size': 7,
+                   'until': '2025-01-31', **options}
+        call_command('seed_data', stdout=StringIO(), **options)
+
+    def snapshot(self):
+        return (
+            list(User.objects.order_by('id').values_list('first_name', 'date_joined')),
+            list(Product.objects.order_by('_id').values_list('name', 'price', 'countInStock', 'createdAt')),
+            list(Review.objects.order_by('_id').values_list('rating', 'comment')),
+            list(Order.objects.order_by('_id').values_list('totalPrice', 'isPaid', 'createdAt')),
+            list(OrderItem.objects.order_by('_id').values_list('name', 'qty', 'price')),
+        )
+
+    def test_creates_related_rows(self):
+        self.seed()
+
+        self.assertEqual(User.objects.count(), 20)
+        self.assertEqual(Product.objects.count(), 30)
+        self.assertEqual(Order.objects.count(), 25)
+        self.assertEqual(ShippingAddress.objects.count(), 25)
+        self.assertTrue(Review.objects.exists())
+        self.assertFalse(OrderItem.objects.filter(order__isnull=True).exists())
+        self.assertFalse(Order.objects.filter(orderitem__isnull=True).exists())
+        self.assertTrue(User.objects.first().check_password('seed-pass'))
+
+    def test_review_aggregates_match_reviews(self):
+        self.seed()
+        seeded = list(Product.objects.order_by('_id').values_list('numReviews', 'ratingSum', 'rating', 'score'))
+
+        rebuild_review_aggregates()
+        rebuilt = list(Product.objects.order_by('_id').values_list('numReviews', 'ratingSum', 'rating', 'score'))
+
+        for before, after in zip(seeded, rebuilt):
+            self.assertEqual(before[:3], after[:3])
+            self.assertAlmostEqual(before[3], after[3])
+
+    def test_same_seed_same_data(self):
+        self.seed(seed=5)
+        first = self.snapshot()
+        for model in (OrderItem, ShippingAddress, Order, Review, Product, User):
+            model.objects.all().delete()
+
+        self.seed(seed=5)
+        self.assertEqual(self.snapshot(), first)
+
+        Product.objects.all().delete()
+        self.seed(seed=6, users=0, reviews=0, orders=0)
+        self.assertNotEqual(self.snapshot()[1], first[1])
+
+    def test_new_rows_can_be_created_after_seeding(self):
+        self.seed()
+        product = Product.objects.create(name='After', price=1)
+        self.assertGreater(product._id, Product.objects.exclude(_id=product._id).order_by('-_id').first()._id)
+
+    def test_orders_need_users_and_products(self):
+        with self.assertRaises(CommandError):
+            self.seed(users=0)
@@ -0,0 +1,100 @@
+import os
+import tempfile
+import threading
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from base.throttling import LocalStore, SQLiteStore, gcra, get_store
+
+
+## throttling tests
+@override_settings(THROTTLE_STORE='local')
+class ThrottleTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user(username='dana@sdu.kz', email='dana@sdu.kz', password='user')
+        self.login = {'username': 'dana@sdu.kz', 'password': 'user'}
+        patcher = mock.patch('base.throttling.time')
+        self.clock = patcher.start()
+        self.clock.time.return_value = 1000.0
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_login_has_its_own_stricter_rate(self):
+        for _ in range(5):
+            response = self.client.post(reverse('login'), self.login, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.post(reverse('login'), self.login, format='json')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        # 5/minute refills a token every 12 seconds
+        self.assertEqual(response['Retry-After'], '12')
+
+        # Other routes still have the anon budget left
+        self.assertEqual(self.client.get(reverse('products')).status_code, status.HTTP_200_OK)
+
+    def test_tokens_refill_over_time(self):
+        for _ in range(6):
+            response = self.client.post(reverse('login'), self.login, format='json')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+        self.clock.time.return_value = 1012.0
+        response = self.client.post(reverse('login'), self.login, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.post(reverse('login'), self.login, format='json')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_async_views_are_throttled(self):
+        for _ in range(10):
+            self.assertEqual(self.client.get(reverse('async-products')).status_code, status.HTTP_200_OK)
+
+        response = self.client.get(reverse('async-products'))
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '6')
+
+
+class TokenBucketTest(APITestCase):
+
+    def test_full_bucket_allows_a_burst(self):
+        # 3 per 30 seconds: a token every 10 seconds, bursts of 3
+        tat = None
+        for _ in range(3):
+            tat, wait = gcra(tat, 100.0, 10, 20)
+            self.assertEqual(wait, 0)
+        self.assertEqual(gcra(tat, 100.0, 10, 20), (None, 10))
+        self.assertEqual(gcra(tat, 104.0, 10, 20), (None, 6))
+        self.assertEqual(gcra(tat, 110.0, 10, 20), (140.0, 0))
+
+    def test_sqlite_buckets_are_shared_between_connections(self):
+        path = os.path.join(tempfile.mkdtemp(), 'throttle.sqlite3')
+        stores = [SQLiteStore(path) for _ in range(4)]
+        allowed = []
+
+        def worker(store):
+            for _ in range(25):
+                if not store.take('throttle_anon_1', 60 / 20, 60 - 60 / 20):
+                    allowed.append(1)
+
+        threads = [threading.Thread(target=worker, args=(store,)) for store in stores]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(allowed), 20)
+        self.assertGreater(SQLiteStore(path).take('throttle_anon_1', 3, 57), 0)
+
+    def test_store_follows_the_settings(self):
+        path = os.path.join(tempfile.mkdtemp(), 'throttle.sqlite3')
+        with override_settings(THROTTLE_STORE='sqlite', THROTTLE_SQLITE_PATH=path):
+            self.assertIsInstance(get_store(), SQLiteStore)
+        self.assertIsInstance(get_store(), LocalStore)
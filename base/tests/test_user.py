@@ -3,6 +3,12 @@ from django.contrib.auth.models import User
 from rest_framework import status
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.urls import reverse
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from base.authentication import CachedJWTAuthentication, user_cache
 
 
 ## user tests
@@ -66,6 +72,7 @@ class UserProfileTest(APITestCase):
         self.access_token = str(refresh.access_token)
 
         self.profile_url = reverse('user_profile')
+        self.orders_url = reverse('myorders')
 
     def test_get_user_profile_authenticated(self):
         # Include Authorization header
@@ -81,3 +88,117 @@ class UserProfileTest(APITestCase):
     def test_get_user_profile_unauthenticated(self):
         response = self.client.get(self.profile_url)
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class UserListTest(APITestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_user(
+            username='admin@sdu.kz',
+            email='admin@sdu.kz',
+            password='admin',
+            is_staff=True
+        )
+        for name in ('aigerim', 'aibek', 'dana'):
+            User.objects.create_user(username=f'{name}@sdu.kz', email=f'{name}@sdu.kz', password='user')
+        self.client.force_authenticate(self.admin)
+        self.url = reverse('users')
+
+    def test_filter_by_email_prefix_and_staff(self):
+        response = self.client.get(self.url, {'email': 'ai', 'sort': 'username'})
+        self.assertEqual([u['email'] for u in response.data], ['aibek@sdu.kz', 'aigerim@sdu.kz'])
+
+        response = self.client.get(self.url, {'staff': 'true'})
+        self.assertEqual([u['email'] for u in response.data], ['admin@sdu.kz'])
+
+    def test_cursor_pagination(self):
+        response = self.client.get(self.url, {'cursor': '', 'limit': 3})
+        self.assertEqual(len(response.data['users']), 3)
+        response = self.client.get(self.url, {'cursor': response.data['next'], 'limit': 3})
+        self.assertEqual([u['email'] for u in response.data['users']], ['dana@sdu.kz'])
+        self.assertIsNone(response.data['next'])
+
+
+@override_settings(AUTH_USER_CACHE='auth', CACHES={
+    **settings.CACHES, 'auth': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'auth'},
+})
+class CachedAuthenticationTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        user_cache().clear()
+        self.admin = User.objects.create_user(username='admin@sdu.kz', email='admin@sdu.kz', is_staff=True)
+        self.user = User.objects.create_user(username='dana@sdu.kz', email='dana@sdu.kz', password='user')
+        token = str(RefreshToken.for_user(self.user).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + token)
+        self.profile_url = reverse('user_profile')
+        self.orders_url = reverse('myorders')
+
+    def tearDown(self):
+        cache.clear()
+        user_cache().clear()
+
+    def user_lookups(self, url=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url or self.orders_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, [q for q in queries if q['sql'].startswith('SELECT "auth_user"')]
+
+    def test_second_request_skips_user_query(self):
+        _, lookups = self.user_lookups()
+        self.assertEqual(len(lookups), 1)
+        _, lookups = self.user_lookups()
+        self.assertEqual(lookups, [])
+
+    def test_only_permission_fields_are_cached(self):
+        self.user_lookups()
+        entry = user_cache().get(f'auth:user:{self.user.id}')
+        self.assertEqual(entry, {'is_active': True, 'is_staff': False, 'is_superuser': False})
+
+        # Other fields are loaded together on first use
+        response, lookups = self.user_lookups(self.profile_url)
+        self.assertEqual(len(lookups), 1)
+        self.assertEqual(response.data['email'], 'dana@sdu.kz')
+
+    def test_cached_user_keeps_its_flags(self):
+        self.user_lookups()
+        request = self.client.get(self.orders_url).wsgi_request
+        self.assertEqual(self.user_lookups()[1], [])
+        user = CachedJWTAuthentication().authenticate(request)[0]
+        self.assertEqual((user.pk, user.is_active, user.is_staff, user.is_superuser),
+                         (self.user.pk, True, False, False))
+
+    def test_profile_update_keeps_flags(self):
+        self.user_lookups()
+        response = self.client.put(reverse('user_profile_update'),
+                                   {'name': 'Dana', 'email': 'dana@sdu.kz', 'password': ''}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, 'Dana')
+        self.assertEqual((self.user.is_active, self.user.is_staff, self.user.is_superuser), (True, False, False))
+        self.assertTrue(self.user.check_password('user'))
+        self.user_lookups()
+
+    def test_update_user_invalidates(self):
+        self.user_lookups()
+        admin = self.client_class()
+        admin.force_authenticate(self.admin)
+        admin.put(reverse('updateUser', args=[self.user.id]),
+                  {'name': 'Dana', 'email': 'dana@sdu.kz', 'isAdmin': True}, format='json')
+
+        _, lookups = self.user_lookups()
+        self.assertEqual(len(lookups), 1)
+        self.assertTrue(user_cache().get(f'auth:user:{self.user.id}')['is_staff'])
+
+    def test_deleted_user_is_rejected(self):
+        self.user_lookups()
+        self.user.delete()
+        response = self.client.get(self.orders_url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(AUTH_USER_CACHE=None)
+    def test_cache_can_be_turned_off(self):
+        for _ in range(2):
+            _, lookups = self.user_lookups()
+            self.assertEqual(len(lookups), 1)
@@ -0,0 +1,221 @@
+"""Token-bucket throttles whose state is shared between worker processes.
+
+DRF's throttles keep a list of request times per client in the cache and
+rewrite it on every request. These keep one number per client instead: the
+token bucket in its GCRA form, where the bucket is the "theoretical arrival
+time" of the next request. A rate of N per period refills one token every
+period / N seconds and holds at most N, so N requests can arrive at once.
+
+Each check is a single atomic read-modify-write in the store picked by
+THROTTLE_STORE:
+
+* 'local' - the 'default' cache of this process (locmem), under a lock.
+  Limits are per worker, so for development and tests only.
+* 'sqlite' - a SQLite file (THROTTLE_SQLITE_PATH) shared by the workers of
+  one host, one `BEGIN IMMEDIATE` transaction per check.
+* 'redis' - THROTTLE_REDIS_URL, one Lua script call per check, timed by the
+  Redis clock so every node agrees on it.
+"""
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.settings import api_settings
+from rest_framework.throttling import (
+    AnonRateThrottle, ScopedRateThrottle, SimpleRateThrottle, UserRateThrottle,
+)
+
+
+def gcra(tat, now, interval, burst):
+    """Decide one request against a bucket whose next theoretical arrival is
+    `tat` (None for a full bucket).
+
+    Returns `(new_tat, 0)` when the request is allowed and `(None, wait)`
+    with the seconds until it would be when it is not.
+    """
+    tat = max(tat or now, now)
+    if tat - now > burst:
+        return None, tat - now - burst
+    return tat + interval, 0
+
+
+class LocalStore:
+
+    def __init__(self):
+        self.cache = caches['default']
+        self.lock = threading.Lock()
+
+    def take(self, key, interval, burst):
+        now = time.time()
+        with self.lock:
+            tat, wait = gcra(self.cache.get(key), now, interval, burst)
+            if tat is not None:
+                self.cache.set(key, tat, math.ceil(tat - now))
+        return wait
+
+
+class SQLiteStore:
+    # Rows whose tat has passed are the same as missing ones; every
+    # PRUNE_EVERY checks a connection deletes them
+    PRUNE_EVERY = 1000
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        db = self.connect()
+        db.execute('CREATE TABLE IF NOT EXISTS bucket (key TEXT PRIMARY KEY, tat REAL NOT NULL)')
+        db.close()
+
+    def connect(self):
+        db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        # Losing the last few updates in a crash only refills some buckets
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=OFF')
+        return db
+
+    def connection(self):
+        if getattr(self.local, 'db', None) is None:
+            self.local.db = self.connect()
+            self.local.checks = 0
+        return self.local.db
+
+    def take(self, key, interval, burst):
+        db = self.connection()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            row = db.execute('SELECT tat FROM bucket WHERE key = ?', (key,)).fetchone()
+            tat, wait = gcra(row and row[0], now, interval, burst)
+            if tat is not None:
+                db.execute('INSERT INTO bucket (key, tat) VALUES (?, ?) '
+                           'ON CONFLICT (key) DO UPDATE SET tat = excluded.tat', (key, tat))
+            self.local.checks += 1
+            if self.local.checks % self.PRUNE_EVERY == 0:
+                db.execute('DELETE FROM bucket WHERE tat < ?', (now,))
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        return wait
+
+
+class RedisStore:
+    SCRIPT = """
+    local clock = redis.call('TIME')
+    local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+    local interval, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+    local tat = math.max(tonumber(redis.call('GET', KEYS[1]) or 0), now)
+    if tat - now > burst then
+        return tostring(tat - now - burst)
+    end
+    tat = tat + interval
+    redis.call('SET', KEYS[1], tostring(tat), 'PX', math.ceil((tat - now) * 1000))
+    return '0'
+    """
+
+    def __init__(self, url):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.script = self.client.register_script(self.SCRIPT)
+
+    def take(self, key, interval, burst):
+        return float(self.script(keys=[key], args=[interval, burst]))
+
+
+_store = None
+_lock = threading.Lock()
+
+
+def get_store():
+    """The process-wide store for THROTTLE_STORE, created on first use."""
+    global _store
+    with _lock:
+        if _store is None:
+            _store = _create_store(settings.THROTTLE_STORE)
+        return _store
+
+
+def reset_store():
+    """Drop the store, so the next request creates it from the settings."""
+    global _store
+    with _lock:
+        _store = None
+
+
+def _create_store(name):
+    if name == 'local':
+        return LocalStore()
+    if name == 'sqlite':
+        return SQLiteStore(settings.THROTTLE_SQLITE_PATH)
+    if name == 'redis':
+        return RedisStore(settings.THROTTLE_REDIS_URL)
+    raise ImproperlyConfigured(f"Unknown THROTTLE_STORE {name!r}; use 'local', 'sqlite' or 'redis'")
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """`SimpleRateThrottle` on a token bucket in the shared store. `wait()`
+    is what DRF sends back as the `Retry-After` header."""
+
+    def allow_request(self, request, view):
+        self.retry_after = None
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        interval = self.duration / self.num_requests
+        self.retry_after = get_store().take(self.key, interval, self.duration - interval)
+        return not self.retry_after
+
+    def wait(self):
+        return self.retry_after
+
+
+class AnonThrottle(TokenBucketThrottle, AnonRateThrottle):
+    """The 'anon' rate, per client IP for anonymous requests."""
+
+
+class UserThrottle(TokenBucketThrottle, UserRateThrottle):
+    """The 'user' rate, per user (per IP for anonymous requests)."""
+
+
+class RouteThrottle(TokenBucketThrottle, ScopedRateThrottle):
+    """A rate for a single route, from the DEFAULT_THROTTLE_RATES entry named
+    like the URL pattern (e.g. 'login'); routes without one pass. Counted
+    per user, or per IP for anonymous requests, on top of the anon and user
+    rates."""
+
+    def __init__(self):
+        # The scope is only known once the request has been routed
+        self.rate = None
+
+    def allow_request(self, request, view):
+        match = request.resolver_match
+        scope = match.url_name if match else None
+        if scope not in self.THROTTLE_RATES:
+            return True
+
+        self.scope = scope
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        return super().allow_request(request, view)
+
+
+def check_throttles(request, view=None):
+    """Run the DEFAULT_THROTTLE_CLASSES outside of an APIView, returning the
+    longest wait among those that refuse the request (None if none does)."""
+    waits = []
+    for throttle_class in api_settings.DEFAULT_THROTTLE_CLASSES:
+        throttle = throttle_class()
+        if not throttle.allow_request(request, view):
+            waits.append(throttle.wait())
+    return max(waits, default=None)
@@ -0,0 +1,195 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models.functions import Now
+
+from base.cache import bump_catalog_version
+from base.images import run_variants
+from base.models import Product
+from base.workers import submit
+
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_pending = 0
+# Newest committed upload per product; an older upload finishing late is dropped
+_latest = {}
+# Per thread, the uploads queued in each open `atomic_uploads` block
+_local = threading.local()
+
+
+def queue_image_upload(product, uploaded):
+    """Spool `uploaded` to local disk and store it as `product.image` in the
+    background after the current transaction commits.
+
+    Takes one of IMAGE_UPLOAD_MAX_PENDING slots right away and returns False
+    without queueing when none is left, so the caller can store the file
+    itself. Inside a transaction, uploads are only queued within
+    `atomic_uploads`, which gives the slot and the spooled file back if it
+    rolls back; in any other atomic block this returns False as well.
+    """
+    global _pending
+    blocks = _blocks()
+    if transaction.get_connection().in_atomic_block and not blocks:
+        return False
+    with _lock:
+        if _pending >= settings.IMAGE_UPLOAD_MAX_PENDING:
+            return False
+        _pending += 1
+
+    token = uuid.uuid4().hex
+    try:
+        path = _spool(uploaded, token)
+    except BaseException:
+        _release()
+        raise
+
+    upload = QueuedUpload(product._id, path, uploaded.name, token)
+    if blocks:
+        blocks[-1].append(upload)
+    transaction.on_commit(upload)
+    return True
+
+
+@contextmanager
+def atomic_uploads(using=None):
+    """`transaction.atomic()` for code that queues image uploads.
+
+    When the block rolls back, the uploads queued in it are discarded right
+    away. When it commits inside another `atomic_uploads` block, they are
+    left to that block.
+    """
+    blocks = _blocks()
+    queued = []
+    blocks.append(queued)
+    committed = False
+    try:
+        with transaction.atomic(using=using):
+            yield
+            rolled_back = transaction.get_rollback(using=using)
+        committed = not rolled_back
+    finally:
+        blocks.pop()
+        if not committed:
+            for upload in queued:
+                upload.discard()
+        elif blocks:
+            blocks[-1].extend(queued)
+
+
+def _blocks():
+    if not hasattr(_local, 'blocks'):
+        _local.blocks = []
+    return _local.blocks
+
+
+class QueuedUpload:
+    """The commit callback of a queued upload; `discard` gives back its
+    spooled file and queue slot if the transaction rolls back instead."""
+
+    def __init__(self, product_id, path, original_name, token):
+        self.args = (product_id, path, original_name, token)
+        self.settled = False
+
+    def discard(self):
+        if not self.settled:
+            self.settled = True
+            _discard(self.args[1])
+
+    def __call__(self):
+        self.settled = True
+        product_id, _, _, token = self.args
+        with _lock:
+            _latest[product_id] = token
+        if settings.IMAGE_UPLOAD_WORKERS:
+            submit('image-uploads', settings.IMAGE_UPLOAD_WORKERS, store_spooled_image, *self.args)
+            return
+        # The transaction has committed, so a failure must not fail the request
+        try:
+            store_spooled_image(*self.args)
+        except Exception:
+            logger.exception('Storing the image of product %s failed', product_id)
+
+
+def _spool(uploaded, token):
+    os.makedirs(settings.IMAGE_UPLOAD_SPOOL_DIR, exist_ok=True)
+    path = os.path.join(settings.IMAGE_UPLOAD_SPOOL_DIR, token + os.path.splitext(uploaded.name)[1])
+    with open(path, 'wb') as out:
+        for chunk in uploaded.chunks():
+            out.write(chunk)
+    return path
+
+
+def _release():
+    global _pending
+    with _lock:
+        _pending -= 1
+
+
+def _discard(path):
+    if os.path.exists(path):
+        os.remove(path)
+    _release()
+
+
+def _is_latest(product_id, token):
+    with _lock:
+        return _latest.get(product_id) == token
+
+
+def store_spooled_image(product_id, path, original_name, token):
+    """Upload a spooled file to the image storage, retrying with exponential
+    backoff, then point the product at it and render its variants.
+
+    The spooled file is kept (and the failure logged) when every attempt
+    fails, so the upload can be recovered by hand.
+    """
+    try:
+        if not _is_latest(product_id, token):
+            os.remove(path)
+            return None
+
+        field = Product._meta.get_field('image')
+        name = field.generate_filename(None, original_name)
+        saved = _save_with_retries(field.storage, name, path)
+        if saved is None:
+            return None
+
+        with _lock:
+            current = _latest.get(product_id) == token
+            if current:
+                del _latest[product_id]
+        if not current:
+            field.storage.delete(saved)
+            os.remove(path)
+            return None
+
+        Product.objects.filter(_id=product_id).update(image=saved, imageVariants={}, updatedAt=Now())
+        bump_catalog_version()
+        os.remove(path)
+        run_variants(product_id, saved)
+        return saved
+    finally:
+        _release()
+
+
+def _save_with_retries(storage, name, path):
+    retries = settings.IMAGE_UPLOAD_RETRIES
+    for attempt in range(retries + 1):
+        try:
+            with open(path, 'rb') as f:
+                return storage.save(name, File(f, name=name))
+        except Exception:
+            if attempt == retries:
+                logger.exception('Storing %s failed after %d attempts, spooled file kept at %s',
+                                 name, retries + 1, path)
+                return None
+            time.sleep(settings.IMAGE_UPLOAD_RETRY_DELAY * 2 ** attempt)
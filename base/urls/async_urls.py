@@ -0,0 +1,10 @@
+from django.urls import path
+from base.views import async_views as views
+
+
+urlpatterns = [
+    path('products/',views.getProducts,name="async-products"),
+    path('products/top/',views.getTopProducts,name="async-top-products"),
+    path('products/<str:pk>/',views.getProduct,name="async-product"),
+    path('orders/myorders/',views.getMyOrders,name="async-myorders"),
+]
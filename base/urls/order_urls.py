@@ -6,6 +6,7 @@ urlpatterns = [
     path('',views.getOrders,name="allorders"),
     path('add/',views.addOrderItems,name="orders-add"),
     path('myorders/',views.getMyOrders,name="myorders"),
+    path('export/',views.exportOrders,name="orders-export"),
 
     path('<str:pk>/deliver/',views.updateOrderToDelivered,name="delivered"),
     path('<str:pk>/',views.getOrderById,name="user-order"),
@@ -8,7 +8,7 @@ urlpatterns = [
     path('create/',views.createProduct,name="create_product"),
     path('upload/',views.uploadImage,name="upload_image"),
 
-    path('<str:pk>/reviews/',views.createProductReview,name="create-review"),
+    path('<str:pk>/reviews/',views.productReviews,name="create-review"),
     path('top/',views.getTopProducts,name="top-products"),
     path('<str:pk>/',views.getProduct,name="product"),
 
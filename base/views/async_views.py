@@ -0,0 +1,162 @@
+"""Async variants of the read-heavy views, for deployments under an ASGI
+server (see backend/asgi.py). They return the same payloads as their
+synchronous counterparts and are routed under /api/async/."""
+import math
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotAuthenticated, PermissionDenied, Throttled
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+from base.authentication import CachedJWTAuthentication
+from base.models import *
+from base.serializers import ProductSerializer, ProductListSerializer
+from base.filters import parse_bool
+from base.facets import product_facets
+from base.pagination import KeysetPaginator, InvalidCursor, estimate_count
+from base.cache import cache_catalog_response
+from base.throttling import check_throttles
+from base.conditional import (
+    conditional, catalog_validators, my_orders_validators,
+)
+from base.views.order_views import orderListResponse
+from base.views.product_views import productListQuery
+
+
+def async_api_view(permission_classes=(AllowAny,)):
+    """Async stand-in for DRF's `api_view(['GET'])`.
+
+    DRF views are synchronous, so this wraps the request in a DRF Request
+    (JWT authentication, `query_params`), checks `permission_classes` and
+    the DEFAULT_THROTTLE_CLASSES and renders the returned Response as JSON.
+    Content negotiation is not applied.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            request = Request(request, authenticators=[CachedJWTAuthentication()])
+            if request.method not in ('GET', 'HEAD'):
+                response = Response({'detail': f'Method "{request.method}" not allowed.'},
+                                    status=status.HTTP_405_METHOD_NOT_ALLOWED)
+                return _render(response)
+
+            try:
+                # User lookup and throttle checks may block, run them in one hop
+                await sync_to_async(_initial)(request, permission_classes)
+                response = await view(request, *args, **kwargs)
+            except APIException as exc:
+                response = Response({'detail': exc.detail}, status=exc.status_code)
+                if getattr(exc, 'wait', None):
+                    response['Retry-After'] = str(math.ceil(exc.wait))
+            return _render(response)
+
+        return wrapper
+
+    return decorator
+
+
+def _initial(request, permission_classes):
+    user = request.user
+    for permission in permission_classes:
+        if not permission().has_permission(request, None):
+            raise NotAuthenticated() if not user.is_authenticated else PermissionDenied()
+    wait = check_throttles(request)
+    if wait is not None:
+        raise Throttled(wait)
+
+
+def _render(response):
+    response.accepted_renderer = JSONRenderer()
+    response.accepted_media_type = 'application/json'
+    response.renderer_context = {}
+    return response
+
+
+@async_api_view()
+@conditional(catalog_validators, public=True, max_age=60)
+@cache_catalog_response
+async def getProducts(request):
+    try:
+        products, unselected = productListQuery(request.query_params)
+        facets = parse_bool(request.query_params['facets']) if request.query_params.get('facets') else False
+    except ValueError:
+        return Response({'detail': 'Invalid filter'}, status=status.HTTP_400_BAD_REQUEST)
+
+    if 'cursor' in request.query_params:
+        paginator = KeysetPaginator(products, 8)
+        try:
+            page = await paginator.apage(request.query_params.get('cursor'))
+        except InvalidCursor:
+            return Response({'detail': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = ProductListSerializer(page.items, many=True)
+        data = {'products': serializer.data, 'next': page.next, 'prev': page.prev}
+
+        count = request.query_params.get('count')
+        if count == 'estimate':
+            data['count'] = await sync_to_async(estimate_count)(products)
+        elif count == 'exact':
+            data['count'] = await products.acount()
+        if facets:
+            data['facets'] = await sync_to_async(product_facets)(unselected, request.query_params)
+        return Response(data)
+
+    page = request.query_params.get('page')
+    paginator = Paginator(products, 8)
+    paginator.count = await products.acount()
+
+    try:
+        number = paginator.validate_number(page)
+    except PageNotAnInteger:
+        number = 1
+    except EmptyPage:
+        number = paginator.num_pages
+
+    bottom = (number - 1) * paginator.per_page
+    items = [product async for product in products[bottom:bottom + paginator.per_page]]
+
+    page = int(page) if page else 1
+
+    serializer = ProductListSerializer(items, many=True)
+    data = {'products': serializer.data, 'page': page, 'pages': paginator.num_pages}
+    if facets:
+        data['facets'] = await sync_to_async(product_facets)(unselected, request.query_params)
+    return Response(data)
+
+
+@async_api_view()
+@conditional(catalog_validators, public=True, max_age=60)
+@cache_catalog_response
+async def getTopProducts(request):
+    products = Product.objects.filter(rating__gte=settings.LEADERBOARD_MIN_RATING)
+    category = request.query_params.get('category')
+    if category:
+        products = products.filter(category=category)
+    products = products.order_by('-score', '-_id')[0:settings.LEADERBOARD_SIZE]
+    serializer = ProductListSerializer([product async for product in products], many=True)
+    return Response(serializer.data)
+
+
+@async_api_view()
+@conditional(catalog_validators, public=True, max_age=60)
+@cache_catalog_response
+async def getProduct(request, pk):
+    try:
+        product = await Product.objects.prefetch_related('review_set').aget(_id=pk)
+    except (Product.DoesNotExist, ValueError):
+        return Response({'detail': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+    serializer = ProductSerializer(product, many=False)
+    return Response(serializer.data)
+
+
+@async_api_view(permission_classes=(IsAuthenticated,))
+@conditional(my_orders_validators, private=True, no_cache=True)
+async def getMyOrders(request):
+    orders = Order.objects.filter(user=request.user)
+    # Filtering, paging and the values() fast path run as one thread hop
+    return await sync_to_async(orderListResponse)(request, orders)
@@ -1,83 +1,99 @@
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from django.utils import timezone
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from base.models import *
-from base.serializers import ProductSerializer, OrderSerializer
+from base.serializers import ProductSerializer, OrderSerializer, serialize_orders
+from base.checkout import place_order, InsufficientStock
+from base import inventory
+from base.idempotency import idempotent
+from base.exports import ndjson_rows, csv_rows
+from base.filters import filter_orders
+from base.pagination import paginate, InvalidCursor
+from base.conditional import conditional, order_validators, my_orders_validators, all_orders_validators
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent
 def addOrderItems(request):
     user = request.user
     data = request.data
-    print(data)
-    orderItems = data['orderItems']
+    orderItems = data.get('orderItems')
 
-    if orderItems and len(orderItems) == 0:
-        return Response({'detail': 'No Order Items', "status": status.HTTP_400_BAD_REQUEST})
-    else:
-        order = Order.objects.create(
-            user=user,
-            paymentMethod=data['paymentMethod'],
-            taxPrice=data['taxPrice'],
-            shippingPrice=data['shippingPrice'],
-            totalPrice=data['totalPrice'],
-        )
-
-
-        shipping = ShippingAddress.objects.create(
-            order=order,
-            address=data['shippingAddress']['address'],
-            city=data['shippingAddress']['city'],
-            postalCode=data['shippingAddress']['postalCode'],
-            country=data['shippingAddress']['country'],
-        )
-
-        for i in orderItems:
-            product = Product.objects.get(_id=i['product'])
-
-            item = OrderItem.objects.create(
-                product=product,
-                order=order,
-                name=product.name,
-                qty=i['qty'],
-                price=i['price'],
-                image=product.image.url,
-            )
-            product.countInStock -= item.qty
-            product.save()
-
-        serializer = OrderSerializer(order, many=False)
-        return Response(serializer.data)
+    if not orderItems:
+        return Response({'detail': 'No Order Items'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        order = place_order(user, data)
+    except InsufficientStock as e:
+        return Response({'detail': 'Insufficient stock', 'lines': e.lines},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    serializer = OrderSerializer(order, many=False)
+    return Response(serializer.data)
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@conditional(my_orders_validators, private=True, no_cache=True)
 def getMyOrders(request):
     user = request.user
-    orders = Order.objects.filter(user=user)\
-        .select_related('user', 'shippingaddress')\
-        .prefetch_related('orderitem_set__product')
-
-    serializer = OrderSerializer(orders, many=True)
-    return Response(serializer.data)
+    orders = Order.objects.filter(user=user)
+    return orderListResponse(request, orders)
 
 
 @api_view(['GET'])
 @permission_classes([IsAdminUser])
+@conditional(all_orders_validators, private=True, no_cache=True)
 def getOrders(request):
-    orders = Order.objects.all()\
-        .select_related('user', 'shippingaddress')\
-        .prefetch_related('orderitem_set__product')
+    orders = Order.objects.all()
+    return orderListResponse(request, orders)
 
-    serializer = OrderSerializer(orders, many=True)
-    return Response(serializer.data)
+
+def orderListResponse(request, orders):
+    # Filters and sort always apply; pagination only when the client asks for it
+    try:
+        orders = filter_orders(orders, request.query_params)
+        keys = [name.lstrip('-') for name in orders.query.order_by]
+        page, meta = paginate(request, orders.only(*keys))
+    except (ValueError, InvalidCursor):
+        return Response({'detail': 'Invalid filter or cursor'}, status=status.HTTP_400_BAD_REQUEST)
+
+    if meta is None:
+        return Response(serialize_orders(orders))
+
+    orders = orders.filter(_id__in=[order._id for order in page])
+    return Response({'orders': serialize_orders(orders), **meta})
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def exportOrders(request):
+    output = request.query_params.get('output', 'ndjson')
+    if output not in ('ndjson', 'csv'):
+        return Response({'detail': 'output must be ndjson or csv'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        orders = filter_orders(Order.objects.all(), request.query_params)
+    except ValueError:
+        return Response({'detail': 'Invalid filter'}, status=status.HTTP_400_BAD_REQUEST)
+
+    if output == 'csv':
+        response = StreamingHttpResponse(csv_rows(orders), content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="orders.csv"'
+    else:
+        response = StreamingHttpResponse(ndjson_rows(orders), content_type='application/x-ndjson')
+        response['Content-Disposition'] = 'attachment; filename="orders.ndjson"'
+    return response
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@conditional(order_validators, private=True, no_cache=True)
 def getOrderById(request, pk):
     user = request.user
 
@@ -97,16 +113,25 @@ def getOrderById(request, pk):
 
 @api_view(['PUT'])
 @permission_classes([IsAuthenticated])
+@idempotent
 def updateOrderToPaid(request, pk):
     try:
         order = Order.objects.get(_id=pk)
-        if request.user != order.user:
+        if request.user.id != order.user_id:
             return Response({'detail': 'Not authorized to update this order'}, status=status.HTTP_403_FORBIDDEN)
 
-        order.isPaid = True
-        order.paidAt = timezone.now()
-        order.save()
+        # Stock held since checkout becomes a sale; if the hold expired and
+        # the stock has gone since, the payment is refused
+        with transaction.atomic():
+            if not order.isPaid:
+                inventory.commit(order)
+            order.isPaid = True
+            order.paidAt = timezone.now()
+            order.save()
         return Response("Order was paid")
+    except InsufficientStock as e:
+        return Response({'detail': 'Reserved stock expired and is no longer available', 'lines': e.lines},
+                        status=status.HTTP_409_CONFLICT)
     except Order.DoesNotExist:
         return Response({'detail': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
 
@@ -1,20 +1,67 @@
+from django.conf import settings
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.db import IntegrityError, transaction
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.permissions import IsAdminUser, IsAuthenticatedOrReadOnly
 from rest_framework.response import Response
 from base.models import *
-from base.serializers import ProductSerializer
+from base.serializers import ProductSerializer, ProductListSerializer, ReviewSerializer
+from base.search import search_products
+from base.filters import filter_products, parse_bool
+from base.facets import product_facets
+from base.pagination import KeysetPaginator, InvalidCursor, estimate_count
+from base.reviews import add_review_rating
+from base.inventory import stripe_stock
+from base.images import schedule_variants
+from base.uploads import atomic_uploads, queue_image_upload
+from base.cache import cache_catalog_response
+from base.conditional import conditional, catalog_validators
+
+
+def productListQuery(params):
+    """The filtered, searched and sorted listing, and the same listing
+    without its facet selections for `product_facets`. A keyword orders by
+    relevance unless `sort` is given. Raises ValueError for a bad filter."""
+    query = params.get('keyword', '')
+    unselected = search_products(filter_products(Product.objects.all(), params, facets=False), query)
+    products = filter_products(Product.objects.all(), params)
+    if query:
+        searched = search_products(products, query)
+        products = searched.order_by(*products.query.order_by) if params.get('sort') else searched
+    return products, unselected
 
 
 @api_view(['GET'])
+@conditional(catalog_validators, public=True, max_age=60)
+@cache_catalog_response
 def getProducts(request):
-    query = request.query_params.get('keyword', '')
-
-    # Optimize query to prevent N+1 problem
-    products = Product.objects.filter(name__icontains=query).order_by('-_id') \
-        .select_related('user') \
-        .prefetch_related('review_set')
+    # Listings use the slim serializer, reviews are served by productReviews
+    try:
+        products, unselected = productListQuery(request.query_params)
+        facets = parse_bool(request.query_params['facets']) if request.query_params.get('facets') else False
+    except ValueError:
+        return Response({'detail': 'Invalid filter'}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Keyset pagination for clients that send a cursor (empty for the first page)
+    if 'cursor' in request.query_params:
+        paginator = KeysetPaginator(products, 8)
+        try:
+            page = paginator.page(request.query_params.get('cursor'))
+        except InvalidCursor:
+            return Response({'detail': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = ProductListSerializer(page.items, many=True)
+        data = {'products': serializer.data, 'next': page.next, 'prev': page.prev}
+
+        count = request.query_params.get('count')
+        if count == 'estimate':
+            data['count'] = estimate_count(products)
+        elif count == 'exact':
+            data['count'] = products.count()
+        if facets:
+            data['facets'] = product_facets(unselected, request.query_params)
+        return Response(data)
 
     page = request.query_params.get('page')
     paginator = Paginator(products, 8)
@@ -28,17 +75,29 @@ def getProducts(request):
 
     page = int(page) if page else 1
 
-    serializer = ProductSerializer(products, many=True)
-    return Response({'products': serializer.data, 'page': page, 'pages': paginator.num_pages})
+    serializer = ProductListSerializer(products, many=True)
+    data = {'products': serializer.data, 'page': page, 'pages': paginator.num_pages}
+    if facets:
+        data['facets'] = product_facets(unselected, request.query_params)
+    return Response(data)
 
 @api_view(['GET'])
+@conditional(catalog_validators, public=True, max_age=60)
+@cache_catalog_response
 def getTopProducts(request):
-    products = Product.objects.filter(rating__gte=4).order_by('-rating')[0:5]
-    serializer = ProductSerializer(products, many=True)
+    # score is maintained on every review, so the leaderboard is an index scan
+    products = Product.objects.filter(rating__gte=settings.LEADERBOARD_MIN_RATING)
+    category = request.query_params.get('category')
+    if category:
+        products = products.filter(category=category)
+    products = products.order_by('-score', '-_id')[0:settings.LEADERBOARD_SIZE]
+    serializer = ProductListSerializer(products, many=True)
     return Response(serializer.data)
 
 
 @api_view(['GET'])
+@conditional(catalog_validators, public=True, max_age=60)
+@cache_catalog_response
 def getProduct(request, pk):
     product = Product.objects.get(_id=pk)
     serializer = ProductSerializer(product, many=False)
@@ -67,16 +126,23 @@ def createProduct(request):
 @permission_classes([IsAdminUser])
 def updateProduct(request, pk):
     data = request.data
-    product = Product.objects.get(_id=pk)
+    with transaction.atomic():
+        product = Product.objects.select_for_update().get(_id=pk)
+        stocked = product.countInStock
 
-    product.name = data["name"]
-    product.price = data["price"]
-    product.brand = data["brand"]
-    product.countInStock = data["countInStock"]
-    product.category = data["category"]
-    product.description = data["description"]
+        product.name = data["name"]
+        product.price = data["price"]
+        product.brand = data["brand"]
+        product.countInStock = int(data["countInStock"])
+        product.category = data["category"]
+        product.description = data["description"]
 
-    product.save()
+        product.save()
+        if product.stockStripes and product.countInStock != stocked:
+            # countInStock of a striped product is only as fresh as the last
+            # sweep, so apply the change to what the stripes hold now
+            product.countInStock = stripe_stock(product._id, product.stockStripes,
+                                                delta=product.countInStock - stocked)
 
     serializer = ProductSerializer(product, many=False)
     return Response(serializer.data)
@@ -96,46 +162,76 @@ def uploadImage(request):
     data = request.data
     product_id = data['product_id']
     product = Product.objects.get(_id=product_id)
-    product.image = request.FILES.get('image')
-    product.save()
+    image = request.FILES.get('image')
+
+    # Background mode answers before the file reaches object storage
+    if image and settings.IMAGE_UPLOAD_MODE == 'background':
+        with atomic_uploads():
+            queued = queue_image_upload(product, image)
+        if queued:
+            return Response("Image upload was queued", status=status.HTTP_202_ACCEPTED)
+
+    product.image = image
+    # Variants of the old image no longer apply; new ones follow in the background
+    product.imageVariants = {}
+    # Stock and review totals may change while the file is stored
+    product.save(update_fields=['image', 'imageVariants', 'updatedAt'])
+    if product.image:
+        schedule_variants(product)
     return Response("Image was uploaded")
 
 
-@api_view(['POST'])
-@permission_classes([IsAuthenticated])
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticatedOrReadOnly])
+def productReviews(request, pk):
+    if request.method == 'POST':
+        return createProductReview(request, pk)
+    return getProductReviews(request, pk)
+
+
+def getProductReviews(request, pk):
+    try:
+        product = Product.objects.only('numReviews').get(_id=pk)
+    except Product.DoesNotExist:
+        return Response({'detail': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    paginator = KeysetPaginator(product.review_set.order_by('-_id'), 10)
+    try:
+        page = paginator.page(request.query_params.get('cursor'))
+    except InvalidCursor:
+        return Response({'detail': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+
+    serializer = ReviewSerializer(page.items, many=True)
+    return Response({
+        'reviews': serializer.data,
+        'next': page.next,
+        'prev': page.prev,
+        'count': product.numReviews,
+    })
+
+
 def createProductReview(request, pk):
     user = request.user
     product = Product.objects.get(_id=pk)
     data = request.data
 
-    # 1 Review already exists
-    alreadyExists = product.review_set.filter(user=user).exists()
-
-    if alreadyExists:
-        content = {'detail': 'Product already reviewed'}
-        return Response(content, status=status.HTTP_400_BAD_REQUEST)
-
-    elif data['rating'] == 0:
+    if data['rating'] == 0:
         content = {'detail': 'Please Select a rating'}
         return Response(content, status=status.HTTP_400_BAD_REQUEST)
 
-    else:
-        review = Review.objects.create(
-            user=user,
-            product=product,
-            name=user.first_name,
-            rating=data['rating'],
-            comment=data['comment'],
-        )
-
-        reviews = product.review_set.all()
-        product.numReviews = len(reviews)
-
-        total = 0
-
-        for i in reviews:
-            total += i.rating
-        product.rating = total / len(reviews)
-        product.save()
+    # The (product, user) unique constraint rejects a second review
+    try:
+        with transaction.atomic():
+            Review.objects.create(
+                user=user,
+                product=product,
+                name=user.first_name,
+                rating=data['rating'],
+                comment=data['comment'],
+            )
+            add_review_rating(product._id, int(data['rating']))
+    except IntegrityError:
+        content = {'detail': 'Product already reviewed'}
+        return Response(content, status=status.HTTP_400_BAD_REQUEST)
 
-        return Response('Review Added')
+    return Response('Review Added')
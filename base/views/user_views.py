@@ -7,6 +7,8 @@ from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework_simplejwt.views import TokenObtainPairView
 from base.models import *
 from base.serializers import UserSerializer,UserSerializerWithToken
+from base.filters import filter_users
+from base.pagination import paginate,InvalidCursor
 
 
 class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
@@ -88,9 +90,18 @@ def updateUserProfile(request):
 @api_view(['GET'])
 @permission_classes([IsAdminUser])
 def getUsers(request):
-    users = User.objects.all()
-    serializer = UserSerializer(users,many = True)
-    return Response(serializer.data)
+    try:
+        users = filter_users(User.objects.all(),request.query_params)
+        page,meta = paginate(request,users)
+    except (ValueError,InvalidCursor):
+        return Response({'detail':'Invalid filter or cursor'},status=status.HTTP_400_BAD_REQUEST)
+
+    if meta is None:
+        serializer = UserSerializer(users,many = True)
+        return Response(serializer.data)
+
+    serializer = UserSerializer(page,many = True)
+    return Response({'users':serializer.data,**meta})
 
 @api_view(['GET'])
 @permission_classes([IsAdminUser])
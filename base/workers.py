@@ -0,0 +1,54 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+_executors = {}
+_lock = threading.Lock()
+
+
+def get_executor(name, workers):
+    """Process-wide thread pool for background jobs of kind `name`, created
+    on first use with `workers` threads."""
+    with _lock:
+        if name not in _executors:
+            _executors[name] = ThreadPoolExecutor(workers, thread_name_prefix=name)
+        return _executors[name]
+
+
+def submit(name, workers, func, *args):
+    """Run `func(*args)` on the `name` pool, closing the database connections
+    the job opened in its thread when it is done. An exception the job raises
+    is logged, as nobody may be waiting on the returned future."""
+    future = get_executor(name, workers).submit(_job, func, *args)
+    future.add_done_callback(lambda future: _log_failure(name, func, future))
+    return future
+
+
+def _job(func, *args):
+    try:
+        return func(*args)
+    finally:
+        connections.close_all()
+
+
+def _log_failure(name, func, future):
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is not None:
+        logger.error('Background job %s of %s failed', func.__qualname__, name,
+                     exc_info=(type(error), error, error.__traceback__))
+
+
+def shutdown(wait=True):
+    """Stop every pool, by default after their queued jobs have run."""
+    with _lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=wait)
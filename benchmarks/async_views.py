@@ -0,0 +1,226 @@
+"""Compare the synchronous views under WSGI with the async variants under ASGI.
+
+In-process (default): the WSGI side runs the sync views on `--workers`
+threads, standing in for gunicorn sync workers; the ASGI side runs the
+async views on one event loop with `--concurrency` requests in flight.
+`--db-latency` adds a sleep to every query to model a remote database or
+slow storage, which is where async pays off.
+
+    python -m benchmarks.async_views --requests 400 --concurrency 50 --workers 4 --db-latency 20
+
+Against real deployments (e.g. gunicorn and uvicorn/daphne in front of the
+same database), pass both base URLs; requests are sent with `--concurrency`
+client threads:
+
+    python -m benchmarks.async_views --wsgi-url http://localhost:8000 --asgi-url http://localhost:8001
+"""
+import argparse
+import asyncio
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.utils import report, setup_django, summarize, test_database, wsgi_request
+
+
+ENDPOINTS = {
+    'products': ('/api/products/', '/api/async/products/'),
+    'top': ('/api/products/top/', '/api/async/products/top/'),
+    'product': ('/api/products/{product}/', '/api/async/products/{product}/'),
+    'myorders': ('/api/orders/myorders/', '/api/async/orders/myorders/'),
+}
+
+
+def seed(products, orders):
+    from django.contrib.auth.models import User
+    from base.models import Order, Product
+
+    user = User.objects.create_user(username='bench@example.com', email='bench@example.com', password='bench')
+    created = Product.objects.bulk_create(
+        Product(name=f'Product {i}', brand='Brand', category='Books', price=100, countInStock=10,
+                numReviews=1, rating=4, ratingSum=4, score=3.6)
+        for i in range(products)
+    )
+    Order.objects.bulk_create(
+        Order(user=user, paymentMethod='PayPal', taxPrice=10, shippingPrice=0, totalPrice=110)
+        for _ in range(orders)
+    )
+    return user, created[0]._id
+
+
+def add_db_latency(seconds):
+    """Sleep before every query on every connection, including ones opened
+    later by worker threads."""
+    from django.core.signals import request_started
+    from django.db import connection
+
+    def wrapper(execute, sql, params, many, context):
+        time.sleep(seconds)
+        return execute(sql, params, many, context)
+
+    def install(**kwargs):
+        if wrapper not in connection.execute_wrappers:
+            connection.execute_wrappers.append(wrapper)
+
+    install()
+    request_started.connect(install, weak=False)
+
+
+def paths(template, count, product, bypass_cache):
+    path = template.format(product=product)
+    if not bypass_cache:
+        return [path] * count
+    # A distinct query string per request misses the catalog cache
+    return [f'{path}?_={i}' for i in range(count)]
+
+
+def split(url):
+    path, _, query = url.partition('?')
+    return path, query
+
+
+def run_wsgi(urls, workers, headers):
+    from django.core.wsgi import get_wsgi_application
+
+    app = get_wsgi_application()
+
+    def call(url):
+        return wsgi_request(app, 'GET', url, headers=headers)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(workers) as pool:
+        results = list(pool.map(call, urls))
+    return summarize([r[0] for r in results], time.perf_counter() - start, [r[1] for r in results])
+
+
+def run_asgi(urls, concurrency, headers):
+    from django.core.asgi import get_asgi_application
+
+    app = get_asgi_application()
+    raw_headers = [(b'host', b'testserver')] + [
+        (name[5:].replace('_', '-').lower().encode(), value.encode()) for name, value in headers.items()
+    ]
+
+    async def main():
+        limit = asyncio.Semaphore(concurrency)
+        never = asyncio.Event()
+
+        async def call(url):
+            path, query = split(url)
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+                'headers': raw_headers, 'server': ('testserver', 80), 'client': ('127.0.0.1', 0),
+            }
+            body_sent = False
+            statuses = []
+
+            async def receive():
+                nonlocal body_sent
+                if not body_sent:
+                    body_sent = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await never.wait()
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    statuses.append(message['status'])
+
+            async with limit:
+                start = time.perf_counter()
+                await app(scope, receive, send)
+                return time.perf_counter() - start, statuses[0]
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(call(url) for url in urls))
+        return summarize([r[0] for r in results], time.perf_counter() - start, [r[1] for r in results])
+
+    return asyncio.run(main())
+
+
+def run_http(urls, concurrency, headers):
+    def call(url):
+        request = urllib.request.Request(url, headers=headers)
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        return time.perf_counter() - start, status
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(call, urls))
+    return summarize([r[0] for r in results], time.perf_counter() - start, [r[1] for r in results])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS), help='Comma-separated subset of %(default)s')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint and side')
+    parser.add_argument('--concurrency', type=int, default=50, help='Requests in flight')
+    parser.add_argument('--workers', type=int, default=4, help='WSGI worker threads (in-process only)')
+    parser.add_argument('--db-latency', type=float, default=0, help='Milliseconds added to every query')
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--orders', type=int, default=50)
+    parser.add_argument('--use-cache', action='store_true', help='Let repeated reads hit the catalog cache')
+    parser.add_argument('--wsgi-url', help='Base URL of a running WSGI deployment')
+    parser.add_argument('--asgi-url', help='Base URL of a running ASGI deployment')
+    parser.add_argument('--token', help='Bearer token for myorders when benchmarking over HTTP')
+    parser.add_argument('--product', default='1', help='Product id for the detail endpoint over HTTP')
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    args = parser.parse_args()
+
+    endpoints = [name.strip() for name in args.endpoints.split(',') if name.strip()]
+    results = {'requests': args.requests, 'concurrency': args.concurrency}
+
+    if args.wsgi_url or args.asgi_url:
+        headers = {'Authorization': f'Bearer {args.token}'} if args.token else {}
+        for name in endpoints:
+            sync_path, async_path = ENDPOINTS[name]
+            results[name] = {}
+            if args.wsgi_url:
+                urls = [args.wsgi_url.rstrip('/') + p
+                        for p in paths(sync_path, args.requests, args.product, not args.use_cache)]
+                results[name]['wsgi'] = run_http(urls, args.concurrency, headers)
+            if args.asgi_url:
+                urls = [args.asgi_url.rstrip('/') + p
+                        for p in paths(async_path, args.requests, args.product, not args.use_cache)]
+                results[name]['asgi'] = run_http(urls, args.concurrency, headers)
+        report(results, args.output)
+        return
+
+    setup_django()
+    from django.conf import settings
+    from rest_framework.settings import api_settings
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']
+    # Throttling would reject most of the load
+    for scope in api_settings.DEFAULT_THROTTLE_RATES:
+        api_settings.DEFAULT_THROTTLE_RATES[scope] = None
+    results.update(workers=args.workers, db_latency_ms=args.db_latency)
+
+    with test_database():
+        user, product = seed(args.products, args.orders)
+        token = str(RefreshToken.for_user(user).access_token)
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+        if args.db_latency:
+            add_db_latency(args.db_latency / 1000)
+
+        for name in endpoints:
+            sync_path, async_path = ENDPOINTS[name]
+            results[name] = {
+                'wsgi': run_wsgi(paths(sync_path, args.requests, product, not args.use_cache),
+                                 args.workers, headers),
+                'asgi': run_asgi(paths(async_path, args.requests, product, not args.use_cache),
+                                 args.concurrency, headers),
+            }
+
+    report(results, args.output)
+
+
+if __name__ == '__main__':
+    main()
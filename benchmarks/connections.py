@@ -0,0 +1,165 @@
+"""Per-request latency of cheap endpoints for each DB_CONN_MODE.
+
+Sends `--requests` requests to each endpoint through the WSGI handler from
+`--workers` threads (standing in for gunicorn threads), once per connection
+mode, against a throwaway copy of the configured database. Every request
+misses the catalog cache, so it runs its queries; the report has the
+latency percentiles and how many connections were opened for each mode.
+
+    python -m benchmarks.connections --requests 1000 --workers 4
+    python -m benchmarks.connections --modes close,persistent --connect-latency 5
+
+Run it against Postgres, where connecting costs a TCP handshake,
+authentication and backend startup. On SQLite connecting is almost free;
+`--connect-latency` adds a sleep to every connection Django opens itself
+to model a remote server. 'pool' needs psycopg 3 with psycopg[pool] and is
+skipped otherwise.
+"""
+import argparse
+import os
+import threading
+import time
+
+from benchmarks.async_views import paths, seed
+from benchmarks.load import environment
+from benchmarks.utils import report, setup_django, summarize, test_database, wsgi_request
+
+
+ENDPOINTS = {
+    'product': '/api/products/{product}/',
+    'top': '/api/products/top/',
+}
+
+
+def use_mode(mode):
+    """Switch the default connection to `mode` of settings.DB_CONN_MODES,
+    closing the connections and pool of the previous one."""
+    from django.conf import settings
+    from django.db import connections
+
+    connections.close_all()
+    if getattr(connections['default'], 'pool', None) is not None:
+        connections['default'].close_pool()
+
+    # Every thread's connection shares this dict
+    database = connections.settings['default']
+    database.update(CONN_MAX_AGE=0, CONN_HEALTH_CHECKS=False)
+    database.setdefault('OPTIONS', {}).pop('pool', None)
+    for name, value in settings.DB_CONN_MODES[mode].items():
+        if name == 'OPTIONS':
+            database['OPTIONS'].update(value)
+        else:
+            database[name] = value
+
+
+def pool_supported():
+    from django.db import connection
+
+    if connection.vendor != 'postgresql':
+        return False
+    from django.db.backends.postgresql.psycopg_any import is_psycopg3
+    try:
+        import psycopg_pool  # noqa: F401
+    except ImportError:
+        return False
+    return is_psycopg3
+
+
+def add_connect_latency(seconds):
+    """Sleep in every new connection Django opens, on every thread."""
+    from django.db import connections
+
+    wrapper = type(connections['default'])
+    original = wrapper.get_new_connection
+
+    def get_new_connection(self, conn_params):
+        time.sleep(seconds)
+        return original(self, conn_params)
+
+    wrapper.get_new_connection = get_new_connection
+
+
+def run(urls, workers):
+    from django.core.cache import caches
+    from django.core.wsgi import get_wsgi_application
+    from django.db import connections
+    from django.db.backends.signals import connection_created
+
+    for alias in caches:
+        caches[alias].clear()
+    app = get_wsgi_application()
+    opened = []
+    counter = lambda sender, connection, **kwargs: opened.append(1)
+    connection_created.connect(counter, weak=False)
+    results = []
+
+    def worker(chunk):
+        try:
+            for url in chunk:
+                results.append(wsgi_request(app, 'GET', url))
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=worker, args=(urls[i::workers],)) for i in range(workers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    connection_created.disconnect(counter)
+
+    summary = summarize([r[0] for r in results], elapsed, [r[1] for r in results])
+    summary['connections_opened'] = len(opened)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', default='close,persistent,pool', help='Comma-separated subset of %(default)s')
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS), help='Comma-separated subset of %(default)s')
+    parser.add_argument('--requests', type=int, default=500, help='Requests per endpoint and mode')
+    parser.add_argument('--workers', type=int, default=4, help='WSGI worker threads')
+    parser.add_argument('--connect-latency', type=float, default=0,
+                        help='Milliseconds added to every connection Django opens')
+    parser.add_argument('--products', type=int, default=200)
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    args = parser.parse_args()
+
+    os.environ.setdefault('SILK_SAMPLE_PERCENT', '0')
+    setup_django()
+    from django.conf import settings
+    from rest_framework.settings import api_settings
+
+    settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']
+    for scope in api_settings.DEFAULT_THROTTLE_RATES:
+        api_settings.DEFAULT_THROTTLE_RATES[scope] = None
+
+    modes = [mode.strip() for mode in args.modes.split(',') if mode.strip()]
+    endpoints = [name.strip() for name in args.endpoints.split(',') if name.strip()]
+    results = {
+        'environment': environment(), 'requests': args.requests, 'workers': args.workers,
+        'connect_latency_ms': args.connect_latency, 'modes': {},
+    }
+
+    with test_database():
+        _, product = seed(args.products, 0)
+        if args.connect_latency:
+            add_connect_latency(args.connect_latency / 1000)
+
+        for mode in modes:
+            if mode == 'pool' and not pool_supported():
+                results['modes'][mode] = 'skipped: needs Postgres with psycopg 3 and psycopg[pool]'
+                continue
+            use_mode(mode)
+            results['modes'][mode] = {
+                name: run(paths(ENDPOINTS[name], args.requests, product, True), args.workers)
+                for name in endpoints
+            }
+        use_mode('close')
+
+    report(results, args.output)
+
+
+if __name__ == '__main__':
+    main()
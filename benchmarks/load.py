@@ -0,0 +1,489 @@
+"""Load benchmark of every route in base/urls.
+
+Seeds a throwaway copy of the configured database at the requested scale,
+then sends `--requests` requests per route through the WSGI handler from
+`--concurrency` client threads, one route at a time with cold caches. The
+JSON report has throughput, p50/p95/p99 latency and app queries per request
+(next to the route's budget in base/budgets.py) for every route, plus the
+scale and environment it ran with, so reports from two commits can be
+diffed; `--baseline` adds the relative change against an earlier report.
+
+    python -m benchmarks.load --products 10000 --orders 20000 --output before.json
+    python -m benchmarks.load --products 10000 --orders 20000 --baseline before.json
+
+Seeding goes through base/seeding.py (as `manage.py seed_data` does) and is
+deterministic for a given `--seed`. Silk is off unless
+SILK_SAMPLE_PERCENT is set, and throttling is disabled. upload_image writes
+to a temporary directory instead of the configured default storage, so no
+object storage is needed and none is filled with test images. On SQLite, set the database OPTIONS
+`transaction_mode` to 'IMMEDIATE', otherwise concurrent writes fail with
+"database is locked" instead of waiting.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from benchmarks.utils import report, setup_django, summarize, test_database, wsgi_request
+
+
+# Search terms that match the seeded catalog, see base/seeding.py
+KEYWORDS = ('wireless', 'pro', 'mini', 'camera', 'mouse', 'iphone', 'playstation', 'echo', 'ultra')
+
+
+def seed(products, reviews, orders, users, items, seed):
+    """Seed the catalog with base.seeding and add an admin. Returns the
+    admin, the customer with the most orders, every customer id, every
+    product id and the ids of that customer's orders."""
+    from django.contrib.auth.models import User
+    from django.db.models import Count
+    from base.models import Order, Product
+    from base.seeding import PASSWORD, Seeder
+
+    Seeder(seed=seed).seed(users=users, products=products, reviews=reviews, orders=orders, items=items)
+    admin = User.objects.create_user(username='admin@example.com', email='admin@example.com',
+                                     password=PASSWORD, first_name='Admin', is_staff=True)
+
+    busiest = Order.objects.values('user').annotate(orders=Count('pk')).order_by('-orders', 'user').first()
+    customer = User.objects.get(id=busiest['user'])
+    return (
+        admin,
+        customer,
+        list(User.objects.filter(is_staff=False).values_list('id', flat=True)),
+        list(Product.objects.values_list('_id', flat=True)),
+        list(Order.objects.filter(user=customer).values_list('_id', flat=True)),
+    )
+
+
+class Setup:
+    """What the scenarios act on: the seeded ids, and users and products
+    created on demand for the routes that consume them."""
+
+    def __init__(self, admin, customer, user_ids, product_ids, order_ids, rng):
+        self.admin = admin
+        self.customer = customer
+        self.user_ids = user_ids
+        self.product_ids = product_ids
+        self.order_ids = order_ids
+        self.rng = rng
+        self.tokens = {}
+
+    def token(self, user):
+        from rest_framework_simplejwt.tokens import RefreshToken
+
+        if user.id not in self.tokens:
+            self.tokens[user.id] = str(RefreshToken.for_user(user).access_token)
+        return self.tokens[user.id]
+
+    def new_users(self, count, prefix):
+        from django.contrib.auth.models import User
+
+        return User.objects.bulk_create([
+            User(username=f'{prefix}{i}@example.com', email=f'{prefix}{i}@example.com', first_name=prefix)
+            for i in range(count)
+        ])
+
+    def new_products(self, count):
+        from base.models import Product
+
+        return Product.objects.bulk_create([
+            Product(user=self.admin, name=f'Spare {i}', price=1) for i in range(count)
+        ])
+
+
+class Call:
+    __slots__ = ('method', 'path', 'body', 'content_type', 'token')
+
+    def __init__(self, method, path, body=None, token=None, content_type='application/json'):
+        self.method = method
+        self.path = path
+        self.token = token
+        if body is None:
+            self.body, self.content_type = b'', ''
+        elif isinstance(body, bytes):
+            self.body, self.content_type = body, content_type
+        else:
+            self.body, self.content_type = json.dumps(body).encode(), content_type
+
+
+# 'METHOD url-name' -> (url name, scenario); a scenario returns the calls for one run
+SCENARIOS = {}
+
+
+def scenario(name, method='GET'):
+    def register(func):
+        SCENARIOS[f'{method} {name}'] = (name, func)
+        return func
+    return register
+
+
+def url(name, **kwargs):
+    from django.urls import reverse
+    return reverse(name, kwargs=kwargs)
+
+
+def page(setup, per_page, total):
+    return setup.rng.randint(1, max(1, min(50, total // per_page)))
+
+
+@scenario('products')
+def products(setup, count):
+    calls = []
+    for i in range(count):
+        if i % 4 == 0:
+            query = f'keyword={setup.rng.choice(KEYWORDS)}'
+        elif i % 4 == 1:
+            query = 'cursor='
+        elif i % 4 == 2:
+            query = 'category=Electronics&inStock=true&sort=price&facets=true'
+        else:
+            query = f'page={page(setup, 8, len(setup.product_ids))}'
+        calls.append(Call('GET', f'{url("products")}?{query}'))
+    return calls
+
+
+@scenario('async-products')
+def async_products(setup, count):
+    return [Call('GET', call.path.replace(url('products'), url('async-products'), 1))
+            for call in products(setup, count)]
+
+
+@scenario('top-products')
+def top_products(setup, count):
+    return [Call('GET', url('top-products') + ('?category=Electronics' if i % 2 else ''))
+            for i in range(count)]
+
+
+@scenario('async-top-products')
+def async_top_products(setup, count):
+    return [Call('GET', url('async-top-products')) for _ in range(count)]
+
+
+@scenario('product')
+def product(setup, count):
+    return [Call('GET', url('product', pk=setup.rng.choice(setup.product_ids))) for _ in range(count)]
+
+
+@scenario('async-product')
+def async_product(setup, count):
+    return [Call('GET', url('async-product', pk=setup.rng.choice(setup.product_ids))) for _ in range(count)]
+
+
+@scenario('create-review')
+def product_reviews(setup, count):
+    return [Call('GET', url('create-review', pk=setup.rng.choice(setup.product_ids))) for _ in range(count)]
+
+
+@scenario('users')
+def users(setup, count):
+    token = setup.token(setup.admin)
+    return [Call('GET', f'{url("users")}?{"cursor=" if i % 2 else "page=1"}&limit=50', token=token)
+            for i in range(count)]
+
+
+@scenario('get_user')
+def get_user(setup, count):
+    token = setup.token(setup.admin)
+    return [Call('GET', url('get_user', pk=setup.rng.choice(setup.user_ids)), token=token)
+            for _ in range(count)]
+
+
+@scenario('user_profile')
+def user_profile(setup, count):
+    return [Call('GET', url('user_profile'), token=setup.token(setup.customer)) for _ in range(count)]
+
+
+@scenario('allorders')
+def all_orders(setup, count):
+    token = setup.token(setup.admin)
+    return [Call('GET', f'{url("allorders")}?{"cursor=" if i % 2 else "page=1"}&limit=50', token=token)
+            for i in range(count)]
+
+
+@scenario('myorders')
+def my_orders(setup, count):
+    return [Call('GET', url('myorders'), token=setup.token(setup.customer)) for _ in range(count)]
+
+
+@scenario('async-myorders')
+def async_my_orders(setup, count):
+    return [Call('GET', url('async-myorders'), token=setup.token(setup.customer)) for _ in range(count)]
+
+
+@scenario('user-order')
+def user_order(setup, count):
+    token = setup.token(setup.customer)
+    return [Call('GET', url('user-order', pk=setup.rng.choice(setup.order_ids)), token=token)
+            for _ in range(count)]
+
+
+@scenario('orders-export')
+def orders_export(setup, count):
+    token = setup.token(setup.admin)
+    return [Call('GET', f'{url("orders-export")}?output={"csv" if i % 2 else "ndjson"}', token=token)
+            for i in range(count)]
+
+
+@scenario('login', 'POST')
+def login(setup, count):
+    from base.seeding import PASSWORD
+
+    body = {'username': setup.customer.username, 'password': PASSWORD}
+    return [Call('POST', url('login'), body) for _ in range(count)]
+
+
+@scenario('register', 'POST')
+def register(setup, count):
+    return [Call('POST', url('register'),
+                 {'name': 'Load', 'email': f'register{i}@example.com', 'password': 'register-pass'})
+            for i in range(count)]
+
+
+@scenario('user_profile_update', 'PUT')
+def user_profile_update(setup, count):
+    customer = setup.customer
+    body = {'name': customer.first_name, 'email': customer.email, 'password': ''}
+    return [Call('PUT', url('user_profile_update'), body, setup.token(customer)) for _ in range(count)]
+
+
+@scenario('updateUser', 'PUT')
+def update_user(setup, count):
+    token = setup.token(setup.admin)
+    return [Call('PUT', url('updateUser', pk=user.id),
+                 {'name': 'Updated', 'email': f'updated{i}@example.com', 'isAdmin': False}, token)
+            for i, user in enumerate(setup.new_users(count, 'update'))]
+
+
+@scenario('create-review', 'POST')
+def create_review(setup, count):
+    return [Call('POST', url('create-review', pk=setup.rng.choice(setup.product_ids)),
+                 {'rating': setup.rng.randint(1, 5), 'comment': 'Load test'}, setup.token(user))
+            for user in setup.new_users(count, 'reviewer')]
+
+
+@scenario('orders-add', 'POST')
+def add_order(setup, count):
+    from base.models import Product
+
+    token = setup.token(setup.customer)
+    # Products that cannot run out during the run
+    stocked = list(Product.objects.filter(countInStock__gte=count).values_list('_id', flat=True))
+    calls = []
+    for _ in range(count):
+        lines = setup.rng.sample(stocked, min(3, len(stocked)))
+        calls.append(Call('POST', url('orders-add'), {
+            'orderItems': [{'product': pk, 'qty': 1, 'price': 1} for pk in lines],
+            'shippingAddress': {'address': 'Kurmangazy 15', 'city': 'Almaty', 'postalCode': '050081',
+                                'country': 'Kazakhstan'},
+            'paymentMethod': 'PayPal', 'taxPrice': 0, 'shippingPrice': 0, 'totalPrice': len(lines),
+        }, token))
+    return calls
+
+
+@scenario('pay', 'PUT')
+def pay(setup, count):
+    token = setup.token(setup.customer)
+    return [Call('PUT', url('pay', pk=setup.rng.choice(setup.order_ids)), token=token) for _ in range(count)]
+
+
+@scenario('delivered', 'PUT')
+def delivered(setup, count):
+    token = setup.token(setup.admin)
+    return [Call('PUT', url('delivered', pk=setup.rng.choice(setup.order_ids)), token=token)
+            for _ in range(count)]
+
+
+@scenario('create_product', 'POST')
+def create_product(setup, count):
+    return [Call('POST', url('create_product'), token=setup.token(setup.admin)) for _ in range(count)]
+
+
+@scenario('update_product', 'PUT')
+def update_product(setup, count):
+    token = setup.token(setup.admin)
+    return [Call('PUT', url('update_product', pk=product._id), {
+        'name': f'Updated {i}', 'price': 10, 'brand': 'Load', 'countInStock': 5,
+        'category': 'Load', 'description': 'Updated by the load benchmark',
+    }, token) for i, product in enumerate(setup.new_products(count))]
+
+
+@scenario('upload_image', 'POST')
+def upload_image(setup, count):
+    from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from PIL import Image
+
+    image = BytesIO()
+    Image.new('RGB', (800, 600), (200, 80, 40)).save(image, 'JPEG')
+    token = setup.token(setup.admin)
+    return [Call('POST', url('upload_image'), encode_multipart(BOUNDARY, {
+        'product_id': product._id,
+        'image': SimpleUploadedFile('load.jpg', image.getvalue(), content_type='image/jpeg'),
+    }), token, MULTIPART_CONTENT) for product in setup.new_products(count)]
+
+
+@scenario('delete_product', 'DELETE')
+def delete_product(setup, count):
+    token = setup.token(setup.admin)
+    return [Call('DELETE', url('delete_product', pk=product._id), token=token)
+            for product in setup.new_products(count)]
+
+
+@scenario('deleteUser', 'DELETE')
+def delete_user(setup, count):
+    token = setup.token(setup.admin)
+    return [Call('DELETE', url('deleteUser', pk=user.id), token=token)
+            for user in setup.new_users(count, 'deleted')]
+
+
+def run(app, calls, concurrency):
+    def send(call):
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {call.token}'} if call.token else {}
+        return wsgi_request(app, call.method, call.path, call.body, call.content_type, headers)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(send, calls))
+    statuses = [r[1] for r in results]
+    stats = summarize([r[0] for r in results], time.perf_counter() - start, statuses)
+    stats['statuses'] = {str(status): statuses.count(status) for status in sorted(set(statuses))}
+    return stats
+
+
+def unbenchmarked_routes():
+    from base.urls import async_urls, order_urls, product_urls, user_urls
+
+    covered = {name for name, _ in SCENARIOS.values()}
+    return sorted(
+        pattern.name
+        for urls in (product_urls, user_urls, order_urls, async_urls)
+        for pattern in urls.urlpatterns
+        if pattern.name not in covered
+    )
+
+
+def compare(results, baseline):
+    """Relative change of each route's numbers against `baseline`, in %."""
+    changes = {}
+    for key, current in results['routes'].items():
+        before = baseline.get('routes', {}).get(key)
+        if not before:
+            continue
+        changes[key] = {
+            field: round((current[field] - before[field]) / before[field] * 100, 1) if before[field] else None
+            for field in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request')
+        }
+    return changes
+
+
+def environment():
+    import django
+    from django.db import connection
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit, 'python': platform.python_version(), 'django': django.get_version(),
+        'database': connection.vendor, 'cpus': os.cpu_count(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--reviews', type=int, default=5, help='Average reviews per product')
+    parser.add_argument('--orders', type=int, default=5000)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--items', type=int, default=4, help='Most lines per order')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--requests', type=int, default=100, help='Requests per route')
+    parser.add_argument('--concurrency', type=int, default=8, help='Client threads')
+    parser.add_argument('--routes', help='Comma-separated subset, e.g. "GET products,POST orders-add"')
+    parser.add_argument('--baseline', help='Earlier report to compare against')
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    args = parser.parse_args()
+
+    # Silk records every request in the database, which is not what is measured here
+    os.environ.setdefault('SILK_SAMPLE_PERCENT', '0')
+    setup_django()
+    from django.conf import settings
+    from django.core.cache import caches
+    from django.core.wsgi import get_wsgi_application
+    from django.test.utils import override_settings
+    from rest_framework.settings import api_settings
+    from base import metrics, workers
+    from base.budgets import QUERY_BUDGETS
+
+    settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']
+    # Budgets are reported next to the query counts instead of logged per request
+    settings.QUERY_BUDGET_ACTION = 'off'
+    # Metrics are read from this process, not added to the server's
+    settings.METRICS_DIR = ''
+    for scope in api_settings.DEFAULT_THROTTLE_RATES:
+        api_settings.DEFAULT_THROTTLE_RATES[scope] = None
+
+    selected = [key.strip() for key in args.routes.split(',')] if args.routes else list(SCENARIOS)
+    unknown = set(selected) - set(SCENARIOS)
+    if unknown:
+        parser.error(f'unknown routes: {", ".join(sorted(unknown))}')
+
+    results = {
+        'scale': {name: getattr(args, name) for name in ('products', 'reviews', 'orders', 'users', 'items', 'seed')},
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'routes': {},
+        'unbenchmarked': unbenchmarked_routes(),
+    }
+
+    media = tempfile.TemporaryDirectory(prefix='load-media-')
+    storages = override_settings(STORAGES={**settings.STORAGES, 'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage', 'OPTIONS': {'location': media.name},
+    }})
+    with media, storages, test_database():
+        results['environment'] = environment()
+        start = time.perf_counter()
+        admin, customer, user_ids, product_ids, order_ids = seed(
+            args.products, args.reviews, args.orders, args.users, args.items, args.seed,
+        )
+        results['seed_seconds'] = round(time.perf_counter() - start, 2)
+
+        app = get_wsgi_application()
+        for key in selected:
+            name, build = SCENARIOS[key]
+            # One generator per route, so a subset sees the same requests
+            setup = Setup(admin, customer, user_ids, product_ids, order_ids, random.Random(f'{args.seed}:{key}'))
+            calls = build(setup, args.requests)
+
+            for alias in caches:
+                caches[alias].clear()
+            for metric in metrics.REGISTRY:
+                metric.clear()
+
+            stats = run(app, calls, args.concurrency)
+            observed, queries = metrics.DB_QUERIES.totals(view=name)
+            budget = QUERY_BUDGETS.get(name)
+            stats['queries_per_request'] = round(queries / observed, 2) if observed else None
+            stats['query_budget'] = budget
+            results['routes'][key] = stats
+
+        # Let image jobs finish before the database goes away
+        workers.shutdown()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            results['compare'] = compare(results, json.load(f))
+
+    report(results, args.output)
+
+
+if __name__ == '__main__':
+    main()
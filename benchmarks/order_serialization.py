@@ -0,0 +1,69 @@
+"""Compare OrderSerializer with the values()-based serialize_orders path.
+
+    python -m benchmarks.order_serialization --orders 20000 --items 3
+"""
+import argparse
+
+from benchmarks.utils import measure, report, setup_django, test_database
+
+
+def seed(orders, items):
+    from django.contrib.auth.models import User
+    from base.models import Order, OrderItem, Product, ShippingAddress
+
+    users = User.objects.bulk_create(
+        User(username=f'user{i}@example.com', email=f'user{i}@example.com') for i in range(100)
+    )
+    products = Product.objects.bulk_create(
+        Product(name=f'Product {i}', price=100, countInStock=10) for i in range(50)
+    )
+    created = Order.objects.bulk_create(
+        (Order(user=users[i % len(users)], paymentMethod='PayPal', taxPrice=10, shippingPrice=0,
+               totalPrice=110) for i in range(orders)),
+        batch_size=2000,
+    )
+    ShippingAddress.objects.bulk_create(
+        (ShippingAddress(order=o, address='Kurmangazy 15', city='Almaty', postalCode='050081',
+                         country='Kazakhstan') for o in created),
+        batch_size=2000,
+    )
+    OrderItem.objects.bulk_create(
+        (OrderItem(order=o, product=products[(o._id + j) % len(products)], name='Product', qty=1,
+                   price=100, image='/images/sample.jpg') for o in created for j in range(items)),
+        batch_size=2000,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--orders', type=int, default=5000)
+    parser.add_argument('--items', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    args = parser.parse_args()
+
+    setup_django()
+    from base.models import Order
+    from base.serializers import OrderSerializer, serialize_orders
+
+    with test_database():
+        seed(args.orders, args.items)
+
+        def serializer():
+            orders = Order.objects.select_related('user', 'shippingaddress')\
+                .prefetch_related('orderitem_set__product')
+            return OrderSerializer(orders, many=True).data
+
+        def fast():
+            return serialize_orders(Order.objects.all())
+
+        report({
+            'orders': args.orders,
+            'items_per_order': args.items,
+            'serializer': measure(serializer, args.repeat),
+            'values': measure(fast, args.repeat),
+        }, args.output)
+
+
+if __name__ == '__main__':
+    main()
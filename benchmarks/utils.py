@@ -0,0 +1,88 @@
+import io
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+def setup_django():
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+    import django
+    django.setup()
+
+
+@contextmanager
+def test_database(keepdb=False):
+    """Run the benchmark against a throwaway copy of the configured database."""
+    from django.db import connection
+
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False, keepdb=keepdb)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+
+
+def measure(func, repeat=3):
+    """Best wall time over `repeat` runs plus peak traced memory of one run."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {'seconds': round(min(times), 4), 'peak_mb': round(peak / 2 ** 20, 2)}
+
+
+def summarize(latencies, elapsed, statuses):
+    """Throughput, error count and latency percentiles of one run."""
+    latencies = sorted(latencies)
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return {
+        'requests': len(latencies),
+        'errors': sum(1 for status in statuses if status >= 400),
+        'seconds': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(quantiles[49] * 1000, 2),
+        'p95_ms': round(quantiles[94] * 1000, 2),
+        'p99_ms': round(quantiles[98] * 1000, 2),
+    }
+
+
+def wsgi_request(app, method, url, body=b'', content_type='', headers=None):
+    """Send one request through the WSGI `app` in-process and return
+    (seconds, status), reading the whole body, streamed or not."""
+    path, _, query = url.partition('?')
+    environ = {
+        'REQUEST_METHOD': method, 'PATH_INFO': path, 'QUERY_STRING': query,
+        'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'wsgi.input': io.BytesIO(body), 'wsgi.url_scheme': 'http',
+        'CONTENT_LENGTH': str(len(body)), 'CONTENT_TYPE': content_type, **(headers or {}),
+    }
+    statuses = []
+    start = time.perf_counter()
+    response = app(environ, lambda status, response_headers: statuses.append(int(status.split()[0])))
+    try:
+        b''.join(response)
+    finally:
+        response.close()
+    return time.perf_counter() - start, statuses[0]
+
+
+def report(results, output=None):
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text + '\n')
+    print(text)